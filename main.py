@@ -1,3 +1,4 @@
+import logging
 import os
 
 from dotenv import load_dotenv
@@ -9,6 +10,8 @@ def main() -> None:
     """Starts up the Discord bot and sets initial bot values."""
 
     load_dotenv()
+    # configure logging for warnings and errors from every part of the bot
+    logging.basicConfig(format="%(levelname)s:%(message)s", level=logging.WARN)
     discord_token = str(os.getenv("DISCORD_TOKEN"))
 
     bot = NeilBot()
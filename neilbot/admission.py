@@ -0,0 +1,271 @@
+import asyncio
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+import discord
+
+from neilbot.metrics import Metrics
+
+
+class Overloaded(Exception):
+    """The bot is too busy to run a command right now."""
+
+
+class CommandClass:
+    """A kind of expensive command that shares a concurrency budget.
+
+    Attributes:
+        name (str): the name of the class, used to label its metrics
+        budget (int): how many commands of the class can run at the same time
+        maxQueue (int): how many commands can wait for a turn at the same time
+        maxWait (float): how many seconds a command waits for a turn before giving up
+        slo (float): how many seconds 95% of commands should take to finish,
+        including waiting for a turn
+        running (int): how many commands of the class are running
+    """
+
+    # how many seconds of finished commands are used to check the SLO
+    _WINDOW = 60.0
+
+    def __init__(
+        self, name: str, budget: int, max_queue: int, max_wait: float, slo: float
+    ):
+        """Inits the command class with nothing running.
+
+        Args:
+            name (str): the name of the class, used to label its metrics
+            budget (int): how many commands of the class can run at the same time
+            max_queue (int): how many commands can wait for a turn at the same time
+            max_wait (float): how many seconds a command waits for a turn before
+            giving up
+            slo (float): how many seconds 95% of commands should take to finish,
+            including waiting for a turn
+        """
+        self.name = name
+        self.budget = budget
+        self.maxQueue = max_queue
+        self.maxWait = max_wait
+        self.slo = slo
+        self.running = 0
+        # the commands waiting for a turn, first in line first
+        self.waiters: deque[asyncio.Future[None]] = deque()
+        # the monotonic time each recent command finished and how long it took
+        self._finished: deque[tuple[float, float]] = deque(maxlen=500)
+
+    def recordFinished(self, seconds: float) -> None:
+        """Record how long a command took, including waiting for a turn.
+
+        Args:
+            seconds (float): how many seconds the command took
+        """
+        self._finished.append((time.monotonic(), seconds))
+
+    def breached(self) -> bool:
+        """Check whether recent commands have been slower than the SLO.
+
+        Returns:
+            bool: whether or not the 95th percentile of the commands that finished
+            within the window took longer than the SLO
+        """
+        cutoff = time.monotonic() - self._WINDOW
+        while self._finished and self._finished[0][0] < cutoff:
+            self._finished.popleft()
+        if not self._finished:
+            return False
+        durations = sorted(seconds for _, seconds in self._finished)
+        return durations[int(len(durations) * 0.95)] > self.slo
+
+
+class AdmissionController:
+    """Limits how many expensive commands run at once across the whole bot.
+
+    Each class of expensive command has a budget of commands that can run at the
+    same time. Commands over the budget wait in line for a bounded time, and the
+    user is told their place in line. Once a class is slower than its latency SLO,
+    it sheds load by turning away commands that would have to wait, instead of
+    letting the line grow until interactions time out. Commands that can start
+    straight away are always admitted.
+
+    Budgets are per process, so when the bot runs as several clusters each cluster
+    has its own.
+    """
+
+    # maps a command class to its budget, the most commands that can wait, the most
+    # seconds they wait and the SLO in seconds
+    _CLASSES = {
+        # yt-dlp searches, which share a small pool of worker threads
+        "extraction": (4, 20, 30.0, 15.0),
+        # listing archived threads, a page of 50 threads per REST call
+        "thread_crawl": (4, 20, 20.0, 10.0),
+        # moving roles, which Discord rate limits per server
+        "role_edit": (4, 20, 30.0, 15.0),
+        # downloading photos from webcams
+        "photo": (4, 10, 15.0, 10.0),
+    }
+
+    def __init__(self, metrics: Metrics):
+        """Inits the admission controller with nothing running.
+
+        Args:
+            metrics (Metrics): the metrics to record waits and rejections in
+        """
+        self._metrics = metrics
+        self.classes = {
+            name: CommandClass(name, *limits) for name, limits in self._CLASSES.items()
+        }
+
+    def _reject(self, commandClass: CommandClass, reason: str) -> Overloaded:
+        """Count a command that was turned away.
+
+        Args:
+            commandClass (CommandClass): the class of the command
+            reason (str): why the command was turned away
+
+        Returns:
+            Overloaded: the error to raise
+        """
+        self._metrics.increment(
+            "neilbot_admission_rejected_total",
+            command_class=commandClass.name,
+            reason=reason,
+        )
+        return Overloaded(
+            "The bot is very busy right now, please try again in a minute"
+        )
+
+    @staticmethod
+    def _release(commandClass: CommandClass) -> None:
+        """Give a finished command's turn to the next command in line.
+
+        Args:
+            commandClass (CommandClass): the class of the finished command
+        """
+        if commandClass.waiters:
+            # the turn is handed over without ever being free, so no new command
+            # can take it first
+            commandClass.waiters.popleft().set_result(None)
+        else:
+            commandClass.running -= 1
+
+    @classmethod
+    def _leave(cls, commandClass: CommandClass, waiter: asyncio.Future[None]) -> None:
+        """Take a command that gave up out of the line.
+
+        Args:
+            commandClass (CommandClass): the class of the command
+            waiter (asyncio.Future[None]): the future the command was waiting on
+        """
+        if waiter.done():
+            # the turn was handed over just as the command gave up, so it goes to
+            # the next command in line
+            cls._release(commandClass)
+        else:
+            waiter.cancel()
+            commandClass.waiters.remove(waiter)
+
+    @staticmethod
+    async def _notify(ctx: discord.ApplicationContext, content: str | None) -> bool:
+        """Show or remove a notice in place of the deferred response.
+
+        Args:
+            ctx (discord.ApplicationContext): the deferred context of the command
+            content (str | None): the notice, or None to remove it
+
+        Returns:
+            bool: whether or not the response was changed
+        """
+        try:
+            if content is None:
+                await ctx.interaction.delete_original_response()
+            else:
+                await ctx.interaction.edit_original_response(content=content)
+            return True
+        except discord.HTTPException:
+            # the command still runs without the notice
+            return False
+
+    async def _wait(
+        self, ctx: discord.ApplicationContext, commandClass: CommandClass
+    ) -> bool:
+        """Wait in line for a turn, telling the user their place in line.
+
+        Args:
+            ctx (discord.ApplicationContext): the deferred context of the command
+            commandClass (CommandClass): the class of the command
+
+        Raises:
+            Overloaded: the line is full, the class is slower than its SLO, or the
+            command waited too long
+
+        Returns:
+            bool: whether or not the user was shown their place in line
+        """
+        if len(commandClass.waiters) >= commandClass.maxQueue:
+            raise self._reject(commandClass, "queue_full")
+        if commandClass.breached():
+            raise self._reject(commandClass, "slo_breached")
+
+        waiter = asyncio.get_running_loop().create_future()
+        commandClass.waiters.append(waiter)
+        notified = False
+        try:
+            notified = await self._notify(
+                ctx,
+                f"You're #{len(commandClass.waiters)} in line, your command will "
+                "run soon",
+            )
+            # unlike wait_for, wait never cancels the waiter, so the line only
+            # changes here and when a turn is handed over
+            await asyncio.wait([waiter], timeout=commandClass.maxWait)
+        except asyncio.CancelledError:
+            self._leave(commandClass, waiter)
+            raise
+        if not waiter.done():
+            self._leave(commandClass, waiter)
+            if notified:
+                await self._notify(ctx, None)
+            raise self._reject(commandClass, "timeout")
+        return notified
+
+    @asynccontextmanager
+    async def admit(
+        self, ctx: discord.ApplicationContext, command_class: str
+    ) -> AsyncIterator[None]:
+        """Run part of a command once its class has a turn free.
+
+        The command must have deferred already, since it may wait in line.
+
+        Args:
+            ctx (discord.ApplicationContext): the deferred context of the command
+            command_class (str): the class of the command, such as "extraction"
+
+        Raises:
+            Overloaded: the command was turned away because the bot is too busy
+
+        Yields:
+            None: the command runs inside the async with statement
+        """
+        commandClass = self.classes[command_class]
+        start = time.monotonic()
+        notified = False
+        # a free turn only goes to a new command if nobody is already waiting for it
+        if commandClass.running < commandClass.budget and not commandClass.waiters:
+            commandClass.running += 1
+        else:
+            notified = await self._wait(ctx, commandClass)
+        try:
+            self._metrics.observe(
+                "neilbot_admission_wait_seconds",
+                time.monotonic() - start,
+                command_class=command_class,
+            )
+            if notified:
+                # the notice is replaced instead of deleted, since commands may
+                # still edit their original response
+                await self._notify(ctx, "It's your turn, running your command now")
+            yield
+        finally:
+            self._release(commandClass)
+            commandClass.recordFinished(time.monotonic() - start)
@@ -0,0 +1,341 @@
+import argparse
+import asyncio
+import fnmatch
+import functools
+import gc
+import inspect
+import json
+import random
+import sys
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, cast
+
+import discord
+
+from neilbot.cogs._track import Track
+from neilbot.cogs._youtubeDownloader import YouTubeDownloader
+from neilbot.cogs.anyone import Anyone
+from neilbot.cogs.leetcode import Leetcode
+from neilbot.cogs.player import Player
+from neilbot.fakeDiscord import FakeBot, FakeContext, FakeGuild, FakeRest
+from neilbot.neilbot import NeilBot
+
+# a benchmark is called over and over, and may be a coroutine function
+_Benchmark = Callable[[], Awaitable[Any] | Any]
+
+# the baselines are kept next to the bot so they are versioned with it. They are
+# stored relative to the calibration loop, so they hold on any machine
+_BASELINES = Path(__file__).parent.parent / "benchmarks.json"
+
+_WORDS = (
+    "two sum add numbers longest substring median sorted arrays palindromic zigzag "
+    "reverse integer string regular expression container water roman valid "
+    "parentheses merge lists generate swap nodes pairs remove duplicates element"
+).split()
+
+# the words the calibration loop works through
+_CALIBRATION_WORDS = _WORDS * 40
+
+
+def _calibrate() -> int:
+    """Do a fixed amount of string, list and dict work, like the bot's hot functions.
+
+    Benchmarks are stored relative to how long this takes, so that baselines
+    recorded on one machine still mean something on another.
+
+    Returns:
+        int: a result, so the work is not skipped
+    """
+    lengths: dict[str, int] = {}
+    for word in _CALIBRATION_WORDS:
+        key = word.lower().replace("e", "")
+        lengths[key] = lengths.get(key, 0) + len(key)
+    return sum(sorted(lengths.values()))
+
+
+def _threads(count: int) -> list[discord.Thread]:
+    """Make Leetcode threads with realistic names, some without problem numbers.
+
+    Only the fields the thread matcher reads are set.
+
+    Args:
+        count (int): how many threads to make
+
+    Returns:
+        list[discord.Thread]: the threads
+    """
+    threads = []
+    for n in range(1, count + 1):
+        title = " ".join(random.choices(_WORDS, k=random.randint(2, 5))).title()
+        name = title if n % 10 == 0 else f"{n}. {title}"
+        threads.append(SimpleNamespace(name=name, message_count=random.randrange(100)))
+    return cast(list[discord.Thread], threads)
+
+
+class BenchmarkSuite:
+    """Times the bot's hot functions against synthetic data.
+
+    Each benchmark is run until it has taken long enough to time reliably, several
+    times over, and the fastest time per call is kept, since slower runs only add
+    noise from the rest of the machine. Each time is divided by the time of a
+    calibration loop measured the same way, so results from different machines
+    can be compared. Results are compared against baselines stored in
+    benchmarks.json, and a benchmark regresses if it got slower by more than a
+    threshold.
+    """
+
+    # how many times each benchmark is timed
+    _REPEATS = 7
+    # how many seconds each timing should take at least
+    _MIN_TIME = 0.2
+
+    def __init__(self) -> None:
+        """Inits the suite, creating the cogs and synthetic data for every benchmark.
+
+        The cogs are created against a fake bot and an instant fake REST API, so
+        nothing is started or written to disk. Must be called on the event loop the
+        benchmarks run on.
+        """
+        random.seed(0)
+        rest = FakeRest(latency=0, rate_limits=False)
+        self._bot = FakeBot(rest)
+        bot = cast(NeilBot, self._bot)
+        leetcode = Leetcode(bot)
+        player = Player(bot)
+        anyone = Anyone(bot)
+
+        self.benchmarks: dict[str, _Benchmark] = {}
+
+        # thread matching, by problem number and by name
+        find = getattr(leetcode, "_findMostSimilarThread")
+        for size in (1_000, 10_000, 100_000):
+            threads = _threads(size)
+            label = f"{size // 1000}k"
+            self.benchmarks[f"leetcode.find_by_number[{label}]"] = functools.partial(
+                find, size // 2, "", threads
+            )
+            name = threads[size // 2 + 9].name.lower()
+            self.benchmarks[f"leetcode.find_by_name[{label}]"] = functools.partial(
+                find, None, name, threads
+            )
+
+        convert = getattr(leetcode, "_convertThreadName")
+        names = [th.name for th in _threads(1_000)]
+        self.benchmarks["leetcode.convert_thread_name[1k]"] = lambda: [
+            convert(name) for name in names
+        ]
+
+        # rendering a huge queue
+        queueServer = SimpleNamespace(id=1)
+        getattr(player, "_songQueue")[queueServer.id] = deque(
+            Track(f"Song {i} " * 4, f"https://youtu.be/{i}", "YouTube", 200)
+            for i in range(10_000)
+        )
+        showQueue = getattr(player, "_show_queue_helper")
+        queueVersions = getattr(player, "_queueVersions")
+
+        def showChangedQueue() -> Awaitable[Any]:
+            # a new version makes the queue be copied and its first page rendered
+            queueVersions[queueServer.id] += 1
+            return showQueue(SimpleNamespace(guild=queueServer))
+
+        self.benchmarks["player.show_queue[10k]"] = showChangedQueue
+        self.benchmarks["player.show_queue_cached[10k]"] = lambda: showQueue(
+            SimpleNamespace(guild=queueServer)
+        )
+
+        # finding the bot in a server with lots of busy voice channels
+        channels = [
+            SimpleNamespace(members=[object() for _ in range(20)]) for _ in range(500)
+        ]
+        channels[-1].members.append(self._bot.user)
+        getVoiceChannel = getattr(player, "_getVoiceChannel")
+        self.benchmarks["player.get_voice_channel[500x20]"] = lambda: getVoiceChannel(
+            channels
+        )
+
+        # reassigning the anyone role in a large server, against an instant REST API
+        server = FakeGuild(self._bot, rest, 10_000, [])
+        role = server.roles[0]
+        server.members[0].roles.append(role)
+        command = getattr(anyone, "set_anyone_rand")
+        anyoneHelper = getattr(anyone, "_anyone_helper")
+        self.benchmarks["anyone.reassign[10k]"] = lambda: anyoneHelper(
+            FakeContext(server, server.members[0], command), role
+        )
+
+        # telling the forms of YouTube URLs apart from other URLs and search queries
+        inputs = [
+            form.format(f"{i:011d}")
+            for i in range(10)
+            for form in (
+                "https://www.youtube.com/watch?v={}",
+                "https://www.youtube.com/watch?v={}&list=PLbenchmark&t=42s",
+                "https://m.youtube.com/watch?v={}",
+                "https://music.youtube.com/watch?v={}&feature=share",
+                "https://www.youtube.com/shorts/{}",
+                "https://youtu.be/{}?si=abc",
+                "https://www.youtube-nocookie.com/embed/{}",
+                "https://example.com/watch?v={}",
+                "never gonna give you up {}",
+                "{}",
+            )
+        ]
+        self.benchmarks["youtube.is_youtube_url[100]"] = lambda: [
+            YouTubeDownloader._isYouTubeURL(s) for s in inputs
+        ]
+
+        # turning full extractions and flat search results into songs
+        youtube = cast(YouTubeDownloader, getattr(player, "_downloaders")["YouTube"])
+        toTrack = getattr(youtube, "_toTrack")
+        infos: list[dict[str, Any]] = []
+        for i in range(50):
+            videoID = f"{i:011d}"
+            url = f"https://www.youtube.com/watch?v={videoID}"
+            infos.append(
+                {
+                    "id": videoID,
+                    "title": f"Song {i}",
+                    "webpage_url": url,
+                    "duration": 200,
+                    "extractor_key": "Youtube",
+                    "formats": [{"format_id": str(f), "url": url} for f in range(20)],
+                }
+            )
+            infos.append(
+                {"_type": "url", "ie_key": "Youtube", "id": videoID, "url": url}
+            )
+        self.benchmarks["youtube.to_track[100]"] = lambda: [
+            toTrack(info) for info in infos
+        ]
+
+    @staticmethod
+    async def _time(benchmark: _Benchmark, loops: int) -> float:
+        """Time a number of calls to a benchmark.
+
+        Args:
+            benchmark (_Benchmark): the benchmark to call
+            loops (int): how many times to call it
+
+        Returns:
+            float: how many seconds the calls took
+        """
+        # garbage collection runs at random times, so keep it out of the timing
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            for _ in range(loops):
+                result = benchmark()
+                if inspect.isawaitable(result):
+                    await result
+            return time.perf_counter() - start
+        finally:
+            gc.enable()
+
+    async def measure(self, benchmark: _Benchmark) -> float:
+        """Find how long one call to a benchmark takes.
+
+        Args:
+            benchmark (_Benchmark): the benchmark to measure
+
+        Returns:
+            float: the fastest seconds per call
+        """
+        # double the calls per timing until a timing takes long enough
+        loops = 1
+        while (elapsed := await self._time(benchmark, loops)) < self._MIN_TIME:
+            loops *= 2
+        best = elapsed / loops
+        for _ in range(self._REPEATS - 1):
+            best = min(best, await self._time(benchmark, loops) / loops)
+        return best
+
+
+def _formatSeconds(seconds: float) -> str:
+    """Format a duration with a sensible unit.
+
+    Args:
+        seconds (float): the duration
+
+    Returns:
+        str: the duration in microseconds or milliseconds
+    """
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f}us"
+    return f"{seconds * 1e3:.2f}ms"
+
+
+async def _benchmark(args: argparse.Namespace) -> bool:
+    """Run the benchmarks, compare them against the baselines and print the results.
+
+    Args:
+        args (argparse.Namespace): the parsed command line arguments
+
+    Returns:
+        bool: whether or not every benchmark was within the threshold
+    """
+    baselinePath: Path = args.baselines
+    baselines: dict[str, float] = (
+        json.loads(baselinePath.read_text()) if baselinePath.exists() else {}
+    )
+    suite = BenchmarkSuite()
+    calibration = await suite.measure(_calibrate)
+    print(f"Calibration loop: {_formatSeconds(calibration)}")
+
+    passed = True
+    print(f"{'benchmark':<36}{'time':>12}{'relative':>12}{'baseline':>12}{'change':>9}")
+    for name, benchmark in suite.benchmarks.items():
+        if not fnmatch.fnmatch(name, args.filter):
+            continue
+        seconds = await suite.measure(benchmark)
+        # how many calibration loops the benchmark takes on this machine
+        relative = seconds / calibration
+        line = f"{name:<36}{_formatSeconds(seconds):>12}{relative:>11.3f}x"
+        baseline = baselines.get(name)
+        if baseline:
+            change = relative / baseline - 1
+            line += f"{baseline:>11.3f}x{change:>+9.1%}"
+            if change > args.threshold:
+                line += "  REGRESSED"
+                passed = False
+        print(line, flush=True)
+        if args.save:
+            baselines[name] = relative
+
+    if args.save:
+        baselinePath.write_text(json.dumps(baselines, indent=4, sort_keys=True) + "\n")
+        print(f"Saved baselines to {baselinePath}")
+    elif not passed:
+        print(f"Some benchmarks are more than {args.threshold:.0%} slower than before")
+    return passed
+
+
+def main() -> None:
+    """Runs the benchmarks, exiting with an error if any of them regressed."""
+    parser = argparse.ArgumentParser(
+        description="Time the bot's hot functions against the stored baselines."
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="how much slower than its baseline a benchmark can be, as a fraction",
+    )
+    parser.add_argument(
+        "--filter", default="*", help="only run benchmarks matching this pattern"
+    )
+    parser.add_argument(
+        "--save", action="store_true", help="store the results as the new baselines"
+    )
+    parser.add_argument(
+        "--baselines", type=Path, default=_BASELINES, help="the baselines file"
+    )
+    args = parser.parse_args()
+
+    if not asyncio.run(_benchmark(args)):
+        sys.exit(1)
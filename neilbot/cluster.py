@@ -0,0 +1,377 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import re
+import signal
+import sys
+import time
+from multiprocessing.process import BaseProcess
+
+import aiohttp
+from aiohttp import web
+from dotenv import load_dotenv
+
+# matches the metric name and any labels at the start of a Prometheus sample
+_SAMPLE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{.*?\})?(.*)$")
+
+
+def mergeMetrics(clusterMetrics: dict[int, str]) -> str:
+    """Merge the metrics of every cluster, labelling each sample with its cluster.
+
+    Prometheus needs every sample of a metric to be grouped under one HELP and TYPE,
+    so the samples of each metric are collected from every cluster before any are
+    written.
+
+    Args:
+        clusterMetrics (dict[int, str]): maps a cluster ID to its metrics in the
+        Prometheus text format
+
+    Returns:
+        str: the merged metrics in the Prometheus text format
+    """
+    # maps a metric name to its HELP and TYPE lines and then its samples
+    headers: dict[str, list[str]] = {}
+    samples: dict[str, list[str]] = {}
+    for clusterID, text in clusterMetrics.items():
+        family = ""
+        for line in text.splitlines():
+            if line.startswith("#"):
+                parts = line.split(" ", 3)
+                if len(parts) >= 3 and parts[1] in ("HELP", "TYPE"):
+                    family = parts[2]
+                    familyHeaders = headers.setdefault(family, [])
+                    if len(familyHeaders) < 2:
+                        familyHeaders.append(line)
+                continue
+            match = _SAMPLE.match(line)
+            if match:
+                name, labels, rest = match.groups()
+                inner = labels[1:-1] + "," if labels and labels != "{}" else ""
+                samples.setdefault(family or name, []).append(
+                    f'{name}{{{inner}cluster="{clusterID}"}}{rest}'
+                )
+
+    lines = []
+    for family in dict.fromkeys([*headers, *samples]):
+        lines += headers.get(family, [])
+        lines += samples.get(family, [])
+    return "\n".join(lines) + "\n"
+
+
+def _runCluster(clusterEnv: dict[str, str]) -> None:
+    """Run one cluster of shards. This is the entry point of each cluster process.
+
+    Args:
+        clusterEnv (dict[str, str]): the environment variables that pick the
+        cluster's shards and ports
+    """
+    os.environ.update(clusterEnv)
+    load_dotenv()
+    logging.basicConfig(format="%(levelname)s:%(message)s", level=logging.WARN)
+
+    # import the bot here so the launcher itself never loads the cogs
+    from neilbot.neilbot import NeilBot
+
+    bot = NeilBot()
+    bot.run(str(os.getenv("DISCORD_TOKEN")))
+
+
+class Cluster:
+    """A process running some of the bot's shards.
+
+    Attributes:
+        clusterID (int): the position of the cluster, from 0
+        shardIDs (list[int]): the shards the cluster runs
+        metricsPort (int): the local port the cluster serves its metrics on
+        process (BaseProcess | None): the process running the cluster, or None if it
+        has not been started
+        restarts (int): the number of times the process has been restarted
+        startedAt (float): the time the process was last started
+        failures (int): how many times in a row the process exited soon after it
+        was started
+        restartAt (float | None): the time to restart the process at, or None if it
+        is not waiting to be restarted
+    """
+
+    def __init__(self, cluster_id: int, shard_ids: list[int], metrics_port: int):
+        """Inits a cluster that has not been started.
+
+        Args:
+            cluster_id (int): the position of the cluster, from 0
+            shard_ids (list[int]): the shards the cluster runs
+            metrics_port (int): the local port the cluster serves its metrics on
+        """
+        self.clusterID = cluster_id
+        self.shardIDs = shard_ids
+        self.metricsPort = metrics_port
+        self.process: BaseProcess | None = None
+        self.restarts = 0
+        self.startedAt = 0.0
+        self.failures = 0
+        self.restartAt: float | None = None
+
+
+class ClusterLauncher:
+    """Runs the bot's shards across several processes on one machine.
+
+    Each process is a cluster with its own event loop and GIL, so voice encoding,
+    yt-dlp and event handling can use every core. The launcher restarts clusters
+    that exit, waiting longer after each quick failure, and gives up if a cluster
+    keeps failing. It talks to the clusters over the loopback interface. It serves
+    the metrics of every cluster as one set of metrics, and tells owner commands
+    about every cluster, only on the loopback interface.
+
+    Attributes:
+        failed (bool): whether or not the launcher gave up on a cluster
+    """
+
+    # how many seconds apart the clusters are checked to see if they have exited
+    _CHECK_INTERVAL = 5
+    # a cluster that exits within this many seconds of starting failed quickly
+    _QUICK_FAILURE = 60
+    # the longest a cluster waits to be restarted, in seconds
+    _MAX_BACKOFF = 300
+    # how many quick failures in a row make the launcher give up
+    _MAX_QUICK_FAILURES = 5
+
+    def __init__(self, clusters: int, shard_count: int, host: str, port: int):
+        """Inits the launcher, splitting the shards evenly between the clusters.
+
+        Args:
+            clusters (int): how many processes to run
+            shard_count (int): how many shards the bot has in total
+            host (str): the address to serve merged metrics on
+            port (int): the port to serve merged metrics on. Each cluster serves its
+            own metrics on the ports after it, and the cluster status is served on
+            the loopback interface on the port after those
+        """
+        self._shardCount = shard_count
+        self._host = host
+        self._port = port
+        clusters = max(1, min(clusters, shard_count))
+        self._clusters = [
+            Cluster(i, list(range(i, shard_count, clusters)), port + 1 + i)
+            for i in range(clusters)
+        ]
+        self._controlPort = port + 1 + clusters
+        # clusters are started with spawn so they never inherit the launcher's loop
+        self._context = multiprocessing.get_context("spawn")
+        self._stopping = False
+        self.failed = False
+
+    def _start(self, cluster: Cluster) -> None:
+        """Start a process for a cluster.
+
+        Args:
+            cluster (Cluster): the cluster to start
+        """
+        clusterEnv = {
+            "CLUSTER_ID": str(cluster.clusterID),
+            "SHARD_COUNT": str(self._shardCount),
+            "SHARD_IDS": ",".join(map(str, cluster.shardIDs)),
+            "METRICS_HOST": "127.0.0.1",
+            "METRICS_PORT": str(cluster.metricsPort),
+            "CLUSTER_CONTROL_URL": f"http://127.0.0.1:{self._controlPort}",
+            # only the first cluster polls the webcams and captures timelapse
+            # frames, and the others download photos when they are asked for and
+            # read its frames
+            "WEBCAM_POLLING": "1" if cluster.clusterID == 0 else "0",
+            # each cluster renders timelapses from the shared frames by itself
+            "TIMELAPSES_DIR": os.path.join(
+                "timelapses", f"cluster-{cluster.clusterID}"
+            ),
+        }
+        cluster.process = self._context.Process(
+            target=_runCluster,
+            args=(clusterEnv,),
+            name=f"neilbot-cluster-{cluster.clusterID}",
+        )
+        cluster.process.start()
+        cluster.startedAt = time.monotonic()
+        logging.warning(
+            f"Started cluster {cluster.clusterID} with shards {cluster.shardIDs}"
+        )
+
+    async def _handleMetrics(self, request: web.Request) -> web.Response:
+        """Respond to a scrape from Prometheus with the metrics of every cluster.
+
+        Args:
+            request (web.Request): the scrape request
+
+        Returns:
+            web.Response: the merged metrics in the Prometheus text format
+        """
+        session: aiohttp.ClientSession = request.app["session"]
+
+        async def scrape(cluster: Cluster) -> tuple[int, str]:
+            try:
+                async with session.get(
+                    f"http://127.0.0.1:{cluster.metricsPort}/metrics"
+                ) as resp:
+                    return cluster.clusterID, await resp.text()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                # a cluster that is restarting has no metrics to give
+                return cluster.clusterID, ""
+
+        results = await asyncio.gather(*map(scrape, self._clusters))
+        return web.Response(text=mergeMetrics(dict(results)), content_type="text/plain")
+
+    async def _handleClusters(self, request: web.Request) -> web.Response:
+        """Describe every cluster, for owner commands.
+
+        Args:
+            request (web.Request): the status request
+
+        Returns:
+            web.Response: the status of every cluster as JSON
+        """
+        del request
+        now = time.monotonic()
+        return web.json_response(
+            [
+                {
+                    "cluster": cluster.clusterID,
+                    "shards": cluster.shardIDs,
+                    "pid": cluster.process.pid if cluster.process else None,
+                    "alive": bool(cluster.process and cluster.process.is_alive()),
+                    "restarts": cluster.restarts,
+                    "uptime": now - cluster.startedAt,
+                }
+                for cluster in self._clusters
+            ]
+        )
+
+    def _stop(self) -> None:
+        """Ask every cluster to shut down."""
+        self._stopping = True
+        for cluster in self._clusters:
+            if cluster.process and cluster.process.is_alive():
+                # the bot closes its connections cleanly when it is terminated
+                cluster.process.terminate()
+
+    async def run(self) -> None:
+        """Start every cluster and keep them running until the launcher is stopped."""
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, self._stop)
+
+        app = web.Application()
+        app.router.add_get("/metrics", self._handleMetrics)
+        runner = web.AppRunner(app, access_log=None)
+        # the cluster status has process IDs, so it is only served to this machine
+        controlApp = web.Application()
+        controlApp.router.add_get("/clusters", self._handleClusters)
+        controlRunner = web.AppRunner(controlApp, access_log=None)
+        async with aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=5)
+        ) as session:
+            app["session"] = session
+            await runner.setup()
+            await controlRunner.setup()
+            await web.TCPSite(runner, self._host, self._port).start()
+            await web.TCPSite(controlRunner, "127.0.0.1", self._controlPort).start()
+            try:
+                for cluster in self._clusters:
+                    self._start(cluster)
+                await self._supervise()
+            finally:
+                self._stop()
+                for cluster in self._clusters:
+                    if cluster.process:
+                        await asyncio.to_thread(cluster.process.join)
+                await runner.cleanup()
+                await controlRunner.cleanup()
+
+    async def _supervise(self) -> None:
+        """Restart clusters that exit, until the launcher is stopped or gives up.
+
+        A cluster that exits soon after starting is restarted after a delay that
+        doubles with each quick failure in a row, and the launcher stops every
+        cluster once one has failed quickly too many times in a row.
+        """
+        while not self._stopping:
+            await asyncio.sleep(self._CHECK_INTERVAL)
+            now = time.monotonic()
+            for cluster in self._clusters:
+                if self._stopping or not cluster.process:
+                    continue
+                if cluster.restartAt is not None:
+                    if now >= cluster.restartAt:
+                        cluster.restartAt = None
+                        cluster.restarts += 1
+                        self._start(cluster)
+                    continue
+                if cluster.process.is_alive():
+                    continue
+
+                if now - cluster.startedAt < self._QUICK_FAILURE:
+                    cluster.failures += 1
+                else:
+                    cluster.failures = 0
+                if cluster.failures >= self._MAX_QUICK_FAILURES:
+                    logging.critical(
+                        f"Cluster {cluster.clusterID} exited with "
+                        f"{cluster.process.exitcode} {cluster.failures} times in a "
+                        "row soon after starting, giving up"
+                    )
+                    self.failed = True
+                    self._stop()
+                    return
+                delay = min(
+                    self._MAX_BACKOFF,
+                    self._CHECK_INTERVAL * 2**cluster.failures,
+                )
+                logging.error(
+                    f"Cluster {cluster.clusterID} exited with "
+                    f"{cluster.process.exitcode}, restarting it in {delay}s"
+                )
+                cluster.restartAt = now + delay
+
+
+async def _recommendedShardCount(token: str) -> int:
+    """Ask Discord how many shards the bot should use.
+
+    Args:
+        token (str): the Discord bot token
+
+    Returns:
+        int: the recommended number of shards
+    """
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            "https://discord.com/api/v10/gateway/bot",
+            headers={"Authorization": f"Bot {token}"},
+        ) as resp:
+            resp.raise_for_status()
+            return (await resp.json())["shards"]
+
+
+async def _launch() -> bool:
+    """Work out how to split the shards, then run the clusters.
+
+    Returns:
+        bool: whether or not the clusters ran until the launcher was stopped
+    """
+    shardCount = os.getenv("SHARD_COUNT")
+    if shardCount:
+        shards = int(shardCount)
+    else:
+        shards = await _recommendedShardCount(str(os.getenv("DISCORD_TOKEN")))
+    clusters = int(os.getenv("CLUSTERS") or os.cpu_count() or 1)
+    host = os.getenv("METRICS_HOST", "127.0.0.1")
+    port = int(os.getenv("METRICS_PORT") or 9091)
+    launcher = ClusterLauncher(clusters, shards, host, port)
+    await launcher.run()
+    return not launcher.failed
+
+
+def main() -> None:
+    """Starts up the Discord bot as several clusters of shards.
+
+    Exits with an error if a cluster kept failing.
+    """
+    load_dotenv()
+    logging.basicConfig(format="%(levelname)s:%(message)s", level=logging.WARN)
+    if not asyncio.run(_launch()):
+        sys.exit(1)
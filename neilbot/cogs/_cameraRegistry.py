@@ -0,0 +1,205 @@
+import json
+import os
+from pathlib import Path
+from urllib.parse import urlparse
+
+
+class Camera:
+    """A webcam that photos can be taken with, along with its download statistics.
+
+    Attributes:
+        name (str): the unique name used to pick the camera in commands
+        label (str): the human readable name of the camera
+        url (str): the URL of the webcam image
+        refreshInterval (float): how many seconds the webcam takes to refresh its image
+        maxSize (int): the largest image in bytes that will be downloaded
+        timeout (float): how many seconds to wait for the image to download
+        filename (str): the filename to upload the image with
+        captureInterval (float): how many seconds apart timelapse frames are captured
+        timelapseFrames (int): how many timelapse frames are kept, or 0 if timelapses
+        are turned off for the camera
+        maxDimension (int | None): the largest width or height of uploaded photos, or
+        None to upload photos as they are downloaded
+        jpegQuality (int): the JPEG quality from 1 to 100 that photos are recompressed
+        with when they are downscaled
+        downloads (int): the number of times the image was downloaded successfully
+        errors (int): the number of times downloading the image failed
+        totalLatency (float): the total number of seconds spent on successful
+        downloads
+        uploads (int): the number of photos uploaded to Discord
+        uploadBytes (int): the total size in bytes of the uploaded photos
+        uploadLatency (float): the total number of seconds spent uploading photos
+    """
+
+    def __init__(
+        self,
+        name: str,
+        label: str,
+        url: str,
+        refresh_interval: float = 30,
+        max_size: int = 5_000_000,
+        timeout: float = 10,
+        capture_interval: float = 120,
+        timelapse_frames: int = 0,
+        max_dimension: int | None = None,
+        jpeg_quality: int = 80,
+    ):
+        """Inits a camera.
+
+        Args:
+            name (str): the unique name used to pick the camera in commands
+            label (str): the human readable name of the camera
+            url (str): the URL of the webcam image
+            refresh_interval (float, optional): how many seconds the webcam takes to
+            refresh its image. Defaults to 30.
+            max_size (int, optional): the largest image in bytes that will be
+            downloaded. Defaults to 5,000,000.
+            timeout (float, optional): how many seconds to wait for the image to
+            download. Defaults to 10.
+            capture_interval (float, optional): how many seconds apart timelapse
+            frames are captured. Defaults to 120.
+            timelapse_frames (int, optional): how many timelapse frames are kept, or 0
+            to turn off timelapses for the camera. Defaults to 0, so cameras only
+            capture frames when their config asks for them.
+            max_dimension (int | None, optional): the largest width or height of
+            uploaded photos, or None to upload photos as they are downloaded.
+            Defaults to None.
+            jpeg_quality (int, optional): the JPEG quality from 1 to 100 that photos
+            are recompressed with when they are downscaled. Defaults to 80.
+        """
+        self.name = name
+        self.label = label
+        self.url = url
+        self.refreshInterval = refresh_interval
+        self.maxSize = max_size
+        self.timeout = timeout
+        self.captureInterval = capture_interval
+        self.timelapseFrames = timelapse_frames
+        self.maxDimension = max_dimension
+        self.jpegQuality = jpeg_quality
+        # upload the image with the same name it has on the webcam
+        self.filename = os.path.basename(urlparse(url).path) or f"{name}.jpg"
+
+        self.downloads = 0
+        self.errors = 0
+        self.totalLatency = 0.0
+        self.uploads = 0
+        self.uploadBytes = 0
+        self.uploadLatency = 0.0
+
+    def recordDownload(self, latency: float) -> None:
+        """Record a successful download of the webcam image.
+
+        Args:
+            latency (float): how many seconds the download took
+        """
+        self.downloads += 1
+        self.totalLatency += latency
+
+    def recordUpload(self, size: int, latency: float) -> None:
+        """Record a photo being uploaded to Discord.
+
+        Args:
+            size (int): the size of the photo in bytes
+            latency (float): how many seconds the upload took
+        """
+        self.uploads += 1
+        self.uploadBytes += size
+        self.uploadLatency += latency
+
+    def recordError(self) -> None:
+        """Record a failed download of the webcam image."""
+        self.errors += 1
+
+    def averageLatency(self) -> float | None:
+        """Get the average time it takes to download the webcam image.
+
+        Returns:
+            float | None: the average number of seconds a successful download took,
+            or None if the image has not been downloaded yet
+        """
+        return self.totalLatency / self.downloads if self.downloads else None
+
+
+class CameraRegistry:
+    """The webcams that photos can be taken with, loaded from a JSON config file.
+
+    The config file contains a list of cameras, where each camera is an object with
+    the same keys as the arguments to Camera.
+    """
+
+    # the config file that is used if CAMERAS_CONFIG is not set
+    _DEFAULT_CONFIG = Path(__file__).parent.parent / "cameras.json"
+
+    def __init__(self, cameras: list[Camera]):
+        """Inits the camera registry.
+
+        Args:
+            cameras (list[Camera]): the cameras to register
+
+        Raises:
+            ValueError: more than one camera has the same name
+        """
+        self._cameras: dict[str, Camera] = {}
+        for camera in cameras:
+            if camera.name in self._cameras:
+                raise ValueError(f"Duplicate camera name: {camera.name}")
+            self._cameras[camera.name] = camera
+
+    @classmethod
+    def fromConfig(cls, path: str | os.PathLike | None = None) -> "CameraRegistry":
+        """Load the cameras from a JSON config file.
+
+        Args:
+            path (str | os.PathLike | None, optional): the config file to load, or None
+            to use the file set by the CAMERAS_CONFIG environment variable or the
+            default config file. Defaults to None.
+
+        Raises:
+            ValueError: the config file is not a valid list of cameras
+
+        Returns:
+            CameraRegistry: a registry containing the cameras in the config file
+        """
+        path = path or os.getenv("CAMERAS_CONFIG") or cls._DEFAULT_CONFIG
+        with open(path) as f:
+            config = json.load(f)
+        try:
+            return cls([Camera(**camera) for camera in config])
+        except TypeError as e:
+            raise ValueError(f"Invalid camera config in {path}: {e}") from e
+
+    def get(self, name: str) -> Camera | None:
+        """Get a camera by its name.
+
+        Args:
+            name (str): the name of the camera
+
+        Returns:
+            Camera | None: the camera, or None if no camera has that name
+        """
+        return self._cameras.get(name)
+
+    def all(self) -> list[Camera]:
+        """Get every registered camera.
+
+        Returns:
+            list[Camera]: every registered camera
+        """
+        return list(self._cameras.values())
+
+    def search(self, query: str) -> list[Camera]:
+        """Find the cameras whose name or label contains a query.
+
+        Args:
+            query (str): the text to search for
+
+        Returns:
+            list[Camera]: the matching cameras
+        """
+        query = query.lower()
+        return [
+            camera
+            for camera in self._cameras.values()
+            if query in camera.name.lower() or query in camera.label.lower()
+        ]
@@ -1,10 +1,21 @@
 from abc import abstractmethod
 from typing import Protocol, runtime_checkable
 
+from neilbot.cogs._track import Track
+
+
+class DownloadError(Exception):
+    """Raised when a downloader is unable to find or download a song."""
+
 
 @runtime_checkable
 class Downloader(Protocol):
-    """Defines a protocol for downloading music from any source."""
+    """Defines a protocol for downloading music from any source.
+
+    Downloaders only keep a little information about the songs they find, for a
+    limited time, so one downloader can be shared by every server. Songs are passed
+    around as Track records instead.
+    """
 
     @staticmethod
     @abstractmethod
@@ -17,49 +28,54 @@ class Downloader(Protocol):
         ...
 
     @abstractmethod
-    async def validateAndStoreURLOrSearch(self, url_or_search: str) -> bool:
-        """Validates a URL or search query to make sure it leads to a valid song.
-
-        If the URL or search query is valid, information about the song is stored as
-        well.
+    async def search(self, url_or_search: str, limit: int = 1) -> list[Track]:
+        """Find the songs that a URL or search query leads to.
 
         Args:
             url_or_search (str): either a URL or a search query
+            limit (int, optional): the most search results to return. A URL always
+            leads to at most one song. Defaults to 1.
+
+        Raises:
+            DownloadError: the song information could not be fetched
 
         Returns:
-            bool: whether or not the URL or search query is valid
+            list[Track]: the matching songs, best match first, which is empty if the
+            URL or search query does not lead to any valid songs
         """
         ...
 
     @abstractmethod
-    async def downloadSong(self) -> str | None:
-        """Downloads the song from the information stored in the object.
+    async def download(self, track: Track) -> str:
+        """Downloads a song.
 
-        If no information has already been stored, then None is returned.
+        Args:
+            track (Track): the song to download, which came from this downloader
+
+        Raises:
+            DownloadError: the song could not be downloaded
 
         Returns:
-            str | None: the filename of the downloaded song
+            str: the filename of the downloaded song, which is only used for this
+            download. The caller removes it once the song has finished playing
         """
         ...
 
     @abstractmethod
-    def getSongName(self) -> str | None:
-        """Get the name of the song from the information stored in the object.
-
-        If no information has already been stored, then None is returned.
+    def discard(self, tracks: list[Track]) -> None:
+        """Forget search results that will never be downloaded.
 
-        Returns:
-            str | None: the song name, or None if no song information is stored.
+        Args:
+            tracks (list[Track]): the search results, which came from this downloader
         """
         ...
 
     @abstractmethod
-    def getSongURL(self) -> str | None:
-        """Get the URL of the song from the information stored in the object.
-
-        If no information has already been stored, then None is returned.
+    def memoryUsage(self) -> tuple[int, int]:
+        """Measure what is kept about the songs this downloader found.
 
         Returns:
-            str | None: the song URL, or None if no song information is stored.
+            tuple[int, int]: the number of songs and roughly how many bytes are kept
+            about them
         """
         ...
@@ -0,0 +1,44 @@
+import re
+
+# the number of seconds in each unit a duration can be written in
+_UNITS = {"d": 24 * 60 * 60, "h": 60 * 60, "m": 60, "s": 1}
+# matches a duration such as "90m", "1h30m" or "2d"
+_DURATION = re.compile(r"(?:(\d+)\s*([dhms])\s*)+")
+_PART = re.compile(r"(\d+)\s*([dhms])")
+
+
+def parseDuration(text: str) -> int | None:
+    """Parse a duration written as numbers followed by units, such as "1h30m".
+
+    A number without a unit is taken to be hours.
+
+    Args:
+        text (str): the duration, using d, h, m and s for days, hours, minutes and
+        seconds
+
+    Returns:
+        int | None: the duration in seconds, or None if it is not a valid duration
+    """
+    text = text.strip().lower()
+    if text.isdigit():
+        return int(text) * _UNITS["h"]
+    if not _DURATION.fullmatch(text):
+        return None
+    return sum(int(number) * _UNITS[unit] for number, unit in _PART.findall(text))
+
+
+def formatDuration(seconds: int) -> str:
+    """Write a duration with the largest units that fit, such as "1h30m".
+
+    Args:
+        seconds (int): the duration in seconds
+
+    Returns:
+        str: the duration
+    """
+    parts = []
+    for unit, length in _UNITS.items():
+        count, seconds = divmod(seconds, length)
+        if count:
+            parts.append(f"{count}{unit}")
+    return "".join(parts) or "0s"
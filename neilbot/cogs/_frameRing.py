@@ -0,0 +1,127 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import deque
+from pathlib import Path
+
+
+class FrameRing:
+    """A fixed-size ring buffer of webcam frames stored on disk.
+
+    Frames are written to a fixed number of numbered slot files, so once the ring is
+    full each new frame overwrites the oldest one and the disk usage never grows.
+    Consecutive identical frames are only stored once.
+    """
+
+    def __init__(self, directory: Path, capacity: int):
+        """Inits the ring buffer, picking up any frames already stored on disk.
+
+        Args:
+            directory (Path): the directory to store the frames in
+            capacity (int): the maximum number of frames to keep
+        """
+        self._directory = directory
+        self._capacity = capacity
+        self._directory.mkdir(parents=True, exist_ok=True)
+
+        # the time each stored frame was captured and its slot, oldest first
+        self._frames: deque[tuple[float, int]] = deque(maxlen=capacity)
+        # the number of frames ever stored, used to tell renders of the ring apart
+        self.sequence = 0
+        # the hash of the newest frame, to skip storing the same frame twice
+        self._lastDigest: bytes | None = None
+
+        self._frames.extend(self._scan())
+        self.sequence = len(self._frames)
+        if self._frames:
+            newest = self._slotPath(self._frames[-1][1])
+            self._lastDigest = hashlib.sha256(newest.read_bytes()).digest()
+
+    def _scan(self) -> list[tuple[float, int]]:
+        """Find the frames stored on disk.
+
+        Returns:
+            list[tuple[float, int]]: the time each frame was captured and its slot,
+            oldest first
+        """
+        # rebuild the order of the frames from when their slot files were written
+        stored = []
+        for path in self._directory.glob("*.jpg"):
+            if path.stem.isdigit() and int(path.stem) < self._capacity:
+                try:
+                    stored.append((path.stat().st_mtime, int(path.stem)))
+                except FileNotFoundError:
+                    # the frame was removed while scanning
+                    continue
+        return sorted(stored)
+
+    def reload(self) -> None:
+        """Pick up the frames another process has stored in the directory.
+
+        This blocks while the directory is scanned, so it should be run in a thread.
+        """
+        frames = self._scan()
+        if frames != list(self._frames):
+            self._frames = deque(frames, maxlen=self._capacity)
+            self.sequence += 1
+
+    def _slotPath(self, slot: int) -> Path:
+        """Get the path of the file a slot is stored in.
+
+        Args:
+            slot (int): the slot number
+
+        Returns:
+            Path: the path of the slot file
+        """
+        return self._directory / f"{slot:06d}.jpg"
+
+    async def append(self, image: bytes, digest: bytes | None = None) -> bool:
+        """Store a new frame, overwriting the oldest frame if the ring is full.
+
+        Args:
+            image (bytes): the frame to store
+            digest (bytes | None, optional): the SHA-256 hash of the frame, or None
+            to calculate it. Defaults to None.
+
+        Returns:
+            bool: whether or not the frame was stored, since a frame identical to the
+            newest frame is skipped
+        """
+        digest = digest or hashlib.sha256(image).digest()
+        if digest == self._lastDigest:
+            return False
+
+        slot = (self._frames[-1][1] + 1) % self._capacity if self._frames else 0
+        await asyncio.to_thread(self._writeSlot, slot, image)
+        self._frames.append((time.time(), slot))
+        self._lastDigest = digest
+        self.sequence += 1
+        return True
+
+    def _writeSlot(self, slot: int, image: bytes) -> None:
+        """Write a frame to a slot file.
+
+        The frame is written to a temporary file first and then moved into place, so
+        a frame being read while it is overwritten is never half written.
+
+        Args:
+            slot (int): the slot number to write to
+            image (bytes): the frame to write
+        """
+        path = self._slotPath(slot)
+        temporary = path.with_suffix(".tmp")
+        temporary.write_bytes(image)
+        os.replace(temporary, path)
+
+    def framesSince(self, since: float) -> list[Path]:
+        """Get the frames captured since a point in time, oldest first.
+
+        Args:
+            since (float): the earliest capture time, as a Unix timestamp
+
+        Returns:
+            list[Path]: the files containing the frames
+        """
+        return [self._slotPath(slot) for t, slot in self._frames if t >= since]
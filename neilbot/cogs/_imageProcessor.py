@@ -0,0 +1,147 @@
+import asyncio
+import logging
+
+from neilbot.cogs._memoryUsage import deepSize
+
+
+class ImageProcessor:
+    """Downscales and recompresses images with a small pool of FFmpeg workers.
+
+    The image work happens in FFmpeg subprocesses, so the event loop never decodes or
+    encodes an image, and only a fixed number of them run at once. The processed
+    version of each source image is cached until the source image changes.
+    """
+
+    def __init__(self, workers: int = 2):
+        """Inits the image processor.
+
+        Args:
+            workers (int, optional): the maximum number of images processed at the
+            same time. Defaults to 2.
+        """
+        self._workers = asyncio.Semaphore(workers)
+
+        # maps a key to the source image and the processed version of it
+        self._processed: dict[str, tuple[bytes, bytes]] = {}
+        # maps a key to the source image and the processing in progress for it
+        self._processing: dict[str, tuple[bytes, asyncio.Task[bytes]]] = {}
+
+    async def process(
+        self, key: str, image: bytes, max_dimension: int, quality: int
+    ) -> bytes:
+        """Get a downscaled and recompressed version of an image.
+
+        If the image could not be processed, or processing would make it larger, then
+        the original image is returned.
+
+        Args:
+            key (str): identifies where the image is from, such as a camera name
+            image (bytes): the JPEG image to process
+            max_dimension (int): the largest width or height of the processed image
+            quality (int): the JPEG quality of the processed image, from 1 to 100
+
+        Returns:
+            bytes: the processed image
+        """
+        # the same bytes object is passed in for as long as the source is unchanged
+        processed = self._processed.get(key)
+        if processed and processed[0] is image:
+            return processed[1]
+
+        # share processing that is already in progress for the same image
+        processing = self._processing.get(key)
+        if processing is None or processing[0] is not image:
+            task = asyncio.create_task(
+                self._processAndStore(key, image, max_dimension, quality)
+            )
+            processing = (image, task)
+            self._processing[key] = processing
+        return await asyncio.shield(processing[1])
+
+    def memoryUsage(self) -> tuple[int, int]:
+        """Measure the processed images that are cached.
+
+        Returns:
+            tuple[int, int]: the number of cached images and roughly how many bytes
+            they use, including the source images they were made from
+        """
+        return len(self._processed), deepSize(self._processed)
+
+    async def _processAndStore(
+        self, key: str, image: bytes, max_dimension: int, quality: int
+    ) -> bytes:
+        """Process an image and cache the result.
+
+        Args:
+            key (str): identifies where the image is from
+            image (bytes): the JPEG image to process
+            max_dimension (int): the largest width or height of the processed image
+            quality (int): the JPEG quality of the processed image, from 1 to 100
+
+        Returns:
+            bytes: the processed image, or the original image if it could not be
+            made smaller
+        """
+        try:
+            async with self._workers:
+                processed = await self._recompress(image, max_dimension, quality)
+            # keep the original if processing failed or didn't help
+            if processed is None or len(processed) >= len(image):
+                processed = image
+            self._processed[key] = (image, processed)
+            return processed
+        finally:
+            processing = self._processing.get(key)
+            if processing and processing[0] is image:
+                del self._processing[key]
+
+    @staticmethod
+    async def _recompress(
+        image: bytes, max_dimension: int, quality: int
+    ) -> bytes | None:
+        """Downscale and recompress a JPEG image in an FFmpeg subprocess.
+
+        Args:
+            image (bytes): the JPEG image to process
+            max_dimension (int): the largest width or height of the processed image
+            quality (int): the JPEG quality of the processed image, from 1 to 100
+
+        Returns:
+            bytes | None: the processed image, or None if FFmpeg failed
+        """
+        # FFmpeg's JPEG quality goes from 2 (best) to 31 (worst)
+        qscale = round(2 + (100 - min(max(quality, 1), 100)) * 29 / 99)
+        try:
+            process = await asyncio.create_subprocess_exec(
+                "ffmpeg",
+                "-f",
+                "image2pipe",
+                "-i",
+                "pipe:0",
+                # only ever shrink the image, keeping its aspect ratio
+                "-vf",
+                (
+                    f"scale='min({max_dimension},iw)':'min({max_dimension},ih)'"
+                    ":force_original_aspect_ratio=decrease"
+                ),
+                "-q:v",
+                str(qscale),
+                "-f",
+                "image2pipe",
+                "-c:v",
+                "mjpeg",
+                "pipe:1",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+        except FileNotFoundError:
+            logging.error("Unable to process image: FFmpeg is not installed")
+            return None
+        processed, _ = await process.communicate(image)
+        if process.returncode != 0:
+            logging.warning(
+                f"Unable to process image: FFmpeg exited {process.returncode}"
+            )
+            return None
+        return processed
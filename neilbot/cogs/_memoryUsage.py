@@ -0,0 +1,46 @@
+import sys
+from collections import deque
+from typing import Any
+
+# containers whose contents are counted as part of their size
+_CONTAINERS = (dict, list, tuple, set, frozenset, deque)
+
+
+def deepSize(obj: Any, follow: tuple[type, ...] = ()) -> int:
+    """Estimate how many bytes an object and everything it contains use.
+
+    Built in containers are followed into, and so are the attributes of instances of
+    the classes in follow. Every other object is only counted by its own size, so
+    that references to shared things like the bot are not counted. Objects that are
+    reachable more than once are only counted once.
+
+    Args:
+        obj (Any): the object to measure
+        follow (tuple[type, ...], optional): the classes whose attributes are
+        counted as part of their size. Defaults to no classes.
+
+    Returns:
+        int: the estimated size in bytes
+    """
+    seen: set[int] = set()
+    size = 0
+    pending = [obj]
+    while pending:
+        current = pending.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+        if isinstance(current, dict):
+            pending.extend(current.keys())
+            pending.extend(current.values())
+        elif isinstance(current, _CONTAINERS):
+            pending.extend(current)
+        elif follow and isinstance(current, follow):
+            if hasattr(current, "__dict__"):
+                pending.append(vars(current))
+            # slotted objects keep their attributes in slots instead of a dictionary
+            for slot in getattr(type(current), "__slots__", ()):
+                if hasattr(current, slot):
+                    pending.append(getattr(current, slot))
+    return size
@@ -0,0 +1,344 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+
+import discord
+
+from neilbot.cogs._track import Track
+from neilbot.metrics import Metrics
+
+
+@dataclass(slots=True, eq=False)
+class _PlayerState:
+    """What a server's player message shows, and the message itself.
+
+    Attributes:
+        channel (discord.abc.Messageable | None): the channel to send the message to
+        if it has not been sent yet
+        message (discord.Message | None): the player message, or None if it has not
+        been sent yet
+        track (Track | None): the song playing, or None if nothing is playing
+        startedAt (float): the Unix time the song would have started at if it was
+        never paused
+        pausedAt (float | None): the Unix time the song was paused at, or None if
+        it is not paused
+        queued (int): the number of songs waiting in the queue
+        status (str): feedback from the last button or error, shown under the song
+        dirty (bool): whether or not the message is behind the state
+        lastEdit (float): the monotonic time the message was last sent or edited
+        flushTask (asyncio.Task | None): the task waiting to update the message
+        tickTask (asyncio.Task | None): the task updating the song's progress
+    """
+
+    channel: discord.abc.Messageable | None = None
+    message: discord.Message | None = None
+    track: Track | None = None
+    startedAt: float = 0.0
+    pausedAt: float | None = None
+    queued: int = 0
+    status: str = ""
+    dirty: bool = False
+    lastEdit: float = float("-inf")
+    flushTask: asyncio.Task[None] | None = None
+    tickTask: asyncio.Task[None] | None = None
+
+
+def _formatTime(seconds: float) -> str:
+    """Format a position in a song.
+
+    Args:
+        seconds (float): the position
+
+    Returns:
+        str: the position in minutes and seconds, such as 3:07
+    """
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}:{seconds:02d}"
+
+
+class NowPlaying:
+    """Keeps a single live music player message up to date in each server.
+
+    Instead of sending a message for every song, button press and error, each
+    server has one message that is edited in place. Changes are coalesced, so
+    any number of changes within the edit interval become a single edit with the
+    latest state, which keeps each channel well under Discord's limit of five
+    message edits every five seconds.
+
+    Attributes:
+        view (discord.ui.View | None): the buttons sent with every player message
+    """
+
+    # the fewest seconds between two edits of a player message
+    _MIN_INTERVAL = 3.0
+    # how many seconds apart the progress of a song is updated
+    _PROGRESS_INTERVAL = 30.0
+    # the number of characters in the progress bar
+    _BAR_LENGTH = 16
+
+    def __init__(self, metrics: Metrics):
+        """Inits the player messages, none of which have been sent yet.
+
+        Args:
+            metrics (Metrics): the metrics to count player message updates in
+        """
+        self._metrics = metrics
+        self.view: discord.ui.View | None = None
+        # maps a server ID to its player message
+        self._players: dict[int, _PlayerState] = {}
+
+    def _render(self, state: _PlayerState) -> discord.Embed:
+        """Draw the player message.
+
+        Args:
+            state (_PlayerState): what the message shows
+
+        Returns:
+            discord.Embed: the player message
+        """
+        embed = discord.Embed(title="Music Player")
+        if state.track:
+            embed.description = f"Now playing **{state.track.title}**"
+            elapsed = (state.pausedAt or time.time()) - state.startedAt
+            duration = state.track.duration
+            if duration:
+                elapsed = min(elapsed, duration)
+                filled = int(elapsed / duration * self._BAR_LENGTH)
+                progress = (
+                    "▬" * filled
+                    + "🔘"
+                    + "▬" * (self._BAR_LENGTH - filled - 1)
+                    + f" {_formatTime(elapsed)} / {_formatTime(duration)}"
+                )
+            else:
+                progress = _formatTime(elapsed)
+            # Discord counts relative timestamps down by itself, between edits
+            if state.pausedAt is not None:
+                progress += "\nPaused"
+            elif duration:
+                progress += f"\nEnds <t:{int(state.startedAt + duration)}:R>"
+            else:
+                progress += f"\nStarted <t:{int(state.startedAt)}:R>"
+            embed.add_field(name="Progress", value=progress, inline=False)
+        else:
+            embed.description = "No song currently playing"
+        embed.add_field(
+            name="Up next",
+            value=(
+                f"{state.queued} song(s) in the queue"
+                if state.queued
+                else "The queue is empty"
+            ),
+            inline=False,
+        )
+        if state.status:
+            embed.set_footer(text=state.status)
+        return embed
+
+    async def _publish(self, state: _PlayerState) -> None:
+        """Send the player message, or edit it if it has been sent already.
+
+        Args:
+            state (_PlayerState): what the message shows
+        """
+        embed = self._render(state)
+        state.lastEdit = time.monotonic()
+        try:
+            if state.message:
+                # the buttons never change, so only the embed is edited
+                await state.message.edit(embed=embed)
+                outcome = "edited"
+            elif state.channel:
+                state.message = await state.channel.send(
+                    embed=embed, view=self.view or discord.utils.MISSING
+                )
+                outcome = "sent"
+            else:
+                return
+        except discord.NotFound:
+            # somebody deleted the message, so send it again
+            state.message = None
+            state.dirty = True
+            outcome = "failed"
+        except discord.HTTPException as e:
+            logging.error(f"Unable to update the music player: {e}")
+            outcome = "failed"
+        self._metrics.increment("neilbot_player_updates_total", outcome=outcome)
+
+    async def _flush(self, state: _PlayerState) -> None:
+        """Update the player message until it has caught up with its state.
+
+        Args:
+            state (_PlayerState): what the message shows
+        """
+        while state.dirty:
+            # changes that arrive while waiting are all sent in the same edit
+            delay = state.lastEdit + self._MIN_INTERVAL - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            state.dirty = False
+            await self._publish(state)
+
+    def _request(self, state: _PlayerState, send: bool = False) -> None:
+        """Ask for the player message to be updated with its latest state.
+
+        Args:
+            state (_PlayerState): what the message shows
+            send (bool, optional): whether or not to send the message if it has not
+            been sent yet. Defaults to False.
+        """
+        if state.flushTask and not state.flushTask.done():
+            # the update that is already waiting will include this change
+            state.dirty = True
+            self._metrics.increment("neilbot_player_updates_total", outcome="coalesced")
+            return
+        if state.message is None and not (send and state.channel):
+            return
+        state.dirty = True
+        state.flushTask = asyncio.create_task(self._flush(state))
+
+    async def _tick(self, state: _PlayerState, track: Track) -> None:
+        """Update the progress of a song until it stops playing.
+
+        Args:
+            state (_PlayerState): what the message shows
+            track (Track): the song to update the progress of
+        """
+        while True:
+            await asyncio.sleep(self._PROGRESS_INTERVAL)
+            if state.track is not track:
+                return
+            if state.pausedAt is None:
+                self._request(state)
+
+    def _state(
+        self, serverID: int, channel: discord.abc.Messageable | None = None
+    ) -> _PlayerState:
+        """Get a server's player message, and where to send it if it is not sent.
+
+        Args:
+            serverID (int): the ID of the server
+            channel (discord.abc.Messageable | None, optional): the channel to send
+            the message to if it has not been sent yet. Defaults to None.
+
+        Returns:
+            _PlayerState: the server's player message
+        """
+        state = self._players.setdefault(serverID, _PlayerState())
+        if channel and state.message is None:
+            state.channel = channel
+        return state
+
+    def trackChanged(
+        self,
+        serverID: int,
+        channel: discord.abc.Messageable,
+        track: Track | None,
+        queued: int,
+    ) -> None:
+        """Show that a song started playing, sending the player message if needed.
+
+        Args:
+            serverID (int): the ID of the server the song is playing in
+            channel (discord.abc.Messageable): the channel to send the message to if
+            it has not been sent yet
+            track (Track | None): the song that started, or None if the queue ended
+            queued (int): the number of songs left in the queue
+        """
+        state = self._state(serverID, channel)
+        state.track = track
+        state.startedAt = time.time()
+        state.pausedAt = None
+        state.queued = queued
+        state.status = ""
+        if state.tickTask:
+            state.tickTask.cancel()
+        state.tickTask = (
+            asyncio.create_task(self._tick(state, track)) if track else None
+        )
+        # nothing is sent just to say that nothing is playing
+        self._request(state, send=track is not None)
+
+    def queueChanged(self, serverID: int, queued: int) -> None:
+        """Show how many songs are in the queue.
+
+        Args:
+            serverID (int): the ID of the server whose queue changed
+            queued (int): the number of songs in the queue
+        """
+        state = self._state(serverID)
+        state.queued = queued
+        self._request(state)
+
+    def pausedChanged(self, serverID: int, paused: bool) -> None:
+        """Show whether or not the song is paused.
+
+        Args:
+            serverID (int): the ID of the server whose song was paused or resumed
+            paused (bool): whether or not the song is paused now
+        """
+        state = self._state(serverID)
+        now = time.time()
+        if paused and state.pausedAt is None:
+            state.pausedAt = now
+        elif not paused and state.pausedAt is not None:
+            # the song carries on from where it was paused
+            state.startedAt += now - state.pausedAt
+            state.pausedAt = None
+        self._request(state)
+
+    def statusChanged(
+        self, serverID: int, channel: discord.abc.Messageable, status: str
+    ) -> None:
+        """Show feedback under the song, sending the player message if needed.
+
+        Args:
+            serverID (int): the ID of the server to show the feedback in
+            channel (discord.abc.Messageable): the channel to send the message to if
+            it has not been sent yet
+            status (str): the feedback, such as an error
+        """
+        state = self._state(serverID, channel)
+        state.status = status
+        self._request(state, send=True)
+
+    async def pressed(self, interaction: discord.Interaction, status: str) -> None:
+        """Show the feedback from a button in the message the button is on.
+
+        The message is edited through the interaction, which does not count
+        towards the channel's rate limit, and it becomes the server's player
+        message.
+
+        Args:
+            interaction (discord.Interaction): the deferred button interaction
+            status (str): the feedback from the button
+        """
+        state = self._state(interaction.guild_id or 0)
+        state.message = interaction.message
+        state.channel = interaction.channel
+        if interaction.user:
+            status += f" ({interaction.user.display_name})"
+        state.status = status
+        # the edit shows the latest state, so a waiting update has nothing to add
+        state.dirty = False
+        state.lastEdit = time.monotonic()
+        await interaction.edit_original_response(embed=self._render(state))
+        self._metrics.increment("neilbot_player_updates_total", outcome="pressed")
+
+    async def moveTo(self, serverID: int, channel: discord.abc.Messageable) -> None:
+        """Send the player message again at the bottom of a channel.
+
+        Args:
+            serverID (int): the ID of the server whose player message to move
+            channel (discord.abc.Messageable): the channel to send the message to
+        """
+        state = self._state(serverID)
+        old, state.message, state.channel = state.message, None, channel
+        self._request(state, send=True)
+        if old:
+            try:
+                await old.delete()
+            except discord.HTTPException:
+                # the message was deleted already, or can no longer be deleted
+                pass
@@ -1,7 +1,10 @@
+import time
 from collections.abc import Awaitable, Callable
 
 import discord
 
+from neilbot.metrics import Metrics
+
 
 class PlayerButtons(discord.ui.View):
     """View class to contain music control buttons."""
@@ -15,11 +18,14 @@ class PlayerButtons(discord.ui.View):
             [discord.ApplicationContext | discord.Interaction], Awaitable[str]
         ],
         queue_callback: Callable[
-            [discord.ApplicationContext | discord.Interaction], Awaitable[str]
+            [discord.ApplicationContext | discord.Interaction],
+            Awaitable[tuple[str, discord.ui.View | None]],
         ],
         stop_callback: Callable[
             [discord.ApplicationContext | discord.Interaction], Awaitable[str]
         ],
+        feedback_callback: Callable[[discord.Interaction, str], Awaitable[None]],
+        metrics: Metrics,
     ):
         """Inits the buttons for music controls.
 
@@ -31,11 +37,15 @@ class PlayerButtons(discord.ui.View):
                 [discord.ApplicationContext | discord.Interaction], Awaitable[str]
             ]): method to skip the current song
             queue_callback (Callable[
-                [discord.ApplicationContext | discord.Interaction], Awaitable[str]
-            ]): method to show the music queue
+                [discord.ApplicationContext | discord.Interaction],
+                Awaitable[tuple[str, discord.ui.View | None]],
+            ]): method to show the music queue and buttons for its other pages
             stop_callback (Callable[
                 [discord.ApplicationContext | discord.Interaction], Awaitable[str]
             ]): method to stop the current song
+            feedback_callback (Callable[[discord.Interaction, str], Awaitable[None]]):
+            method to show a button's message in the message the button is on
+            metrics (Metrics): the metrics to record button latency in
         """
         # need to call the parent constructor first or else the view will not work
         super().__init__(timeout=None)
@@ -45,6 +55,54 @@ class PlayerButtons(discord.ui.View):
         self._skip_callback = skip_callback
         self._queue_callback = queue_callback
         self._stop_callback = stop_callback
+        self._feedback_callback = feedback_callback
+        self._metrics = metrics
+
+    async def _handlePress(
+        self,
+        name: str,
+        callback: Callable[
+            [discord.ApplicationContext | discord.Interaction],
+            Awaitable[str | tuple[str, discord.ui.View | None]],
+        ],
+        interaction: discord.Interaction,
+    ) -> None:
+        """Run a button's callback, send its message and record how long it took.
+
+        Args:
+            name (str): the name of the button, used to label its metrics
+            callback (Callable[
+                [discord.ApplicationContext | discord.Interaction],
+                Awaitable[str | tuple[str, discord.ui.View | None]],
+            ]): the method the button runs, which returns a message and optionally a
+            view to send with it
+            interaction (discord.Interaction): the Discord message interaction
+        """
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            # give us 15 minutes instead of 3 seconds to respond, without sending a
+            # new message
+            with self._metrics.phase(f"button:{name}", "defer"):
+                await interaction.response.defer()
+            result = await callback(interaction)
+            if isinstance(result, tuple):
+                # messages with their own buttons are only shown to the presser, so
+                # they do not flood the channel
+                message, view = result
+                await interaction.followup.send(
+                    message, view=view or discord.utils.MISSING, ephemeral=True
+                )
+            else:
+                await self._feedback_callback(interaction, result)
+            outcome = "ok"
+        finally:
+            self._metrics.observe(
+                "neilbot_button_seconds",
+                time.perf_counter() - start,
+                button=name,
+                outcome=outcome,
+            )
 
     @discord.ui.button(
         label="Play/Pause",
@@ -62,13 +120,9 @@ class PlayerButtons(discord.ui.View):
             button (discord.Button): a message button
             interaction (discord.Interaction): the Discord message interaction
         """
-        # give us 15 minutes instead of 3 seconds to respond
-        await interaction.response.defer()
-
         # don't need to use the button
         del button
-        message = await self._toggle_pause_callback(interaction)
-        await interaction.followup.send(message)
+        await self._handlePress("play_pause", self._toggle_pause_callback, interaction)
 
     @discord.ui.button(
         label="Skip",
@@ -86,13 +140,9 @@ class PlayerButtons(discord.ui.View):
             button (discord.Button): a message button
             interaction (discord.Interaction): the Discord message interaction
         """
-        # give us 15 minutes instead of 3 seconds to respond
-        await interaction.response.defer()
-
         # don't need to use the button
         del button
-        message = await self._skip_callback(interaction)
-        await interaction.followup.send(message)
+        await self._handlePress("skip", self._skip_callback, interaction)
 
     @discord.ui.button(
         label="Stop",
@@ -110,13 +160,9 @@ class PlayerButtons(discord.ui.View):
             button (discord.Button): a message button
             interaction (discord.Interaction): the Discord message interaction
         """
-        # give us 15 minutes instead of 3 seconds to respond
-        await interaction.response.defer()
-
         # don't need to use the button
         del button
-        message = await self._stop_callback(interaction)
-        await interaction.followup.send(message)
+        await self._handlePress("stop", self._stop_callback, interaction)
 
     @discord.ui.button(
         label="Show Queue",
@@ -134,10 +180,6 @@ class PlayerButtons(discord.ui.View):
             button (discord.Button): a message button
             interaction (discord.Interaction): the Discord message interaction
         """
-        # give us 15 minutes instead of 3 seconds to respond
-        await interaction.response.defer()
-
         # don't need to use the button
         del button
-        message = await self._queue_callback(interaction)
-        await interaction.followup.send(message)
+        await self._handlePress("queue", self._queue_callback, interaction)
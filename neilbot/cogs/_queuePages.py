@@ -0,0 +1,161 @@
+from collections.abc import Callable
+from typing import cast
+
+import discord
+
+from neilbot.cogs._track import Track
+
+
+class QueueSnapshot:
+    """A copy of a server's music queue that renders one page at a time.
+
+    The queue is copied into a tuple so any page can be sliced out straight away,
+    and each page is only formatted the first time it is shown.
+
+    Attributes:
+        version (int): the version of the queue that was copied
+    """
+
+    # songs shown on each page, which keeps every page well under Discord's 2000
+    # character message limit
+    PAGE_SIZE = 10
+    # YouTube titles are at most 100 characters, but other sources may be longer
+    _MAX_TITLE = 100
+
+    def __init__(self, version: int, current: Track | None, songs: tuple[Track, ...]):
+        """Inits the snapshot.
+
+        Args:
+            version (int): the version of the queue that was copied
+            current (Track | None): the song playing when the queue was copied
+            songs (tuple[Track, ...]): the songs waiting in the queue
+        """
+        self.version = version
+        self._current = current
+        self._songs = songs
+        # maps a page number to the rendered page
+        self._pages: dict[int, str] = {}
+
+    @property
+    def pageCount(self) -> int:
+        """Count the pages in the queue.
+
+        Returns:
+            int: the number of pages, which is at least 1
+        """
+        return max(1, -(-len(self._songs) // self.PAGE_SIZE))
+
+    def page(self, number: int) -> str:
+        """Render a page of the queue, or reuse it if it has been rendered already.
+
+        Args:
+            number (int): the page to render, from 0. Pages past the end show the
+            last page
+
+        Returns:
+            str: the page, or a message saying the queue is empty
+        """
+        if not self._songs:
+            return "No songs currently in the queue"
+        number = min(number, self.pageCount - 1)
+        if number not in self._pages:
+            start = number * self.PAGE_SIZE
+            lines = []
+            # if a song is currently playing, then display it first
+            if self._current:
+                lines += [f"Currently playing **{self._current.title}**", ""]
+            lines.append(f"Song queue ({len(self._songs)} songs):")
+            # print each song, using a 1-indexed list
+            lines += [
+                f"{i}. {song.title[: self._MAX_TITLE]} [{song.source}]"
+                for i, song in enumerate(
+                    self._songs[start : start + self.PAGE_SIZE], start + 1
+                )
+            ]
+            if self.pageCount > 1:
+                lines += ["", f"Page {number + 1} of {self.pageCount}"]
+            self._pages[number] = "\n".join(lines)
+        return self._pages[number]
+
+
+class QueueView(discord.ui.View):
+    """View class with buttons for paging through a server's music queue."""
+
+    def __init__(
+        self,
+        snapshot: Callable[[], QueueSnapshot],
+        page: int = 0,
+        timeout: float = 300,
+    ):
+        """Inits the page buttons.
+
+        Args:
+            snapshot (Callable[[], QueueSnapshot]): gets a snapshot of the latest
+            version of the queue
+            page (int, optional): the page being shown, from 0. Defaults to 0.
+            timeout (float, optional): how many seconds the buttons work for after
+            they were last pressed. Defaults to 300.
+        """
+        # need to call the parent constructor first or else the view will not work
+        super().__init__(timeout=timeout)
+
+        self._snapshot = snapshot
+        self._page = page
+        self._updateButtons(snapshot().pageCount)
+
+    def _updateButtons(self, page_count: int) -> None:
+        """Only enable the buttons that lead to another page.
+
+        Args:
+            page_count (int): the number of pages in the queue
+        """
+        # the decorated methods are replaced with their buttons on each view
+        cast(discord.ui.Button, self.previous_page).disabled = self._page == 0
+        cast(discord.ui.Button, self.next_page).disabled = self._page >= page_count - 1
+
+    async def _turnTo(self, page: int, interaction: discord.Interaction) -> None:
+        """Show another page of the queue, which may have changed since the last one.
+
+        Args:
+            page (int): the page to show, from 0
+            interaction (discord.Interaction): the Discord button interaction
+        """
+        snapshot = self._snapshot()
+        # the queue may have shrunk since the buttons were last pressed
+        self._page = max(0, min(page, snapshot.pageCount - 1))
+        self._updateButtons(snapshot.pageCount)
+        await interaction.response.edit_message(
+            content=snapshot.page(self._page), view=self
+        )
+
+    @discord.ui.button(
+        label="Previous", row=0, style=discord.ButtonStyle.secondary, emoji="⬅️"
+    )
+    async def previous_page(
+        self, button: discord.Button, interaction: discord.Interaction
+    ) -> None:
+        """Button to show the previous page of the queue.
+
+        Args:
+            button (discord.Button): a message button
+            interaction (discord.Interaction): the Discord message interaction
+        """
+        # don't need to use the button
+        del button
+        await self._turnTo(self._page - 1, interaction)
+
+    @discord.ui.button(
+        label="Next", row=0, style=discord.ButtonStyle.secondary, emoji="➡️"
+    )
+    async def next_page(
+        self, button: discord.Button, interaction: discord.Interaction
+    ) -> None:
+        """Button to show the next page of the queue.
+
+        Args:
+            button (discord.Button): a message button
+            interaction (discord.Interaction): the Discord message interaction
+        """
+        # don't need to use the button
+        del button
+        await self._turnTo(self._page + 1, interaction)
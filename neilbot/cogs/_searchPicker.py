@@ -0,0 +1,91 @@
+from typing import cast
+
+import discord
+
+from neilbot.cogs._track import Track
+
+
+class _TrackSelect(discord.ui.Select):
+    """Select menu listing search results for the picker it belongs to."""
+
+    def __init__(self, tracks: list[Track]):
+        """Inits the select menu with an option for each search result.
+
+        Args:
+            tracks (list[Track]): the search results to choose from
+        """
+        options = []
+        for i, track in enumerate(tracks):
+            duration = (
+                f"{int(track.duration) // 60}:{int(track.duration) % 60:02d}"
+                if track.duration
+                else None
+            )
+            # Discord limits option labels to 100 characters
+            options.append(
+                discord.SelectOption(
+                    label=track.title[:100], value=str(i), description=duration
+                )
+            )
+        super().__init__(placeholder="Choose a video", options=options)
+
+    async def callback(self, interaction: discord.Interaction) -> None:
+        """Pass the chosen search result to the picker.
+
+        Args:
+            interaction (discord.Interaction): the Discord select interaction
+        """
+        # the options are only ever added to a picker, and their values are indexes
+        picker = cast("SearchPicker", self.view)
+        await picker.choose(int(cast(str, self.values[0])), interaction)
+
+
+class SearchPicker(discord.ui.View):
+    """View class for choosing one of several search results.
+
+    Attributes:
+        choice (Track | None): the chosen search result, or None if nothing has been
+        chosen yet
+    """
+
+    def __init__(self, user_id: int, tracks: list[Track], timeout: float = 60):
+        """Inits the picker.
+
+        Args:
+            user_id (int): the ID of the only user that can choose a result
+            tracks (list[Track]): the search results to choose from, up to 25
+            timeout (float, optional): how many seconds to wait for a choice.
+            Defaults to 60.
+        """
+        # need to call the parent constructor first or else the view will not work
+        super().__init__(timeout=timeout)
+
+        self._userID = user_id
+        self._tracks = tracks
+        self.choice: Track | None = None
+
+        self.add_item(_TrackSelect(tracks))
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        """Only let the user who searched choose a result.
+
+        Args:
+            interaction (discord.Interaction): the Discord select interaction
+
+        Returns:
+            bool: whether or not the user can choose a result
+        """
+        return interaction.user is not None and interaction.user.id == self._userID
+
+    async def choose(self, index: int, interaction: discord.Interaction) -> None:
+        """Store the chosen search result and stop waiting for a choice.
+
+        Args:
+            index (int): the position of the chosen result
+            interaction (discord.Interaction): the Discord select interaction
+        """
+        self.choice = self._tracks[index]
+        await interaction.response.edit_message(
+            content=f"Picked **{self.choice.title}**", view=None
+        )
+        self.stop()
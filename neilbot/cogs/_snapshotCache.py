@@ -0,0 +1,99 @@
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+
+
+class SnapshotCache:
+    """Caches webcam snapshots for a short time and shares concurrent downloads.
+
+    Webcams only refresh their image every so often, so a snapshot downloaded within
+    the time to live is returned as-is. If a snapshot is requested while it is already
+    being downloaded, the request waits for that download instead of starting another.
+    """
+
+    def __init__(
+        self, download: Callable[[str], Awaitable[bytes | None]], ttl: float = 30
+    ):
+        """Inits the snapshot cache.
+
+        Args:
+            download (Callable[[str], Awaitable[bytes | None]]): method to download a
+            snapshot from a URL, returning None if the download failed
+            ttl (float, optional): how many seconds a snapshot is reused for.
+            Defaults to 30.
+        """
+        self._download = download
+        self._ttl = ttl
+
+        # maps a URL to the time its snapshot was downloaded and the snapshot itself
+        self._snapshots: dict[str, tuple[float, bytes]] = {}
+        # maps a URL to the download currently in progress for it
+        self._downloads: dict[str, asyncio.Task[bytes | None]] = {}
+
+    async def get(self, url: str, ttl: float | None = None) -> bytes | None:
+        """Get the snapshot for a URL, downloading it if the cached one is too old.
+
+        Args:
+            url (str): the URL to get the snapshot from
+            ttl (float | None, optional): how many seconds the snapshot is reused for,
+            or None to use the cache's time to live. Defaults to None.
+
+        Returns:
+            bytes | None: the snapshot, or None if it could not be downloaded
+        """
+        snapshot = self.cached(url, ttl)
+        if snapshot is not None:
+            return snapshot
+        return await self.refresh(url)
+
+    def cached(self, url: str, ttl: float | None = None) -> bytes | None:
+        """Get the snapshot for a URL without downloading it.
+
+        Args:
+            url (str): the URL the snapshot is from
+            ttl (float | None, optional): how many seconds the snapshot is reused for,
+            or None to use the cache's time to live. Defaults to None.
+
+        Returns:
+            bytes | None: the snapshot, or None if there is no snapshot recent enough
+        """
+        ttl = self._ttl if ttl is None else ttl
+        snapshot = self._snapshots.get(url)
+        if snapshot and time.monotonic() - snapshot[0] < ttl:
+            return snapshot[1]
+        return None
+
+    async def refresh(self, url: str) -> bytes | None:
+        """Download a new snapshot for a URL even if the cached one is recent.
+
+        Args:
+            url (str): the URL to download the snapshot from
+
+        Returns:
+            bytes | None: the snapshot, or None if it could not be downloaded
+        """
+        # only start a download if one is not already in progress for this URL
+        download = self._downloads.get(url)
+        if download is None:
+            download = asyncio.create_task(self._downloadAndStore(url))
+            self._downloads[url] = download
+        # shield the download so that one cancelled request doesn't cancel it for
+        # every other request waiting on it
+        return await asyncio.shield(download)
+
+    async def _downloadAndStore(self, url: str) -> bytes | None:
+        """Download a new snapshot for a URL and cache it.
+
+        Args:
+            url (str): the URL to download the snapshot from
+
+        Returns:
+            bytes | None: the snapshot, or None if it could not be downloaded
+        """
+        try:
+            image = await self._download(url)
+            if image is not None:
+                self._snapshots[url] = (time.monotonic(), image)
+            return image
+        finally:
+            del self._downloads[url]
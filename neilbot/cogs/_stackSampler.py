@@ -0,0 +1,70 @@
+import sys
+import threading
+import time
+from collections import Counter
+from types import FrameType
+
+
+class StackSampler:
+    """Profiles the whole process by regularly sampling the stack of every thread.
+
+    Sampling happens in its own thread and only reads the stacks, so the event loop
+    and the worker threads that download songs keep running at full speed while
+    they are profiled. The samples are returned as collapsed stacks, which can be
+    turned into a flame graph with tools like flamegraph.pl or speedscope.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        """Inits the stack sampler.
+
+        Args:
+            interval (float, optional): how many seconds apart stacks are sampled.
+            Defaults to 0.005.
+        """
+        self._interval = interval
+
+    @staticmethod
+    def _collapse(threadName: str, frame: FrameType | None) -> str:
+        """Turn a stack into a single line, from the outermost call inwards.
+
+        Args:
+            threadName (str): the name of the thread the stack is from
+            frame (FrameType | None): the innermost frame of the stack
+
+        Returns:
+            str: the thread name and each function in the stack, separated by
+            semicolons
+        """
+        calls = []
+        while frame is not None:
+            code = frame.f_code
+            calls.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+            frame = frame.f_back
+        calls.append(threadName)
+        return ";".join(reversed(calls))
+
+    def sample(self, seconds: float) -> tuple[str, int]:
+        """Sample every other thread for some time. This blocks the calling thread.
+
+        Args:
+            seconds (float): how many seconds to sample for
+
+        Returns:
+            tuple[str, int]: the collapsed stacks, one per line with the number of
+            times it was sampled, and the number of times the threads were sampled
+        """
+        me = threading.get_ident()
+        stacks: Counter[str] = Counter()
+        samples = 0
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            # thread names tell the event loop apart from the worker threads
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    stacks[self._collapse(names.get(ident, str(ident)), frame)] += 1
+            samples += 1
+            time.sleep(self._interval)
+
+        lines = (f"{stack} {count}" for stack, count in stacks.most_common())
+        return "\n".join(lines) + "\n", samples
@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from contextlib import AbstractAsyncContextManager, nullcontext
+
+import discord
+
+from neilbot.metrics import Metrics
+
+
+class ThreadHousekeeper:
+    """Manages the lifecycle of Leetcode threads using as few REST calls as possible.
+
+    Archived threads are crawled once per channel and then kept up to date from
+    gateway thread events, threads are only unarchived when they are actually
+    archived, and threads that are requested often are kept unarchived in the
+    background so that lookups rarely need to make a REST call at all. If a channel
+    is looked up while it is already being crawled, the lookup waits for that crawl
+    instead of starting another.
+    """
+
+    # the archived threads endpoint returns at most this many threads per request
+    _ARCHIVE_PAGE_SIZE = 50
+
+    def __init__(
+        self,
+        metrics: Metrics,
+        archive_limit: int | None = 50,
+        warm_threshold: int = 3,
+        history_window: float = 7 * 24 * 60 * 60,
+    ):
+        """Inits the thread housekeeper.
+
+        Args:
+            metrics (Metrics): the metrics to record background REST calls in
+            archive_limit (int | None, optional): the maximum number of archived
+            threads to crawl per channel, or None to crawl every archived thread.
+            Defaults to 50.
+            warm_threshold (int, optional): the number of lookups within the history
+            window that makes a thread worth keeping unarchived. Defaults to 3.
+            history_window (float, optional): how far back in seconds lookups are
+            remembered. Defaults to one week.
+        """
+        self._metrics = metrics
+        self._archiveLimit = archive_limit
+        self._warmThreshold = warm_threshold
+        self._historyWindow = history_window
+
+        # maps a channel id to the archived threads in that channel, keyed by thread id
+        self._archivedThreads: dict[int, dict[int, discord.Thread]] = {}
+        # maps a channel id to the crawl currently in progress for it
+        self._crawls: dict[int, asyncio.Task[tuple[list[discord.Thread], int]]] = {}
+        # maps a thread id to the times it was returned by a lookup
+        self._queryHistory: dict[int, deque[float]] = {}
+        # maps a thread id to the most recent thread object returned by a lookup
+        self._queriedThreads: dict[int, discord.Thread] = {}
+
+    async def getArchivedThreads(
+        self,
+        channel: discord.TextChannel,
+        admission: AbstractAsyncContextManager[None] | None = None,
+    ) -> tuple[list[discord.Thread], int]:
+        """Gets the archived threads from a channel, crawling them only once.
+
+        Args:
+            channel (discord.TextChannel): a Discord channel to get threads from
+            admission (AbstractAsyncContextManager[None] | None, optional): entered
+            around the crawl if the channel has not been crawled yet, such as a turn
+            from the admission controller. Defaults to None.
+
+        Returns:
+            tuple[list[discord.Thread], int]: the archived threads in the channel and
+            the number of REST calls made to get them, which is 0 for a lookup that
+            waited for another lookup's crawl
+        """
+        # the cache is kept up to date by thread events, so no REST call is needed
+        if channel.id in self._archivedThreads:
+            return list(self._archivedThreads[channel.id].values()), 0
+
+        # only start a crawl if one is not already in progress for this channel
+        crawl = self._crawls.get(channel.id)
+        started = crawl is None
+        if crawl is None:
+            crawl = asyncio.create_task(self._crawlAndStore(channel, admission))
+            self._crawls[channel.id] = crawl
+        # shield the crawl so that one cancelled lookup doesn't cancel it for every
+        # other lookup waiting on it
+        threads, apiCalls = await asyncio.shield(crawl)
+        return threads, apiCalls if started else 0
+
+    async def _crawlAndStore(
+        self,
+        channel: discord.TextChannel,
+        admission: AbstractAsyncContextManager[None] | None,
+    ) -> tuple[list[discord.Thread], int]:
+        """Crawl the archived threads of a channel and cache them.
+
+        Args:
+            channel (discord.TextChannel): a Discord channel to get threads from
+            admission (AbstractAsyncContextManager[None] | None): entered around the
+            crawl, such as a turn from the admission controller
+
+        Returns:
+            tuple[list[discord.Thread], int]: the archived threads in the channel and
+            the number of REST calls made to get them
+        """
+        try:
+            async with admission or nullcontext():
+                threads = [
+                    th
+                    async for th in channel.archived_threads(limit=self._archiveLimit)
+                ]
+            self._archivedThreads[channel.id] = {th.id: th for th in threads}
+            # every page of archived threads is a separate request, and at least one
+            # request is always made even if there are no archived threads
+            apiCalls = max(1, math.ceil(len(threads) / self._ARCHIVE_PAGE_SIZE))
+            return threads, apiCalls
+        finally:
+            del self._crawls[channel.id]
+
+    def threadUpdated(self, thread: discord.Thread) -> None:
+        """Keeps the archived thread cache in sync with a thread update event.
+
+        Args:
+            thread (discord.Thread): the thread after it was updated
+        """
+        archivedThreads = self._archivedThreads.get(thread.parent_id)
+        # only channels that have already been crawled need to be kept in sync
+        if archivedThreads is None:
+            return
+        if thread.archived:
+            archivedThreads[thread.id] = thread
+        else:
+            archivedThreads.pop(thread.id, None)
+
+    def threadDeleted(self, parent_id: int, thread_id: int) -> None:
+        """Removes a deleted thread from the archived thread cache and query history.
+
+        Args:
+            parent_id (int): the id of the channel the thread was in
+            thread_id (int): the id of the deleted thread
+        """
+        self._archivedThreads.get(parent_id, {}).pop(thread_id, None)
+        self._queryHistory.pop(thread_id, None)
+        self._queriedThreads.pop(thread_id, None)
+
+    def recordQuery(self, thread: discord.Thread) -> None:
+        """Remember that a thread was returned by a lookup.
+
+        Args:
+            thread (discord.Thread): the thread returned by a lookup
+        """
+        history = self._queryHistory.setdefault(thread.id, deque())
+        history.append(time.monotonic())
+        self._queriedThreads[thread.id] = thread
+
+    def _isHot(self, thread_id: int) -> bool:
+        """Checks whether a thread has been requested often enough to keep it warm.
+
+        Lookups older than the history window are forgotten as a side effect.
+
+        Args:
+            thread_id (int): the id of the thread to check
+
+        Returns:
+            bool: whether or not the thread should be kept unarchived
+        """
+        history = self._queryHistory[thread_id]
+        cutoff = time.monotonic() - self._historyWindow
+        while history and history[0] < cutoff:
+            history.popleft()
+        return len(history) >= self._warmThreshold
+
+    async def ensureActive(self, thread: discord.Thread) -> int:
+        """Unarchives a thread, but only if it is actually archived.
+
+        Args:
+            thread (discord.Thread): the thread to make active
+
+        Returns:
+            int: the number of REST calls made
+        """
+        # every active thread is cached from the gateway, so if the guild knows about
+        # an unarchived version of this thread then there is nothing to do
+        current = thread.guild.get_thread(thread.id)
+        if current and not current.archived:
+            return 0
+        await thread.unarchive()
+        return 1
+
+    async def keepWarm(self) -> int:
+        """Unarchives every frequently requested thread that has been archived.
+
+        Threads that are no longer requested often are forgotten.
+
+        Returns:
+            int: the number of REST calls made
+        """
+        apiCalls = 0
+        for thread_id in list(self._queryHistory):
+            if not self._isHot(thread_id):
+                # forget threads that nobody has asked for within the history window
+                if not self._queryHistory[thread_id]:
+                    del self._queryHistory[thread_id]
+                    del self._queriedThreads[thread_id]
+                continue
+            try:
+                apiCalls += await self.ensureActive(self._queriedThreads[thread_id])
+            except discord.HTTPException as e:
+                logging.warning(f"Unable to keep thread {thread_id} warm: {e}")
+        if apiCalls:
+            logging.info(f"Thread housekeeping made {apiCalls} REST call(s)")
+            self._metrics.increment(
+                "neilbot_rest_calls_total", apiCalls, command="thread_housekeeping"
+            )
+        return apiCalls
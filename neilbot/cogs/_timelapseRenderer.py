@@ -0,0 +1,149 @@
+import asyncio
+import logging
+from pathlib import Path
+from typing import cast
+
+
+class TimelapseRenderer:
+    """Encodes webcam frames into timelapse videos with FFmpeg.
+
+    Frames are streamed into an FFmpeg subprocess one at a time, so rendering never
+    holds more than one frame in memory and never blocks the event loop. The most
+    recent render of each timelapse is kept on disk and reused until the frames it
+    was made from change.
+    """
+
+    # the number of frames shown per second in a timelapse
+    _FRAMERATE = 24
+
+    def __init__(self, directory: Path):
+        """Inits the timelapse renderer.
+
+        Args:
+            directory (Path): the directory to store rendered timelapses in
+        """
+        self._directory = directory
+        self._directory.mkdir(parents=True, exist_ok=True)
+
+        # maps a timelapse name to the key of its latest render and the rendered file
+        self._rendered: dict[str, tuple[tuple[int, int], Path]] = {}
+        # maps a timelapse name and render key to the render currently in progress
+        self._renders: dict[tuple[str, tuple[int, int]], asyncio.Task[Path | None]] = {}
+
+    async def render(self, name: str, frames: list[Path], sequence: int) -> Path | None:
+        """Get a timelapse video of some frames, only encoding it if needed.
+
+        Args:
+            name (str): a name for the timelapse that is unique to the camera and
+            length of time it covers
+            frames (list[Path]): the frame files to encode, oldest first
+            sequence (int): the sequence number of the newest frame, which changes
+            whenever a new frame is captured
+
+        Returns:
+            Path | None: the rendered video, or None if it could not be rendered
+        """
+        key = (sequence, len(frames))
+        rendered = self._rendered.get(name)
+        if rendered and rendered[0] == key and rendered[1].exists():
+            return rendered[1]
+
+        # share a render that is already in progress for the same frames
+        render = self._renders.get((name, key))
+        if render is None:
+            render = asyncio.create_task(self._renderAndStore(name, key, frames))
+            self._renders[(name, key)] = render
+        return await asyncio.shield(render)
+
+    async def _renderAndStore(
+        self, name: str, key: tuple[int, int], frames: list[Path]
+    ) -> Path | None:
+        """Encode a timelapse video and replace the previous render of it.
+
+        Args:
+            name (str): the name of the timelapse
+            key (tuple[int, int]): identifies the frames in this render
+            frames (list[Path]): the frame files to encode, oldest first
+
+        Returns:
+            Path | None: the rendered video, or None if it could not be rendered
+        """
+        try:
+            output = self._directory / f"{name}-{key[0]}-{key[1]}.mp4"
+            if not await self._encode(frames, output):
+                return None
+            previous = self._rendered.get(name)
+            self._rendered[name] = (key, output)
+            if previous and previous[1] != output:
+                previous[1].unlink(missing_ok=True)
+            return output
+        finally:
+            del self._renders[(name, key)]
+
+    async def _encode(self, frames: list[Path], output: Path) -> bool:
+        """Stream frames into FFmpeg to encode them into an MP4 video.
+
+        Args:
+            frames (list[Path]): the frame files to encode, oldest first
+            output (Path): the file to write the video to
+
+        Returns:
+            bool: whether or not the video was encoded successfully
+        """
+        try:
+            process = await asyncio.create_subprocess_exec(
+                "ffmpeg",
+                "-y",
+                "-f",
+                "image2pipe",
+                "-framerate",
+                str(self._FRAMERATE),
+                "-i",
+                "pipe:0",
+                # H.264 needs even dimensions, and keep the video small enough to
+                # upload to Discord
+                "-vf",
+                "scale='min(1280,iw)':-2",
+                "-c:v",
+                "libx264",
+                "-preset",
+                "veryfast",
+                "-crf",
+                "28",
+                "-pix_fmt",
+                "yuv420p",
+                "-movflags",
+                "+faststart",
+                str(output),
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+        except FileNotFoundError:
+            logging.error("Unable to render timelapse: FFmpeg is not installed")
+            return False
+
+        # the process was started with a pipe for stdin
+        stdin = cast(asyncio.StreamWriter, process.stdin)
+        try:
+            for frame in frames:
+                # read each frame off the event loop, and wait for FFmpeg to accept
+                # it before reading the next one
+                stdin.write(await asyncio.to_thread(frame.read_bytes))
+                await stdin.drain()
+        except FileNotFoundError:
+            # a frame was removed while rendering, so render without the rest
+            pass
+        except (BrokenPipeError, ConnectionResetError):
+            # FFmpeg exited early, and the exit code says why
+            pass
+        finally:
+            stdin.close()
+
+        if await process.wait() != 0:
+            logging.error(
+                f"Unable to render timelapse: FFmpeg exited {process.returncode}"
+            )
+            output.unlink(missing_ok=True)
+            return False
+        return True
@@ -0,0 +1,22 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Track:
+    """A song in a music queue, with only the information needed to play it.
+
+    Tracks are compared by identity, so the same song queued twice is two different
+    tracks.
+
+    Attributes:
+        title (str): the name of the song
+        url (str): the URL the song is downloaded from
+        source (str): the name of the platform the song is from
+        duration (float | None): the length of the song in seconds, or None if it is
+        unknown
+    """
+
+    title: str
+    url: str
+    source: str
+    duration: float | None = None
@@ -0,0 +1,272 @@
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from collections.abc import Awaitable, Callable
+from contextlib import AbstractAsyncContextManager, nullcontext
+from datetime import datetime, timezone
+
+import aiohttp
+
+from neilbot.cogs._cameraRegistry import Camera
+from neilbot.cogs._memoryUsage import deepSize
+from neilbot.cogs._snapshotCache import SnapshotCache
+from neilbot.neilbot import NeilBot
+
+
+class WebcamPoller:
+    """Polls webcams in the background so photos are ready before they are asked for.
+
+    Each poll is a conditional request, so a camera that has not refreshed its image
+    only sends back an empty response, and images that are identical to the previous
+    one are not stored again. Cameras are polled at their refresh interval while
+    people are asking for photos of them and gradually slower while nobody is.
+    Without polling, for example in all but one cluster, photos are downloaded when
+    they are asked for and shared by requests close together.
+    """
+
+    def __init__(
+        self,
+        bot: NeilBot,
+        cameras: list[Camera],
+        on_new_frame: Callable[[Camera, bytes, bytes], Awaitable[None]] | None = None,
+        max_interval: float = 600,
+        active_window: float = 600,
+        poll: bool = True,
+    ):
+        """Inits the webcam poller and schedules a polling job for every camera.
+
+        Cameras that capture timelapse frames are always polled at least as often as
+        their capture interval.
+
+        Args:
+            bot (NeilBot): the Discord bot whose scheduler and HTTP client are used
+            cameras (list[Camera]): the webcams to poll
+            on_new_frame (Callable[[Camera, bytes, bytes], Awaitable[None]] | None,
+            optional): method called with the camera, image and image hash whenever
+            a camera has a new image. Defaults to None.
+            max_interval (float, optional): the maximum number of seconds between
+            polls while a camera is not in use. Defaults to 600.
+            active_window (float, optional): how many seconds after a photo was last
+            asked for that a camera is still considered in use. Defaults to 600.
+            poll (bool, optional): whether or not to poll the cameras in the
+            background. Defaults to True.
+        """
+        self.bot = bot
+        self._onNewFrame = on_new_frame
+        self._polling = poll
+        self._maxInterval = max_interval
+        self._activeWindow = active_window
+
+        # maps a camera name to the camera
+        self._cameras = {camera.name: camera for camera in cameras}
+        self._snapshots = SnapshotCache(self._download)
+
+        # maps a camera name to the ETag and Last-Modified headers of its latest image
+        self._validators: dict[str, tuple[str | None, str | None]] = {}
+        # maps a camera name to its latest image and the hash of that image
+        self._images: dict[str, tuple[bytes, bytes]] = {}
+        # maps a camera name to the last time a photo was asked for
+        self._lastRequested: dict[str, float] = {}
+        # maps a camera name to the current number of seconds between polls
+        self._intervals: dict[str, float] = {}
+
+        for camera in cameras:
+            self._intervals[camera.name] = camera.refreshInterval
+            if not poll:
+                continue
+            # poll straight away so there is a photo ready for the first request.
+            # The scheduler only starts once the bot is ready, well after this
+            # first run is due, so late runs are not skipped as missed, and runs
+            # that piled up while the loop was busy are run once
+            self.bot.scheduler.add_job(
+                self._poll,
+                "interval",
+                seconds=camera.refreshInterval,
+                args=[camera],
+                id=self._jobID(camera),
+                next_run_time=datetime.now(timezone.utc),
+                misfire_grace_time=None,
+                coalesce=True,
+            )
+
+    @staticmethod
+    def _jobID(camera: Camera) -> str:
+        """Get the ID of the scheduler job that polls a webcam.
+
+        Args:
+            camera (Camera): the webcam
+
+        Returns:
+            str: the ID of the polling job
+        """
+        return f"webcam-poll:{camera.name}"
+
+    async def getPhoto(
+        self,
+        camera: Camera,
+        admission: AbstractAsyncContextManager[None] | None = None,
+    ) -> bytes | None:
+        """Get the latest photo from a webcam.
+
+        The photo is usually already downloaded by the background poll, in which case
+        no request is made to the camera.
+
+        Args:
+            camera (Camera): the webcam to get a photo from
+            admission (AbstractAsyncContextManager[None] | None, optional): entered
+            around the download if the photo has to be downloaded, such as a turn
+            from the admission controller. Defaults to None.
+
+        Returns:
+            bytes | None: the image in bytes, or None if it could not be downloaded
+        """
+        self._lastRequested[camera.name] = time.monotonic()
+        # the camera is in use again, so go back to polling it quickly
+        self._setInterval(camera, camera.refreshInterval)
+        # photos are served from the cache as long as they are from the last couple
+        # of polls, so that a slow poll doesn't send a request to the camera
+        image = self._snapshots.cached(camera.name, ttl=2 * camera.refreshInterval)
+        if image is not None:
+            return image
+        async with admission or nullcontext():
+            return await self._snapshots.refresh(camera.name)
+
+    def memoryUsage(self) -> tuple[int, int]:
+        """Measure the latest images that are kept for each camera.
+
+        Returns:
+            tuple[int, int]: the number of images and roughly how many bytes they use
+        """
+        return len(self._images), deepSize(self._images)
+
+    def _setInterval(self, camera: Camera, interval: float) -> None:
+        """Change how often a webcam is polled.
+
+        Args:
+            camera (Camera): the webcam
+            interval (float): the number of seconds between polls
+        """
+        if self._polling and self._intervals.get(camera.name) != interval:
+            self._intervals[camera.name] = interval
+            self.bot.scheduler.reschedule_job(
+                self._jobID(camera), trigger="interval", seconds=interval
+            )
+
+    async def _poll(self, camera: Camera) -> None:
+        """Download the latest image from a webcam and adjust the polling interval.
+
+        Args:
+            camera (Camera): the webcam to poll
+        """
+        await self._snapshots.refresh(camera.name)
+
+        idle = time.monotonic() - self._lastRequested.get(camera.name, -math.inf)
+        if idle < self._activeWindow:
+            self._setInterval(camera, camera.refreshInterval)
+        else:
+            # back off while nobody is asking for photos from this camera, but keep
+            # capturing timelapse frames
+            maxInterval = self._maxInterval
+            if camera.timelapseFrames:
+                maxInterval = min(maxInterval, camera.captureInterval)
+            self._setInterval(
+                camera, min(self._intervals[camera.name] * 2, maxInterval)
+            )
+
+    async def _download(self, name: str) -> bytes | None:
+        """Download a webcam image, recording how long it took or that it failed.
+
+        Args:
+            name (str): the name of the webcam
+
+        Returns:
+            bytes | None: the image in bytes. If an error occurred while downloading,
+            then None is returned.
+        """
+        camera = self._cameras[name]
+        start = time.perf_counter()
+        try:
+            image = await self._conditionalDownload(camera)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.warning(f"Unable to download image from {camera.label}: {e!r}")
+            image = None
+        if image is None:
+            camera.recordError()
+        else:
+            camera.recordDownload(time.perf_counter() - start)
+        return image
+
+    async def _conditionalDownload(self, camera: Camera) -> bytes | None:
+        """Download a webcam image, reusing the previous image if it is unchanged.
+
+        Args:
+            camera (Camera): the webcam to download from
+
+        Returns:
+            bytes | None: the image in bytes, or None if the camera did not send back
+            a usable image
+        """
+        previous = self._images.get(camera.name)
+        etag, lastModified = self._validators.get(camera.name, (None, None))
+        headers = {}
+        # only ask for the image if it has changed since the previous one
+        if previous and etag:
+            headers["If-None-Match"] = etag
+        if previous and lastModified:
+            headers["If-Modified-Since"] = lastModified
+
+        # send a get request to the url
+        async with self.bot.httpClient.get(
+            camera.url,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=camera.timeout),
+        ) as resp:
+            # the camera has not refreshed the image since the previous request
+            if resp.status == 304 and previous:
+                return previous[0]
+            # check if response is OK
+            if resp.status != 200:
+                logging.warning(
+                    f"Unable to download image from {camera.label}: {resp.status}"
+                )
+                return None
+            image = await self._readLimited(resp, camera.maxSize)
+            if image is None:
+                return None
+            self._validators[camera.name] = (
+                resp.headers.get("ETag"),
+                resp.headers.get("Last-Modified"),
+            )
+
+        # cameras without caching headers send the whole image every time, so
+        # compare hashes to keep the previous image if nothing has changed
+        digest = hashlib.sha256(image).digest()
+        if previous and previous[1] == digest:
+            return previous[0]
+        self._images[camera.name] = (image, digest)
+        if self._onNewFrame:
+            await self._onNewFrame(camera, image, digest)
+        return image
+
+    @staticmethod
+    async def _readLimited(resp: aiohttp.ClientResponse, max_size: int) -> bytes | None:
+        """Read a response body, giving up if it is larger than a maximum size.
+
+        Args:
+            resp (aiohttp.ClientResponse): the response to read
+            max_size (int): the largest body in bytes to read
+
+        Returns:
+            bytes | None: the response body, or None if it was too large
+        """
+        if resp.content_length is not None and resp.content_length > max_size:
+            return None
+        body = bytearray()
+        # read in chunks so that a response without a length can't use up memory
+        async for chunk in resp.content.iter_chunked(64 * 1024):
+            body += chunk
+            if len(body) > max_size:
+                return None
+        return bytes(body)
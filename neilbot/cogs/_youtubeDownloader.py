@@ -1,32 +1,100 @@
 import asyncio
 import functools
+import importlib
+import logging
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import weakref
 from collections.abc import Callable
-from typing import Any
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import ModuleType
+from typing import Any, TypeVar
 
-import aiohttp
 import validators
-import yt_dlp
 
+from neilbot.cogs._downloader import DownloadError
+from neilbot.cogs._memoryUsage import deepSize
+from neilbot.cogs._track import Track
+from neilbot.httpClient import HttpClient
+from neilbot.metrics import Metrics
 
-class YouTubeDownloader:
-    """Uses the Downloader protocol and downloads songs from YouTube."""
+T = TypeVar("T")
 
-    def __init__(self):
-        # store information about the song
-        self._songInfo: dict[str, Any] | None = None
 
-        # setup options for YouTube downloader
-        self._YDL_OPTIONS = {
-            "format": "bestaudio",
-            "postprocessors": [
-                {
-                    "key": "FFmpegExtractAudio",
-                    "preferredcodec": "mp3",
-                    "preferredquality": "192",
-                }
-            ],
-            "outtmpl": "song.%(ext)s",
-        }
+@functools.cache
+def _importYtDlp() -> ModuleType:
+    """Import yt_dlp the first time it is needed.
+
+    yt_dlp imports hundreds of extractor modules, so it is not imported when the bot
+    starts up in case nobody plays any music.
+
+    Returns:
+        ModuleType: the yt_dlp module
+    """
+    start = time.perf_counter()
+    yt_dlp = importlib.import_module("yt_dlp")
+    logging.info(f"Imported yt_dlp in {time.perf_counter() - start:.2f}s")
+    return yt_dlp
+
+
+class YouTubeDownloader:
+    """Uses the Downloader protocol and downloads songs from YouTube.
+
+    One instance is shared by every server. yt_dlp runs on a small pool of worker
+    threads, and each worker keeps its own YoutubeDL instance for as long as it
+    lives, so the extractors, cookies and connections are set up once per worker
+    instead of once per call. Each search result keeps the few fields that say
+    which extractor and video it is for a while, so downloading it does not search or
+    match extractors again. Every download has its
+    own file in a directory of this process, so songs downloaded at the same time,
+    or by other clusters, never overwrite each other.
+    """
+
+    # setup options for YouTube downloader
+    _YDL_OPTIONS = {
+        "format": "bestaudio",
+        "postprocessors": [
+            {
+                "key": "FFmpegExtractAudio",
+                "preferredcodec": "mp3",
+                "preferredquality": "192",
+            }
+        ],
+    }
+    # the field given to yt_dlp with the unique name of each download
+    _NAME_FIELD = "neilbot_download"
+    # the most songs whose extracted information is kept for downloading
+    _MAX_INFOS = 100
+    # how many seconds extracted information is kept for, well before YouTube's
+    # stream URLs expire
+    _INFO_TTL = 60 * 60
+
+    def __init__(self, http_client: HttpClient, metrics: Metrics, workers: int = 2):
+        """Inits the YouTube downloader.
+
+        Args:
+            http_client (HttpClient): the client used to check that videos exist
+            metrics (Metrics): the metrics to record yt_dlp timings in
+            workers (int, optional): the maximum number of yt_dlp calls that run at
+            the same time. Defaults to 2.
+        """
+        self._httpClient = http_client
+        self._metrics = metrics
+        self._directory = Path(tempfile.mkdtemp(prefix="neilbot-songs-"))
+        # remove the songs when the downloader is garbage collected or the bot exits
+        weakref.finalize(self, shutil.rmtree, self._directory, True)
+
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="yt-dlp")
+        # each worker thread keeps its YoutubeDL instance here
+        self._workerState = threading.local()
+        # maps a song found by a search to when it was found and the fields needed
+        # to download it. Tracks are compared by identity, so each search result has
+        # its own entry
+        self._infos: dict[Track, tuple[float, dict[str, Any]]] = {}
 
     @staticmethod
     def getSource() -> str:
@@ -37,155 +105,265 @@ class YouTubeDownloader:
         """
         return "YouTube"
 
-    @staticmethod
-    def _to_thread(func: Callable) -> Any:
-        """Helper method to run synchronous code asynchronously in a separate thread.
+    def _callOnWorker(self, call: Callable[[Any], T]) -> tuple[T, float, float]:
+        """Run a call with this worker thread's YoutubeDL, creating it if needed.
 
         Args:
-            func (Callable): a synchronous function to run asynchronously
+            call (Callable[[Any], T]): the call to run with the YoutubeDL instance
 
         Returns:
-            Any: the return result of func
+            tuple[T, float, float]: the result of the call, how many seconds it took
+            to create the YoutubeDL instance (or 0 if it already existed), and how
+            many seconds the call took
         """
+        construction = 0.0
+        ydl = getattr(self._workerState, "ydl", None)
+        if ydl is None:
+            start = time.perf_counter()
+            ydl = _importYtDlp().YoutubeDL(
+                {
+                    **self._YDL_OPTIONS,
+                    # each download names its own file, so one instance can be
+                    # reused for every download
+                    "outtmpl": str(self._directory / f"%({self._NAME_FIELD})s.%(ext)s"),
+                }
+            )
+            construction = time.perf_counter() - start
+            self._workerState.ydl = ydl
+        start = time.perf_counter()
+        result = call(ydl)
+        return result, construction, time.perf_counter() - start
 
-        @functools.wraps(func)
-        async def wrapper(*args, **kwargs):
-            return await asyncio.to_thread(func, *args, **kwargs)
+    async def _run(self, operation: str, call: Callable[[Any], T]) -> T:
+        """Run a call with a pooled YoutubeDL instance and record how long it took.
 
-        return wrapper
+        Args:
+            operation (str): the name of the call, used to label its metrics
+            call (Callable[[Any], T]): the call to run with the YoutubeDL instance
 
-    async def _getURLFromURLorSearch(self, url_or_search: str) -> str | None:
-        """Get the URL for a YouTube URL or search.
+        Returns:
+            T: the result of the call
+        """
+        loop = asyncio.get_running_loop()
+        result, construction, duration = await loop.run_in_executor(
+            self._executor, self._callOnWorker, call
+        )
+        # metrics are only recorded from the event loop, never from the workers
+        if construction:
+            self._metrics.observe(
+                "neilbot_ytdlp_seconds", construction, operation="construct"
+            )
+        self._metrics.observe("neilbot_ytdlp_seconds", duration, operation=operation)
+        return result
+
+    def memoryUsage(self) -> tuple[int, int]:
+        """Measure the search results kept for downloading.
 
-        If a URL is provided, the URL is validated to confirm it leads to a YouTube
-        video.
+        Returns:
+            tuple[int, int]: the number of search results and roughly how many bytes
+            they use, not counting the songs themselves
+        """
+        return len(self._infos), deepSize(self._infos)
 
-        If a search query is provided, a URL to the first search result is returned. If
-        no search results are found, then None is returned.
+    def discard(self, tracks: list[Track]) -> None:
+        """Forget search results that will never be downloaded.
 
         Args:
-            url_or_search (str): either a YouTube url or a search query
-
-        Returns:
-            str | None: A valid YouTube video URL, or None if no video is found
+            tracks (list[Track]): the search results
         """
-        with yt_dlp.YoutubeDL(self._YDL_OPTIONS) as ydl:
-            # check if string is a valid url, that it contains the youtube.com domain,
-            # and that the URL leads to a valid YouTube video
-            if (
-                validators.url(url_or_search)
-                and "youtube.com" in url_or_search.lower()
-                and await self._validYouTubeVideo(url_or_search)
-            ):
-                return url_or_search
-            else:
-                # url_or_search is a search query
-                search_results = ydl.sanitize_info(
-                    ydl.extract_info(f"ytsearch:{url_or_search}", download=False)
-                )["entries"]
-                # if search query returned results
-                if search_results:
-                    video: dict[str, Any] | None = search_results[0]
-                    # if we found a matching video, then return the video url
-                    if video:
-                        return video["webpage_url"]
-        # if the URL was not valid or the search query did not return any results,
-        # then return None
-        return None
-
-    async def _validYouTubeVideo(self, url: str) -> bool:
-        """Checks whether a YouTube URL leads to a valid YouTube video.
+        for track in tracks:
+            self._infos.pop(track, None)
 
-        Assumes that url is a valid url to the YouTube website.
+    def _toTrack(self, info: dict[str, Any]) -> Track:
+        """Turn a video into a song, keeping what is needed to download it.
 
         Args:
-            url (str): A valid url to YouTube.com
+            info (dict[str, Any]): the information yt_dlp extracted about the video,
+            which may be a flat search result that only has a few fields
 
         Returns:
-            bool: whether or not the url leads to a valid YouTube video.
+            Track: the video as a song
         """
-        # start an aiohttp client session
-        async with aiohttp.ClientSession() as session:
-            # send a get request to the url
-            async with session.get(url) as resp:
-                # check if response is OK
-                if resp.status == 200:
-                    # read the response stream
-                    content = await resp.text()
-                    return "Video unavailable" not in content
-        return False
+        track = Track(
+            title=info.get("title") or info["url"],
+            url=info.get("webpage_url") or info["url"],
+            source=self.getSource(),
+            duration=info.get("duration"),
+        )
+        # dicts keep their insertion order, so the first entry is the oldest
+        now = time.monotonic()
+        while self._infos and (
+            len(self._infos) >= self._MAX_INFOS
+            or now - next(iter(self._infos.values()))[0] >= self._INFO_TTL
+        ):
+            del self._infos[next(iter(self._infos))]
+        # a full extraction holds every format of the video, so only what yt_dlp
+        # needs to go straight to the right extractor is kept
+        self._infos[track] = (
+            now,
+            {
+                "_type": "url",
+                "url": track.url,
+                "ie_key": info.get("ie_key") or info.get("extractor_key"),
+                "id": info.get("id"),
+            },
+        )
+        return track
+
+    def _takeInfo(self, track: Track) -> dict[str, Any] | None:
+        """Take what was kept about a song while searching for it.
 
-    async def _getVideoInformation(self, url: str) -> None:
-        """Fetch information about a song using the song URL.
+        Args:
+            track (Track): the song
 
-        Assumes the given URL is valid.
+        Returns:
+            dict[str, Any] | None: the fields needed to download the song, or None if
+            they were not kept or are too old to download with
+        """
+        found, info = self._infos.pop(track, (0.0, None))
+        return info if time.monotonic() - found < self._INFO_TTL else None
+
+    async def _extract(self, url: str) -> dict[str, Any] | None:
+        """Extract the information about a video.
 
         Args:
-            url (str): A valid YouTube video URL
+            url (str): a YouTube video URL
+
+        Returns:
+            dict[str, Any] | None: the extracted information
         """
-        with yt_dlp.YoutubeDL(self._YDL_OPTIONS) as ydl:
-            self._songInfo = ydl.sanitize_info(ydl.extract_info(url, download=False))
+        return await self._run(
+            "extract", lambda ydl: ydl.extract_info(url, download=False)
+        )
 
-    async def validateAndStoreURLOrSearch(self, url_or_search: str) -> bool:
-        """Validates a URL or search query to make sure it leads to a YouTube video.
+    async def _flatSearch(self, query: str, limit: int) -> list[dict[str, Any]]:
+        """Search YouTube without extracting each result.
 
-        If the URL or search query is valid, information about the song is stored as
-        well.
+        The search results page already has the title, URL and length of every
+        video, so the results are returned without visiting each video, which makes
+        the whole search a single request.
 
         Args:
-            url_or_search (str): either a YouTube URL or search query
+            query (str): what to search for
+            limit (int): the most results to return
 
         Returns:
-            bool: whether or not the URL or search query is valid
+            list[dict[str, Any]]: the flat information about each result
         """
-        url = await self._getURLFromURLorSearch(url_or_search)
-        if url:
-            await self._getVideoInformation(url)
-            return True
-        return False
 
-    @_to_thread
-    def _downloadFromYouTube(self, url) -> str:
-        """Downloads the song from YouTube using the given URL.
+        def search(ydl: Any) -> list[dict[str, Any]]:
+            # without processing, the entries are read straight off the search page
+            results = ydl.extract_info(
+                f"ytsearch{limit}:{query}", download=False, process=False
+            )
+            return [entry for entry in results.get("entries") or [] if entry]
+
+        return await self._run("search", search)
+
+    @staticmethod
+    def _isYouTubeURL(url_or_search: str) -> bool:
+        """Checks whether a string is a URL to the YouTube website.
+
+        Args:
+            url_or_search (str): either a URL or a search query
 
         Returns:
-            str: the filename of the downloaded song
+            bool: whether or not the string is a YouTube URL
         """
-        with yt_dlp.YoutubeDL(self._YDL_OPTIONS) as ydl:
-            ydl.download(url)
-            return "song.mp3"
+        return bool(validators.url(url_or_search)) and (
+            "youtube.com" in url_or_search.lower()
+        )
 
-    async def downloadSong(self) -> str | None:
-        """Downloads the song from YouTube using the information stored in this object.
+    async def _validYouTubeVideo(self, url: str) -> bool:
+        """Checks whether a YouTube URL leads to a valid YouTube video.
 
-        If no information has already been stored, then None is returned.
+        Assumes that url is a valid url to the YouTube website.
+
+        Args:
+            url (str): A valid url to YouTube.com
 
         Returns:
-            str | None: the filename of the downloaded song, or None if no song
-            information is stored.
+            bool: whether or not the url leads to a valid YouTube video.
         """
-        url = self.getSongURL()
-        if url:
-            filename = await self._downloadFromYouTube(url)
-            return filename
-        return None
+        # send a get request to the url, reusing the bot's pooled connections
+        async with self._httpClient.get(url) as resp:
+            # check if response is OK
+            if resp.status == 200:
+                # read the response stream
+                content = await resp.text()
+                return "Video unavailable" not in content
+        return False
 
-    def getSongName(self) -> str | None:
-        """Get the name of the song from the information stored in the object.
+    async def search(self, url_or_search: str, limit: int = 1) -> list[Track]:
+        """Find the YouTube videos that a URL or search query leads to.
+
+        If a URL is provided, the URL is validated to confirm it leads to a YouTube
+        video. If a search query is provided, the top results are found with a
+        single flat search.
+
+        Args:
+            url_or_search (str): either a YouTube URL or search query
+            limit (int, optional): the most search results to return. Defaults to 1.
 
-        If no information has already been stored, then None is returned.
+        Raises:
+            DownloadError: the video information could not be fetched from YouTube
 
         Returns:
-            str | None: the song name, or None if no song information is stored.
+            list[Track]: the matching videos, best match first, which is empty if the
+            URL is not a valid video or the search did not return any results
         """
-        return self._songInfo["title"] if self._songInfo else None
+        # the first import takes a while, so keep it off the event loop
+        yt_dlp = await asyncio.to_thread(_importYtDlp)
+        try:
+            # check if string is a valid url, that it contains the youtube.com domain,
+            # and that the URL leads to a valid YouTube video
+            if self._isYouTubeURL(url_or_search) and await self._validYouTubeVideo(
+                url_or_search
+            ):
+                info = await self._extract(url_or_search)
+                return [self._toTrack(info)] if info else []
 
-    def getSongURL(self) -> str | None:
-        """Get the URL of the song from the information stored in the object.
+            # url_or_search is a search query
+            results = await self._flatSearch(url_or_search, limit)
+            return [self._toTrack(entry) for entry in results]
+        # flat search results are read outside of yt_dlp's error handling, so their
+        # extractor errors are not turned into download errors
+        except (yt_dlp.utils.DownloadError, yt_dlp.utils.ExtractorError) as e:
+            raise DownloadError(str(e)) from e
 
-        If no information has already been stored, then None is returned.
+    async def download(self, track: Track) -> str:
+        """Downloads a song from YouTube.
+
+        Args:
+            track (Track): the song to download
+
+        Raises:
+            DownloadError: the song could not be downloaded from YouTube
 
         Returns:
-            str | None: the song URL, or None if no song information is stored.
+            str: the filename of the downloaded song, which the caller removes once
+            the song has finished playing
         """
-        return self._songInfo["webpage_url"] if self._songInfo else None
+        yt_dlp = await asyncio.to_thread(_importYtDlp)
+        info = self._takeInfo(track)
+        name = uuid.uuid4().hex
+        extra = {self._NAME_FIELD: name}
+        try:
+            if info:
+                # the kept result is resolved with its own extractor, without
+                # searching or matching extractors again
+                await self._run(
+                    "download",
+                    lambda ydl: ydl.process_ie_result(
+                        info, download=True, extra_info=extra
+                    ),
+                )
+            else:
+                await self._run(
+                    "download",
+                    lambda ydl: ydl.extract_info(track.url, extra_info=extra),
+                )
+            # the audio is always converted to MP3 after downloading
+            return str(self._directory / f"{name}.mp3")
+        except yt_dlp.utils.DownloadError as e:
+            raise DownloadError(str(e)) from e
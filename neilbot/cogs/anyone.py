@@ -1,5 +1,9 @@
+import asyncio
+import logging
 import random
-from typing import cast
+from collections import defaultdict
+from collections.abc import Coroutine
+from typing import Any, cast
 
 import discord
 from discord.ext import commands
@@ -14,6 +18,9 @@ class Anyone(commands.Cog):
         bot (NeilBot): the instance of the Discord bot this cog is added to
     """
 
+    # the maximum number of role edits sent at the same time for a single server
+    _MAX_CONCURRENT_ROLE_EDITS = 5
+
     def __init__(self, bot: NeilBot):
         """Inits the Anyone cog.
 
@@ -22,28 +29,136 @@ class Anyone(commands.Cog):
         """
         self.bot = bot
 
+        # role edits for a server all share the same rate limit bucket, so limit how
+        # many are in flight at once for each server instead of letting them pile up
+        # on the rate limit
+        self._roleEditLimits: defaultdict[int, asyncio.Semaphore] = defaultdict(
+            lambda: asyncio.Semaphore(self._MAX_CONCURRENT_ROLE_EDITS)
+        )
+
+    async def _limitedRoleEdit(
+        self, serverID: int, edit: Coroutine[Any, Any, None]
+    ) -> None:
+        """Sends a role edit once the server has room for another edit in flight.
+
+        Args:
+            serverID (int): the ID of the server the role edit is for
+            edit (Coroutine[Any, Any, None]): the role edit request to send
+        """
+        async with self._roleEditLimits[serverID]:
+            await edit
+
+    async def _reassignRole(
+        self,
+        member: discord.Member,
+        role: discord.Role,
+        holders: list[discord.Member],
+    ) -> int:
+        """Give a role to one member and remove it from everyone else who has it.
+
+        Only members that actually need to change are edited, and the edits are sent
+        concurrently.
+
+        Args:
+            member (discord.Member): the server member to give the role to
+            role (discord.Role): the role to reassign
+            holders (list[discord.Member]): the server members that currently have
+            the role
+
+        Returns:
+            int: the number of REST calls made
+        """
+        snowflake = cast(discord.abc.Snowflake, role)
+        # only the members that currently have the role need it removed
+        edits = [m.remove_roles(snowflake) for m in holders if m != member]
+        if role not in member.roles:
+            edits.append(member.add_roles(snowflake))
+
+        await asyncio.gather(
+            *(self._limitedRoleEdit(member.guild.id, edit) for edit in edits)
+        )
+        return len(edits)
+
+    async def _streamMembers(
+        self, server: discord.Guild, role: discord.Role, pick: bool
+    ) -> tuple[discord.Member | None, list[discord.Member], int]:
+        """Streams every server member from Discord without caching them.
+
+        While streaming, every member that has the role is collected, and one member
+        is picked at random if asked, so that only a single pass over the members is
+        needed.
+
+        Args:
+            server (discord.Guild): the server to stream members from
+            role (discord.Role): the role to find the current members of
+            pick (bool): whether or not to pick a random member
+
+        Returns:
+            tuple[discord.Member | None, list[discord.Member], int]: a random server
+            member, or None if one was not picked, the server members that have the
+            role, and the number of REST calls made
+        """
+        chosen: discord.Member | None = None
+        holders: list[discord.Member] = []
+        count = 0
+        async for m in server.fetch_members(limit=None):
+            count += 1
+            # reservoir sampling: the nth member replaces the current choice with
+            # probability 1/n, which makes every member equally likely to be chosen
+            # without having to store all of them
+            if pick and random.randrange(count) == 0:
+                chosen = m
+            if role in m.roles:
+                holders.append(m)
+        # members are listed 1000 at a time, and listing stops at the first page
+        # with fewer than 1000 members
+        apiCalls = count // 1000 + 1
+        return chosen, holders, apiCalls
+
     async def _anyone_helper(
         self,
         ctx: discord.ApplicationContext,
-        all_members: list[discord.Member],
-        member: discord.Member,
         role: discord.Role,
+        member: discord.Member | None = None,
     ) -> None:
         """Remove a role from all server members and add a role to one member.
 
+        If the server members can be cached then the cache is used, otherwise the
+        server members are streamed from Discord.
+
         Args:
             ctx (discord.ApplicationContext): the Discord application context
-            all_members (list[discord.Member]): all server members
-            member (discord.Member): a specific server member to add a role to
             role (discord.Role): the role to add to one member
+            member (discord.Member | None, optional): a specific server member to add
+            a role to, or None to add the role to a random member. Defaults to None.
         """
+        server = role.guild
+        command = ctx.command.qualified_name
         try:
-            # remove the 'anyone' role from everyone in the server
-            for m in all_members:
-                await m.remove_roles(cast(discord.abc.Snowflake, role))
-
-            # add the 'anyone' role to the random user
-            await member.add_roles(cast(discord.abc.Snowflake, role))
+            # listing members and moving roles share a budget with every server
+            async with self.bot.admission.admit(ctx, "role_edit"):
+                with self.bot.metrics.phase(command, "members"):
+                    # a chunked server has every member cached, along with who has
+                    # the role
+                    if await self.bot.ensureChunked(server):
+                        holders = role.members
+                        chosen = None if member else random.choice(server.members)
+                        apiCalls = 0
+                    else:
+                        chosen, holders, apiCalls = await self._streamMembers(
+                            server, role, member is None
+                        )
+                # the bot itself is always a member of the server, so a member is
+                # always picked when asked for
+                member = member or cast(discord.Member, chosen)
+
+                # move the 'anyone' role from whoever has it to the chosen user
+                with self.bot.metrics.phase(command, "reassign"):
+                    apiCalls += await self._reassignRole(member, role, holders)
+            logging.info(f"/{command} made {apiCalls} REST call(s)")
+            self.bot.metrics.increment(
+                "neilbot_rest_calls_total", apiCalls, command=command
+            )
 
             await ctx.respond(f"Set {role.mention} to {member.mention}!")
         except discord.Forbidden:
@@ -62,7 +177,8 @@ class Anyone(commands.Cog):
             ctx (discord.ApplicationContext): the Discord application context
         """
         # give us 15 minutes instead of 3 seconds to respond
-        await ctx.defer(ephemeral=False)
+        with self.bot.metrics.phase(ctx.command.qualified_name, "defer"):
+            await ctx.defer(ephemeral=False)
 
         # get the caller
         member = ctx.author
@@ -71,12 +187,10 @@ class Anyone(commands.Cog):
 
         # if the bot is not in the server
         if server:
-            # get all server members
-            all_members = server.members
             # get the 'anyone' role
             role: discord.Role | None = discord.utils.get(server.roles, name="anyone")
             if role:
-                await self._anyone_helper(ctx, all_members, member, role)
+                await self._anyone_helper(ctx, role, member)
             else:
                 await ctx.respond("Error: unable to find role 'anyone'")
 
@@ -94,23 +208,21 @@ class Anyone(commands.Cog):
             ctx (discord.ApplicationContext): the Discord application context
         """
         # give us 15 minutes instead of 3 seconds to respond
-        await ctx.defer(ephemeral=False)
+        with self.bot.metrics.phase(ctx.command.qualified_name, "defer"):
+            await ctx.defer(ephemeral=False)
 
         # get the server
         server = ctx.guild
 
         # if the bot is not in the server
         if server:
-            # get all server members
-            all_members = server.members
-            # get a random user
-            member = random.choice(all_members)
             # get the 'anyone' role
             role: discord.Role | None = discord.utils.get(
                 ctx.guild.roles, name="anyone"
             )
             if role:
-                await self._anyone_helper(ctx, all_members, member, role)
+                # let the helper pick a random user
+                await self._anyone_helper(ctx, role)
             else:
                 await ctx.respond("Error: unable to find role 'anyone'")
 
@@ -0,0 +1,244 @@
+import asyncio
+import gc
+import os
+import sys
+import tracemalloc
+from io import BytesIO
+from pathlib import Path
+
+import aiohttp
+import discord
+from discord.ext import commands
+
+from neilbot.cogs._stackSampler import StackSampler
+from neilbot.neilbot import NeilBot
+
+
+class Debug(commands.Cog):
+    """Discord Bot cog that includes owner-only slash commands for diagnosing the bot.
+
+    Attributes:
+        bot (NeilBot): the instance of the Discord bot this cog is added to
+    """
+
+    # only show the commands to server admins, and only let the owner run them
+    debug = discord.SlashCommandGroup(
+        "debug",
+        "Diagnose the bot while it is running",
+        default_member_permissions=discord.Permissions(administrator=True),
+    )
+
+    def __init__(self, bot: NeilBot):
+        """Inits the Debug cog.
+
+        Args:
+            bot (NeilBot): the Discord bot this cog is being added to
+        """
+        self.bot = bot
+
+        self._sampler = StackSampler()
+        # mutex lock so that only one profile runs at a time
+        self._profileLock = asyncio.Lock()
+        # the memory snapshot the next memory report is compared against
+        self._lastSnapshot: tracemalloc.Snapshot | None = None
+
+    @debug.command(name="profile", description="Profile the bot for a few seconds")
+    @discord.option(
+        "seconds",
+        int,
+        description="How many seconds to profile for",
+        min_value=1,
+        max_value=60,
+    )
+    @commands.is_owner()
+    async def profile(self, ctx: discord.ApplicationContext, seconds: int) -> None:
+        """Samples the stack of every thread and posts them as collapsed stacks.
+
+        Args:
+            ctx (discord.ApplicationContext): the Discord application context
+            seconds (int): how many seconds to profile for
+        """
+        # give us 15 minutes instead of 3 seconds to respond
+        await ctx.defer(ephemeral=True)
+
+        if self._profileLock.locked():
+            await ctx.respond("Error: a profile is already running")
+            return
+
+        async with self._profileLock:
+            # sample from a worker thread so the event loop keeps running normally
+            stacks, samples = await asyncio.to_thread(self._sampler.sample, seconds)
+        await ctx.respond(
+            f"Took {samples} samples over {seconds}s:",
+            file=discord.File(
+                BytesIO(stacks.encode()), filename=f"profile-{seconds}s.collapsed.txt"
+            ),
+        )
+
+    def _subsystemUsage(self) -> dict[str, tuple[int, int]]:
+        """Count the objects each part of the bot keeps alive and estimate their size.
+
+        Cogs report their own usage with a memoryUsage method. Walking every object
+        takes a while in a big bot, so this runs on a worker thread. It only reads,
+        and copies of built in containers are made in one step, so the event loop
+        can keep changing them.
+
+        Returns:
+            dict[str, tuple[int, int]]: maps a kind of object to how many are alive
+            and roughly how many bytes they use
+        """
+        usage: dict[str, tuple[int, int]] = {}
+        for cogName, cog in self.bot.cogs.items():
+            memoryUsage = getattr(cog, "memoryUsage", None)
+            if memoryUsage:
+                for kind, counts in memoryUsage().items():
+                    usage[f"{cogName}: {kind}"] = counts
+
+        members = [m for g in self.bot.guilds for m in g.members]
+        usage["member cache"] = (len(members), sum(map(sys.getsizeof, members)))
+        users = self.bot.users
+        usage["user cache"] = (len(users), sum(map(sys.getsizeof, users)))
+        views = self.bot.persistent_views
+        usage["persistent views"] = (len(views), sum(map(sys.getsizeof, views)))
+
+        # sessions that were never closed stay alive along with their connections
+        sessions = [o for o in gc.get_objects() if isinstance(o, aiohttp.ClientSession)]
+        unclosed = [s for s in sessions if not s.closed]
+        usage["open HTTP sessions"] = (len(unclosed), sum(map(sys.getsizeof, unclosed)))
+        return usage
+
+    @staticmethod
+    def _residentMemory() -> int | None:
+        """Get how much memory the process is using, on Linux.
+
+        Returns:
+            int | None: the resident set size in bytes, or None if it is unknown
+        """
+        try:
+            pages = int(Path("/proc/self/statm").read_text().split()[1])
+        except (OSError, IndexError, ValueError):
+            return None
+        return pages * os.sysconf("SC_PAGE_SIZE")
+
+    @staticmethod
+    def _compareSnapshots(
+        snapshot: tracemalloc.Snapshot, previous: tracemalloc.Snapshot
+    ) -> str:
+        """Describe which files and lines allocated the most between two snapshots.
+
+        Args:
+            snapshot (tracemalloc.Snapshot): the newer snapshot
+            previous (tracemalloc.Snapshot): the older snapshot
+
+        Returns:
+            str: the biggest changes by file and by line
+        """
+        # leave out the memory used to store the traces themselves
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ]
+        snapshot = snapshot.filter_traces(filters)
+        previous = previous.filter_traces(filters)
+        lines = ["Biggest changes by file:"]
+        lines += map(str, snapshot.compare_to(previous, "filename")[:15])
+        lines += ["", "Biggest changes by line:"]
+        lines += map(str, snapshot.compare_to(previous, "lineno")[:15])
+        return "\n".join(lines)
+
+    @debug.command(name="memory", description="Show what is using memory")
+    @commands.is_owner()
+    async def memory(self, ctx: discord.ApplicationContext) -> None:
+        """Posts how much memory each part of the bot uses and what has grown.
+
+        Memory allocations are traced from the first time this is run, and each
+        report shows which files and lines allocated the most since the last report.
+
+        Args:
+            ctx (discord.ApplicationContext): the Discord application context
+        """
+        # give us 15 minutes instead of 3 seconds to respond
+        await ctx.defer(ephemeral=True)
+
+        rss = self._residentMemory()
+        summary = f"Using {rss / 1e6:.1f}MB of memory" if rss else "Memory report"
+        lines = [summary, "", "Subsystems:"]
+        # counting objects walks every cache, so keep it off the event loop
+        usage = await asyncio.to_thread(self._subsystemUsage)
+        for kind, (count, size) in usage.items():
+            lines.append(f"  {kind}: {count} objects, about {size / 1000:.0f}KB")
+        lines.append("")
+
+        if not tracemalloc.is_tracing():
+            # tracing slows down allocations a little, so only start it when asked
+            tracemalloc.start(10)
+            lines.append("Started tracing allocations, run this again to compare")
+        # snapshots can take a while with lots of allocations traced
+        snapshot = await asyncio.to_thread(tracemalloc.take_snapshot)
+        if self._lastSnapshot:
+            lines.append(
+                await asyncio.to_thread(
+                    self._compareSnapshots, snapshot, self._lastSnapshot
+                )
+            )
+        self._lastSnapshot = snapshot
+
+        await ctx.respond(
+            f"{summary}:",
+            file=discord.File(
+                BytesIO("\n".join(lines).encode()), filename="memory.txt"
+            ),
+        )
+
+    @debug.command(name="clusters", description="Show the bot's shards and clusters")
+    @commands.is_owner()
+    async def clusters(self, ctx: discord.ApplicationContext) -> None:
+        """Posts which shards each cluster runs and whether the clusters are healthy.
+
+        When the bot is not run by the cluster launcher, only the shards of this
+        process are shown.
+
+        Args:
+            ctx (discord.ApplicationContext): the Discord application context
+        """
+        # give us 15 minutes instead of 3 seconds to respond
+        await ctx.defer(ephemeral=True)
+
+        lines = [
+            f"Shard {shardID}: {latency * 1000:.0f}ms latency"
+            for shardID, latency in self.bot.latencies
+        ]
+        controlURL = os.getenv("CLUSTER_CONTROL_URL")
+        if controlURL:
+            lines.insert(0, f"Cluster {os.getenv('CLUSTER_ID')} (this one):")
+            lines.append("")
+            try:
+                async with self.bot.httpClient.get(f"{controlURL}/clusters") as resp:
+                    clusters = await resp.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                clusters = []
+                lines.append("Error: could not reach the cluster launcher")
+            for cluster in clusters:
+                state = "running" if cluster["alive"] else "down"
+                lines.append(
+                    f"Cluster {cluster['cluster']}: {state}, pid {cluster['pid']}, "
+                    f"shards {cluster['shards']}, {cluster['restarts']} restarts, "
+                    f"up for {cluster['uptime'] / 60:.0f} minutes"
+                )
+
+        # there can be too many shards to fit in one message
+        await ctx.respond(
+            f"Running {self.bot.shard_count} shards:",
+            file=discord.File(
+                BytesIO("\n".join(lines).encode()), filename="clusters.txt"
+            ),
+        )
+
+
+def setup(bot: NeilBot) -> None:
+    """Attach the Debug cog to a Discord bot.
+
+    Args:
+        bot (NeilBot): the Discord bot to add the Debug cog to
+    """
+    bot.add_cog(Debug(bot))
@@ -1,6 +1,9 @@
+import time
+
 import discord
 from discord.ext import commands
 
+from neilbot.admission import Overloaded
 from neilbot.neilbot import NeilBot
 
 
@@ -19,10 +22,38 @@ class Events(commands.Cog):
         """
         self.bot = bot
 
+        # whether or not the bot has been ready before, since on_ready also fires
+        # after reconnecting
+        self._readyBefore = False
+
     @commands.Cog.listener()
     async def on_ready(self) -> None:
-        """Prints a message when the bot starts up."""
-        print(f"{self.bot.user} is ready and online!")
+        """Prints a message when the bot starts up.
+
+        The first time the bot is ready, also prints how long startup took, how long
+        each cog took to load and how many members are cached.
+        """
+        print(
+            f"{self.bot.user} is ready and online with shards "
+            f"{sorted(self.bot.shards)} of {self.bot.shard_count}!"
+        )
+        if not self._readyBefore:
+            self._readyBefore = True
+            timeToReady = time.perf_counter() - self.bot.startTime
+            cachedMembers = sum(len(g.members) for g in self.bot.guilds)
+            totalMembers = sum(g.member_count or 0 for g in self.bot.guilds)
+            print(
+                f"Ready in {timeToReady:.2f}s with {len(self.bot.guilds)} servers, "
+                f"{cachedMembers}/{totalMembers} members and "
+                f"{len(self.bot.users)} users cached"
+            )
+            cogTimes = sorted(
+                self.bot.cogLoadTimes.items(), key=lambda c: c[1], reverse=True
+            )
+            print(
+                "Loaded cogs in "
+                + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in cogTimes)
+            )
 
     @commands.Cog.listener()
     async def on_application_command_error(
@@ -30,8 +61,9 @@ class Events(commands.Cog):
     ) -> None:
         """Handles errors from bot slash commands.
 
-        If the error is caused by a command being on cooldown, then prints an
-        error message.
+        Counts every error, and if the error is caused by a command being on
+        cooldown, only being for the bot owner or being turned away because the bot
+        is too busy, then prints an error message.
 
         Args:
             ctx (discord.ApplicationContext): the Discord application context
@@ -40,8 +72,19 @@ class Events(commands.Cog):
         Raises:
             error: the slash command exception that is not handled
         """
-        if isinstance(error, commands.CommandOnCooldown):
+        # the error the command raised, not the wrapper around it
+        original = getattr(error, "original", error)
+        self.bot.metrics.increment(
+            "neilbot_command_errors_total",
+            command=ctx.command.qualified_name,
+            error=type(original).__name__,
+        )
+        if isinstance(original, Overloaded):
+            await ctx.respond(str(original), ephemeral=True)
+        elif isinstance(error, commands.CommandOnCooldown):
             await ctx.respond("This command is currently on cooldown!", ephemeral=True)
+        elif isinstance(error, commands.NotOwner):
+            await ctx.respond("Only the owner of the bot can use this!", ephemeral=True)
         else:
             raise error
 
@@ -1,8 +1,10 @@
+import logging
 from typing import cast
 
 import discord
 from discord.ext import commands
 
+from neilbot.cogs._threadHousekeeper import ThreadHousekeeper
 from neilbot.neilbot import NeilBot
 
 
@@ -21,6 +23,12 @@ class Leetcode(commands.Cog):
         """
         self.bot = bot
 
+        # tracks archived threads and lookups so that lookups make as few REST calls
+        # as possible
+        self._housekeeper = ThreadHousekeeper(bot.metrics)
+        # regularly unarchive threads that people keep asking for
+        self.bot.scheduler.add_job(self._housekeeper.keepWarm, "interval", minutes=30)
+
     def _convertThreadName(self, name: str) -> str:
         """Convert a thread name into lowercase and remove periods.
 
@@ -138,27 +146,6 @@ class Leetcode(commands.Cog):
         # if no threads matched the one we were looking for
         return None
 
-    async def getArchivedThreads(
-        self, channel: discord.TextChannel
-    ) -> list[discord.Thread]:
-        """Gets all archived threads from a specified channel.
-
-        Args:
-            channel (discord.TextChannel): a Discord channel to get threads from
-
-        Returns:
-            list[discord.Thread]: a list of all archived threads, or an empty list
-            if no archived threads were found
-        """
-        # store all found threads
-        threads: list[discord.Thread] = []
-        # iterate over all archived threads
-        async for th in channel.archived_threads():
-            # add each thread to the list
-            threads.append(th)
-        # return all archived threads
-        return threads
-
     @discord.slash_command(
         name="lc_thread", description="Find the Leetcode thread for a problem"
     )
@@ -173,12 +160,22 @@ class Leetcode(commands.Cog):
             problem (str): a query string for a Leetcode problem thread
         """
         # give us 15 minutes instead of 3 seconds to respond
-        await ctx.defer(ephemeral=True)
+        with self.bot.metrics.phase("lc_thread", "defer"):
+            await ctx.defer(ephemeral=True)
 
         channel = ctx.channel
-        threads = cast(list[discord.Thread], channel.threads)
-        archivedThreads = await self.getArchivedThreads(channel)
-        threads.extend(archivedThreads)
+        # only a crawl takes a turn, since the cached threads are free to read
+        archivedThreads, apiCalls = await self._housekeeper.getArchivedThreads(
+            channel, self.bot.admission.admit(ctx, "thread_crawl")
+        )
+        # active threads take precedence over any stale archived copy of the same
+        # thread
+        threads = list(
+            (
+                {th.id: th for th in archivedThreads}
+                | {th.id: th for th in channel.threads}
+            ).values()
+        )
 
         # convert to lowercase and remove periods,
         # so that we can get the problem number easily
@@ -193,13 +190,37 @@ class Leetcode(commands.Cog):
         best_match = self._findMostSimilarThread(problem_number, problem, threads)
         # if a match was found
         if best_match:
+            self._housekeeper.recordQuery(best_match)
             # if the thread has been archived, then unarchive it because discord
             # has trouble loading messages in archived threads
-            await best_match.unarchive()
+            apiCalls += await self._housekeeper.ensureActive(best_match)
             # send a url to the matched thread
             await ctx.respond(f"Found problem thread: {best_match.jump_url}")
         else:
             await ctx.respond("Didn't find problem thread")
+        logging.info(f"/lc_thread made {apiCalls} REST call(s)")
+        self.bot.metrics.increment(
+            "neilbot_rest_calls_total", apiCalls, command="lc_thread"
+        )
+
+    @commands.Cog.listener()
+    async def on_raw_thread_update(self, payload: discord.RawThreadUpdateEvent) -> None:
+        """Keeps the archived thread cache in sync when a thread is updated.
+
+        Args:
+            payload (discord.RawThreadUpdateEvent): the raw thread update event
+        """
+        if payload.thread:
+            self._housekeeper.threadUpdated(payload.thread)
+
+    @commands.Cog.listener()
+    async def on_raw_thread_delete(self, payload: discord.RawThreadDeleteEvent) -> None:
+        """Removes deleted threads from the archived thread cache.
+
+        Args:
+            payload (discord.RawThreadDeleteEvent): the raw thread delete event
+        """
+        self._housekeeper.threadDeleted(payload.parent_id, payload.thread_id)
 
 
 def setup(bot: NeilBot) -> None:
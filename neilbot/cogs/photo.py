@@ -1,10 +1,25 @@
+import asyncio
+import os
+import time
+from contextlib import AbstractAsyncContextManager
 from io import BytesIO
+from pathlib import Path
 
 import discord
 from discord.ext import commands
 
+from neilbot.cogs._cameraRegistry import Camera, CameraRegistry
+from neilbot.cogs._duration import formatDuration, parseDuration
+from neilbot.cogs._frameRing import FrameRing
+from neilbot.cogs._imageProcessor import ImageProcessor
+from neilbot.cogs._timelapseRenderer import TimelapseRenderer
+from neilbot.cogs._webcamPoller import WebcamPoller
 from neilbot.neilbot import NeilBot
 
+# relative FRAMES_DIR paths are resolved against the package, not the working
+# directory the bot was started in
+_PACKAGE_DIRECTORY = Path(__file__).parent.parent
+
 
 class Photo(commands.Cog):
     """Discord Bot cog that includes slash commands for taking photographs.
@@ -21,82 +36,247 @@ class Photo(commands.Cog):
         """
         self.bot = bot
 
-    async def _download_photo(self, url: str) -> BytesIO | None:
-        """Download a photo from the provided URL. Assumes that the
-        URL is a valid URL to a photo.
+        # load the webcams that photos can be taken with
+        self._cameras = CameraRegistry.fromConfig()
+
+        # when the bot runs as clusters, only one cluster polls the webcams and
+        # captures timelapse frames, and the others read its frames
+        self._polling = os.getenv("WEBCAM_POLLING", "1") != "0"
+
+        # store timelapse frames for each camera that captures them
+        framesDirectory = _PACKAGE_DIRECTORY / os.getenv("FRAMES_DIR", "frames")
+        self._frameRings = {
+            camera.name: FrameRing(
+                framesDirectory / camera.name, camera.timelapseFrames
+            )
+            for camera in self._cameras.all()
+            if camera.timelapseFrames
+        }
+        self._renderer = TimelapseRenderer(
+            framesDirectory / os.getenv("TIMELAPSES_DIR", "timelapses")
+        )
+        # maps a camera name to the last time a timelapse frame was captured
+        self._lastCaptured: dict[str, float] = {}
+
+        # shrink photos from cameras that have a maximum size before uploading them
+        self._processor = ImageProcessor()
+
+        # poll the webcams in the background so photos are ready straight away
+        self._poller = WebcamPoller(
+            bot,
+            self._cameras.all(),
+            self._capture_frame if self._polling else None,
+            poll=self._polling,
+        )
+
+    async def _get_photo(
+        self,
+        camera: Camera,
+        admission: AbstractAsyncContextManager[None] | None = None,
+    ) -> BytesIO | None:
+        """Get the latest photo from a webcam.
 
         Args:
-            url (str): the URL to download from
+            camera (Camera): the webcam to get the photo from
+            admission (AbstractAsyncContextManager[None] | None, optional): entered
+            around downloading the photo if it is not cached, such as a turn from
+            the admission controller. Defaults to None.
 
         Returns:
-            BytesIO | None: the image in bytes. If an error occurred while
-            downloading, then None is returned.
+            BytesIO | None: the image as a file-like object. If an error occurred
+            while downloading, then None is returned.
         """
-        # send a get request to the url
-        async with self.bot.httpClient.get(url) as resp:
-            # check if response is OK
-            if resp.status == 200:
-                # read the response stream
-                image = BytesIO(await resp.read())
-                return image
-        return None
+        image = await self._poller.getPhoto(camera, admission)
+        if image is not None and camera.maxDimension:
+            image = await self._processor.process(
+                camera.name, image, camera.maxDimension, camera.jpegQuality
+            )
+        # each response needs its own file position, but BytesIO shares the cached
+        # bytes until it is written to, so the image is not copied
+        return BytesIO(image) if image is not None else None
 
-    @discord.slash_command(
-        name="photo_uws", description="Take a photograph of UW Seattle"
+    def memoryUsage(self) -> dict[str, tuple[int, int]]:
+        """Measure the photos this cog keeps in memory.
+
+        Returns:
+            dict[str, tuple[int, int]]: maps a kind of photo to how many are kept and
+            roughly how many bytes they use
+        """
+        return {
+            "webcam images": self._poller.memoryUsage(),
+            "processed photos": self._processor.memoryUsage(),
+        }
+
+    async def _capture_frame(self, camera: Camera, image: bytes, digest: bytes) -> None:
+        """Stores a new webcam image as a timelapse frame, if one is due.
+
+        Args:
+            camera (Camera): the webcam the image is from
+            image (bytes): the new image
+            digest (bytes): the SHA-256 hash of the image
+        """
+        ring = self._frameRings.get(camera.name)
+        now = time.monotonic()
+        # the camera may be polled more often than frames are captured, so allow
+        # some leeway to not skip every other poll
+        due = self._lastCaptured.get(camera.name, -camera.captureInterval)
+        if ring and now - due >= camera.captureInterval * 0.9:
+            if await ring.append(image, digest):
+                self._lastCaptured[camera.name] = now
+
+    async def _camera_autocomplete(
+        self, ctx: discord.AutocompleteContext
+    ) -> list[discord.OptionChoice]:
+        """Suggests the cameras matching what the user has typed so far.
+
+        Args:
+            ctx (discord.AutocompleteContext): the Discord autocomplete context
+
+        Returns:
+            list[discord.OptionChoice]: the matching cameras
+        """
+        cameras = self._cameras.search(ctx.value or "")
+        # Discord shows at most 25 suggestions
+        return [discord.OptionChoice(c.label, c.name) for c in cameras[:25]]
+
+    @discord.slash_command(name="photo", description="Take a photograph with a webcam")
+    @discord.option(
+        "camera",
+        str,
+        description="The webcam to take a photograph with",
+        autocomplete=_camera_autocomplete,
     )
     @commands.cooldown(1, 10, commands.BucketType.user)
-    async def take_photo_uws(self, ctx: discord.ApplicationContext) -> None:
-        """Downloads and posts a photo of the UW Seattle campus.
+    async def take_photo(self, ctx: discord.ApplicationContext, camera: str) -> None:
+        """Downloads and posts a recent photo from a webcam.
 
-        Downloads a photo of the UW Seattle campus from within the last 5 minutes
-        and posts the photo. If an error occurs while downloading the
-        photo, then an error message is sent instead.
+        If an error occurs while downloading the photo, then an error message is sent
+        instead.
 
         Args:
             ctx (discord.ApplicationContext): the Discord application context
+            camera (str): the name of the webcam to take a photo with
         """
-        # save the URL used for accessing the UWB webcam
-        UWS_WEBCAM_URL = "https://www.washington.edu/cambots/camera1_l.jpg"
-
         # give us 15 minutes instead of 3 seconds to respond
         await ctx.defer(ephemeral=False)
 
-        image = await self._download_photo(UWS_WEBCAM_URL)
+        webcam = self._cameras.get(camera)
+        if not webcam:
+            await ctx.respond(f"Error: unable to find camera '{camera}'")
+            return
+
+        image = await self._get_photo(webcam, self.bot.admission.admit(ctx, "photo"))
         if image:
+            start = time.perf_counter()
             await ctx.respond(
-                "UWS (Red Square) rn:",
-                file=discord.File(image, filename="camera1_l.jpg"),
+                f"{webcam.label} rn:",
+                file=discord.File(image, filename=webcam.filename),
             )
+            webcam.recordUpload(image.getbuffer().nbytes, time.perf_counter() - start)
         else:
             await ctx.respond("Error: unable to download photo")
 
     @discord.slash_command(
-        name="photo_uwb", description="Take a photograph of UW Bothell"
+        name="timelapse", description="Make a timelapse video from a webcam"
     )
-    @commands.cooldown(1, 10, commands.BucketType.user)
-    async def take_photo_uwb(self, ctx: discord.ApplicationContext) -> None:
-        """Downloads and posts a photo of the UW Bothell campus.
-
-        Downloads a photo of the UW Bothell campus at the time the command is
-        executed and posts the photo. If an error occurs while downloading the
-        photo, then an error message is sent instead.
+    @discord.option(
+        "camera",
+        str,
+        description="The webcam to make a timelapse from",
+        autocomplete=_camera_autocomplete,
+    )
+    @discord.option(
+        "duration",
+        str,
+        description="How far back the timelapse goes, such as 90m, 6h or 1d",
+    )
+    @commands.cooldown(1, 30, commands.BucketType.user)
+    async def make_timelapse(
+        self, ctx: discord.ApplicationContext, camera: str, duration: str
+    ) -> None:
+        """Posts a timelapse video of the last stretch of time from a webcam.
 
         Args:
             ctx (discord.ApplicationContext): the Discord application context
+            camera (str): the name of the webcam to make a timelapse from
+            duration (str): how far back the timelapse goes, such as 1h30m
         """
-        # save the URL used for accessing the UWB webcam
-        UWB_WEBCAM_URL = "http://69.91.192.220/netcam.jpg"
-
         # give us 15 minutes instead of 3 seconds to respond
         await ctx.defer(ephemeral=False)
 
-        image = await self._download_photo(UWB_WEBCAM_URL)
-        if image:
+        webcam = self._cameras.get(camera)
+        ring = self._frameRings.get(camera)
+        if not webcam or not ring:
+            await ctx.respond(f"Error: no timelapse available for camera '{camera}'")
+            return
+        seconds = parseDuration(duration)
+        # frames older than the ring are overwritten, so they can't be shown
+        kept = int(webcam.captureInterval * webcam.timelapseFrames)
+        if not seconds:
+            await ctx.respond(
+                f"Error: '{duration}' is not a duration, try something like 90m or 6h"
+            )
+            return
+        if seconds > kept:
             await ctx.respond(
-                "UWB rn:", file=discord.File(image, filename="netcam.jpg")
+                f"Error: {webcam.label} only keeps the last {formatDuration(kept)}"
             )
+            return
+        # durations written differently, such as 90m and 1h30m, share a render
+        length = formatDuration(seconds)
+
+        if not self._polling:
+            # another cluster captures the frames
+            await asyncio.to_thread(ring.reload)
+        frames = ring.framesSince(time.time() - seconds)
+        if not frames:
+            await ctx.respond("Error: no frames have been captured yet")
+            return
+        video = await self._renderer.render(f"{camera}-{length}", frames, ring.sequence)
+        if not video:
+            await ctx.respond("Error: unable to make timelapse")
+        elif ctx.guild and video.stat().st_size > ctx.guild.filesize_limit:
+            await ctx.respond("Error: timelapse is too large to upload")
         else:
-            await ctx.respond("Error: unable to download photo")
+            await ctx.respond(
+                f"{webcam.label}, last {length}:",
+                file=discord.File(video, filename=f"{camera}-timelapse.mp4"),
+            )
+
+    @discord.slash_command(
+        name="photo_stats", description="Show how well each webcam is responding"
+    )
+    @commands.cooldown(1, 10, commands.BucketType.user)
+    async def show_photo_stats(self, ctx: discord.ApplicationContext) -> None:
+        """Shows the download latency and error count of every webcam and its host.
+
+        Args:
+            ctx (discord.ApplicationContext): the Discord application context
+        """
+        lines = []
+        for camera in self._cameras.all():
+            latency = camera.averageLatency()
+            latencyText = f"{latency * 1000:.0f}ms" if latency is not None else "n/a"
+            uploadText = (
+                f"{camera.uploadBytes / camera.uploads / 1000:.0f}KB in "
+                f"{camera.uploadLatency / camera.uploads * 1000:.0f}ms"
+                if camera.uploads
+                else "n/a"
+            )
+            lines.append(
+                f"**{camera.label}** ({camera.name}): {camera.downloads} downloads, "
+                f"average {latencyText}, {camera.errors} errors, "
+                f"average upload {uploadText}"
+            )
+        # the HTTP client also sees retries and connection errors for each host
+        for host, stats in self.bot.httpClient.hostStats.items():
+            latency = stats.averageLatency()
+            latencyText = f"{latency * 1000:.0f}ms" if latency is not None else "n/a"
+            lines.append(
+                f"`{host}`: {stats.requests} responses, average {latencyText}, "
+                f"{stats.errors} connection errors"
+            )
+        await ctx.respond("\n".join(lines) or "No cameras configured", ephemeral=True)
 
 
 def setup(bot: NeilBot) -> None:
@@ -1,16 +1,21 @@
 import asyncio
+import functools
 import logging
+import os
 import threading
 from collections import defaultdict, deque
 from typing import cast
 
 import discord
-import yt_dlp
-from discord import FFmpegPCMAudio
 from discord.ext import commands
 
-from neilbot.cogs._downloader import Downloader
+from neilbot.cogs._downloader import Downloader, DownloadError
+from neilbot.cogs._memoryUsage import deepSize
+from neilbot.cogs._nowPlaying import NowPlaying
 from neilbot.cogs._playerButtons import PlayerButtons
+from neilbot.cogs._queuePages import QueueSnapshot, QueueView
+from neilbot.cogs._searchPicker import SearchPicker
+from neilbot.cogs._track import Track
 from neilbot.cogs._youtubeDownloader import YouTubeDownloader
 from neilbot.neilbot import NeilBot
 
@@ -22,6 +27,9 @@ class Player(commands.Cog):
         bot (NeilBot): the instance of the Discord bot this cog is added to
     """
 
+    # the number of search results to choose from
+    _SEARCH_RESULTS = 5
+
     def __init__(self, bot: NeilBot):
         """Inits the Player cog.
 
@@ -30,16 +38,50 @@ class Player(commands.Cog):
         """
         self.bot = bot
 
-        # configure logging for warnings and errors
-        logging.basicConfig(format="%(levelname)s:%(message)s", level=logging.WARN)
+        # downloaders are stateless, so one of each is shared by every server
+        youtube = YouTubeDownloader(bot.httpClient, bot.metrics)
+        # maps a song source to the downloader for it
+        self._downloaders: dict[str, Downloader] = {youtube.getSource(): youtube}
 
-        # maps a server id to a queue containing song downloaders
-        self._songQueue: defaultdict[int, deque[Downloader]] = defaultdict(deque)
-        # store the current song downloader for each server, or None if no song is
-        # playing
-        self._currentSongs: defaultdict[int, Downloader | None] = defaultdict(None)
+        # maps a server id to a queue containing songs
+        self._songQueue: defaultdict[int, deque[Track]] = defaultdict(deque)
+        # store the current song for each server, or None if no song is playing
+        self._currentSongs: defaultdict[int, Track | None] = defaultdict(lambda: None)
         # mutex lock for modifying the queue and currentSongs
         self._queueLock = threading.Lock()
+        # maps a server id to a number that goes up whenever its queue or current
+        # song changes
+        self._queueVersions: defaultdict[int, int] = defaultdict(int)
+        # maps a server id to the last snapshot of its queue that was shown
+        self._queueSnapshots: dict[int, QueueSnapshot] = {}
+        # keeps one live player message per server instead of sending new ones
+        self._nowPlaying = NowPlaying(bot.metrics)
+
+    def memoryUsage(self) -> dict[str, tuple[int, int]]:
+        """Measure the songs this cog keeps in memory.
+
+        Returns:
+            dict[str, tuple[int, int]]: maps a kind of song to how many are kept and
+            roughly how many bytes they use
+        """
+        with self._queueLock:
+            queued = [song for queue in self._songQueue.values() for song in queue]
+            playing = [song for song in self._currentSongs.values() if song]
+            servers = len(self._songQueue.keys() | self._currentSongs.keys())
+            snapshots = list(self._queueSnapshots.values())
+        return {
+            "queued songs": (len(queued), deepSize(queued, (Track,))),
+            "playing songs": (len(playing), deepSize(playing, (Track,))),
+            "servers with a queue": (
+                servers,
+                deepSize(self._songQueue) + deepSize(self._currentSongs),
+            ),
+            # snapshots share their songs with the queues, so only count the copies
+            "queue snapshots": (len(snapshots), deepSize(snapshots, (QueueSnapshot,))),
+        } | {
+            f"{source} search results": downloader.memoryUsage()
+            for source, downloader in self._downloaders.items()
+        }
 
     async def _getVoiceChannel(
         self, voice_channels: list[discord.VoiceChannel]
@@ -83,6 +125,65 @@ class Player(commands.Cog):
             discord.utils.get(self.bot.voice_clients, guild=server),
         )
 
+    @staticmethod
+    def _openAudio(file: str) -> discord.AudioSource:
+        """Start encoding a downloaded song.
+
+        FFmpeg encodes the song straight to Opus in its own process, so the voice
+        client only sends the packets and no audio is encoded in the bot's process.
+
+        Args:
+            file (str): the path of the downloaded song
+
+        Raises:
+            discord.ClientException: FFmpeg could not be started
+
+        Returns:
+            discord.AudioSource: the audio source to give to the voice client
+        """
+        return discord.FFmpegOpusAudio(file)
+
+    @staticmethod
+    def _removeDownload(file: str) -> None:
+        """Remove a downloaded song that is no longer needed.
+
+        Args:
+            file (str): the path of the downloaded song
+        """
+        try:
+            os.remove(file)
+        except OSError as e:
+            logging.warning(f"Unable to remove downloaded song: {e}")
+
+    def _songFinished(
+        self,
+        ctx: discord.ApplicationContext,
+        serverID: int,
+        voice_client: discord.VoiceClient,
+        file: str,
+        event_loop: asyncio.AbstractEventLoop,
+        error: Exception | None,
+    ) -> None:
+        """Remove a song once it has stopped playing, and play the next song.
+
+        This is called on the voice client's audio thread, after the audio source
+        has been cleaned up.
+
+        Args:
+            ctx (discord.ApplicationContext): the Discord application context
+            serverID (int): the ID for the server the song played in
+            voice_client (discord.VoiceClient): the voice client the song played in
+            file (str): the path of the downloaded song
+            event_loop (asyncio.AbstractEventLoop): the bot's event loop
+            error (Exception | None): the error that stopped the song, if any
+        """
+        self._removeDownload(file)
+        if error:
+            logging.error(error)
+        else:
+            # continue playing from the queue after the song ends
+            event_loop.create_task(self._playSongQueue(ctx, serverID, voice_client))
+
     async def _playSongQueue(
         self,
         ctx: discord.ApplicationContext,
@@ -102,6 +203,7 @@ class Player(commands.Cog):
         with self._queueLock:
             # reset the currentSong before we start playing a new song
             self._currentSongs[serverID] = None
+            self._queueVersions[serverID] += 1
             # check if there are still songs in the queue
             if self._songQueue[serverID]:
                 # set the currently playing song to the next song in the queue,
@@ -109,15 +211,24 @@ class Player(commands.Cog):
                 song = self._songQueue[serverID].popleft()
                 # add the song to the dictionary for later use
                 self._currentSongs[serverID] = song
+            queued = len(self._songQueue[serverID])
         # check if song is still None
-        if song:
+        if not song:
+            self._nowPlaying.trackChanged(serverID, ctx.channel, None, queued)
+        else:
+            file = None
+            started = False
             try:
-                # download the song from YouTube to play it
-                file = await song.downloadSong()
+                # download the song from wherever it is from to play it
+                with self.bot.metrics.phase(ctx.command.qualified_name, "download"):
+                    file = await self._downloaders[song.source].download(song)
+                source = self._openAudio(file)
 
                 with self._queueLock:
                     # if the current song has not been skipped while downloading
-                    if self._currentSongs[serverID] == song:
+                    if self._currentSongs[serverID] is not song:
+                        source.cleanup()
+                    else:
                         # get the async event loop so we can use this method as a
                         # callback to continue playing from the queue after the
                         # currentSong ends
@@ -126,93 +237,108 @@ class Player(commands.Cog):
                         try:
                             # play the downloaded song
                             voice_client.play(
-                                FFmpegPCMAudio(file),
-                                after=lambda e: (
-                                    logging.error(e)
-                                    if e
-                                    else event_loop.create_task(
-                                        self._playSongQueue(ctx, serverID, voice_client)
-                                    )
+                                source,
+                                after=functools.partial(
+                                    self._songFinished,
+                                    ctx,
+                                    serverID,
+                                    voice_client,
+                                    file,
+                                    event_loop,
                                 ),
                             )
-                            await ctx.channel.send(
-                                content=f"Now playing **{song.getSongName()}**"
-                            )
+                            started = True
                         except discord.ClientException:
                             # if bot is no longer connected to voice,
                             # then don't do anything
-                            pass
-            except yt_dlp.utils.DownloadError:
-                await ctx.channel.send(
-                    "Error: unable to download song, please try again later"
+                            source.cleanup()
+                # the lock blocks the whole event loop while it is held, so the
+                # player is updated after releasing it
+                if started:
+                    self._nowPlaying.trackChanged(serverID, ctx.channel, song, queued)
+            except DownloadError:
+                self._nowPlaying.statusChanged(
+                    serverID,
+                    ctx.channel,
+                    "Error: unable to download song, please try again later",
+                )
+            except discord.ClientException as e:
+                logging.error(f"Unable to start FFmpeg: {e}")
+                self._nowPlaying.statusChanged(
+                    serverID,
+                    ctx.channel,
+                    "Error: unable to play song, please try again later",
                 )
+            finally:
+                # a song that never started playing has nothing left to read it
+                if file and not started:
+                    self._removeDownload(file)
 
     @discord.slash_command(name="controls", description="Show music player controls")
     @commands.cooldown(1, 10, commands.BucketType.user)
     async def show_controls(self, ctx: discord.ApplicationContext) -> None:
-        """Show controls for the music player.
+        """Move the music player and its controls to the bottom of the channel.
 
         Args:
             ctx (discord.ApplicationContext): the Discord application context
         """
+        # give us 15 minutes instead of 3 seconds to respond
+        await ctx.defer(ephemeral=True)
+
         # get the server
         server = ctx.guild
 
-        # store the current song for this server
-        song = self._currentSongs[server.id]
-
-        songDescription = (
-            f"Currently playing **{song.getSongName()}**"
-            if song
-            else "No song currently playing"
-        )
-        controlsEmbed = discord.Embed(
-            title="Music Player Controls",
-            description=songDescription,
+        # the old player message is deleted, so the server still has only one
+        await self._nowPlaying.moveTo(server.id, ctx.channel)
+        await ctx.respond(
+            "Moved the music player to the bottom of the channel", ephemeral=True
         )
-        await ctx.respond("Controls:")
-        await ctx.channel.send(embed=controlsEmbed, view=self._buttons)
+
+    def _queueSnapshot(self, serverID: int) -> QueueSnapshot:
+        """Get a snapshot of the latest version of a server's queue.
+
+        The queue is only copied if it has changed since the last snapshot, and
+        nothing is formatted while the queue is locked.
+
+        Args:
+            serverID (int): the ID of the server whose queue to get
+
+        Returns:
+            QueueSnapshot: the snapshot, which caches its rendered pages
+        """
+        with self._queueLock:
+            version = self._queueVersions[serverID]
+            snapshot = self._queueSnapshots.get(serverID)
+            if snapshot is None or snapshot.version != version:
+                snapshot = QueueSnapshot(
+                    version,
+                    self._currentSongs[serverID],
+                    tuple(self._songQueue[serverID]),
+                )
+                self._queueSnapshots[serverID] = snapshot
+        return snapshot
 
     async def _show_queue_helper(
         self, ctx: discord.ApplicationContext | discord.Interaction
-    ) -> str:
-        """Helper method for showing the queue contents.
+    ) -> tuple[str, QueueView | None]:
+        """Helper method for showing the first page of the queue.
 
         Args:
             ctx (discord.ApplicationContext | discord.Interaction): the Discord
             application context or interaction
 
         Returns:
-            str: the queue in string form or an error message
+            tuple[str, QueueView | None]: the first page of the queue or an error
+            message, and buttons for the other pages if there are any
         """
         # get the server
         server = ctx.guild
 
-        # obtain a mutex lock so that the queue doesn't change while we are listing
-        # the songs
-        with self._queueLock:
-            # store the songs queued up
-            songList = ""
-            # store the current song for this server
-            song = self._currentSongs[server.id]
-            # if a song is currently playing, then display it first
-            if song:
-                songList += f"Currently playing **{song.getSongName()}**\n\n"
-
-            # check if the queue contains songs or is empty
-            if self._songQueue[server.id]:
-                songList += "Song queue:\n"
-                # print each song, using a 1-indexed list
-                for i, song in enumerate(self._songQueue[server.id]):
-                    # if the song is stored in the list then it will always return the
-                    # song name
-                    songName = cast(str, song.getSongName())
-                    songList += (
-                        str(i + 1) + ". " + songName + " [" + song.getSource() + "]\n"
-                    )
-                return songList
-            else:
-                return "No songs currently in the queue"
+        snapshot = self._queueSnapshot(server.id)
+        view = None
+        if snapshot.pageCount > 1:
+            view = QueueView(functools.partial(self._queueSnapshot, server.id))
+        return snapshot.page(0), view
 
     @discord.slash_command(name="queue", description="Show the music queue")
     @commands.cooldown(1, 10, commands.BucketType.user)
@@ -224,8 +350,9 @@ class Player(commands.Cog):
         """
         # give us 15 minutes instead of 3 seconds to respond
         await ctx.defer(ephemeral=False)
-        message = await self._show_queue_helper(ctx)
-        await ctx.respond(message)
+        message, view = await self._show_queue_helper(ctx)
+        # the queue only has buttons if it has more than one page
+        await ctx.respond(message, view=view or discord.utils.MISSING)
 
     async def _connect_to_voice(
         self, ctx: discord.ApplicationContext
@@ -302,6 +429,8 @@ class Player(commands.Cog):
         # remove all songs from the queue
         with self._queueLock:
             self._songQueue[server.id].clear()
+            self._queueVersions[server.id] += 1
+        self._nowPlaying.queueChanged(server.id, 0)
 
         # the voice channel we found the bot in
         botVoiceChannel = await self._getVoiceChannel(voice_channels)
@@ -343,7 +472,7 @@ class Player(commands.Cog):
 
     @discord.slash_command(
         name="play_youtube",
-        description="Add the YouTube video url or first search result to the queue",
+        description="Add a YouTube video url or a picked search result to the queue",
     )
     @commands.cooldown(1, 10, commands.BucketType.user)
     async def play_youtube_audio(
@@ -351,14 +480,16 @@ class Player(commands.Cog):
     ) -> None:
         """Add the music from YouTube from either a URL or a search query to the queue.
 
-        If no audio is currently playing, then the song queue starts playing.
+        A search query shows the top results to pick from. If no audio is currently
+        playing, then the song queue starts playing.
 
         Args:
             ctx (discord.ApplicationContext): the Discord application context
             url_or_search (str): either a YouTube url or a search query
         """
         # give us 15 minutes instead of 3 seconds to respond
-        await ctx.defer(ephemeral=False)
+        with self.bot.metrics.phase("play_youtube", "defer"):
+            await ctx.defer(ephemeral=False)
 
         # get the server
         server = ctx.guild
@@ -373,11 +504,25 @@ class Player(commands.Cog):
             botVoiceChannel = await self._getVoiceChannel(voice_channels)
 
         try:
-            video: Downloader = YouTubeDownloader()
-            await video.validateAndStoreURLOrSearch(url_or_search)
-            if video:
+            youtube = self._downloaders[YouTubeDownloader.getSource()]
+            # searches share the yt-dlp workers with every other server
+            async with self.bot.admission.admit(ctx, "extraction"):
+                with self.bot.metrics.phase("play_youtube", "resolve"):
+                    tracks = await youtube.search(url_or_search, self._SEARCH_RESULTS)
+            if not tracks:
+                await ctx.respond("Error: unable to find any matching videos")
+                return
+            # the results already have everything needed to play the chosen one, so
+            # it is queued without searching again
+            track = await self._pickTrack(ctx, tracks)
+            # the results that were not picked will never be downloaded
+            youtube.discard([t for t in tracks if t is not track])
+            if track:
                 with self._queueLock:
-                    self._songQueue[server.id].append(video)
+                    self._songQueue[server.id].append(track)
+                    self._queueVersions[server.id] += 1
+                    queued = len(self._songQueue[server.id])
+                self._nowPlaying.queueChanged(server.id, queued)
 
                 # only play music if the bot is in or was able to join a voice channel
                 if botVoiceChannel:
@@ -386,14 +531,44 @@ class Player(commands.Cog):
                     # check if a song is already playing
                     if voice_client and not voice_client.is_playing():
                         await ctx.respond("Starting to play queue...")
-                        await self._playSongQueue(ctx, server.id, voice_client)
+                        # playing the queue returns once the first song starts
+                        with self.bot.metrics.phase("play_youtube", "first_audio"):
+                            await self._playSongQueue(ctx, server.id, voice_client)
                     else:
                         await ctx.respond("Song added to queue!")
-            else:
-                await ctx.respond("Error: unable to find any matching videos")
-        except yt_dlp.utils.DownloadError:
+        except DownloadError:
             await ctx.respond("Error: unable to download song, please try again later")
 
+    async def _pickTrack(
+        self, ctx: discord.ApplicationContext, tracks: list[Track]
+    ) -> Track | None:
+        """Ask the user which search result they meant, if there is more than one.
+
+        Args:
+            ctx (discord.ApplicationContext): the Discord application context
+            tracks (list[Track]): the search results, best match first
+
+        Returns:
+            Track | None: the chosen search result, or None if there were no results
+            or nothing was chosen in time
+        """
+        if len(tracks) <= 1:
+            return tracks[0] if tracks else None
+
+        picker = SearchPicker(ctx.author.id, tracks)
+        response = await ctx.respond("Which video did you mean?", view=picker)
+        # wait returns True if the picker timed out
+        if await picker.wait():
+            # the picker may be a followup rather than the original response, such
+            # as after waiting in line, so the message it was sent in is edited
+            if isinstance(response, discord.Interaction):
+                await response.edit_original_response(
+                    content="No video was picked", view=None
+                )
+            else:
+                await response.edit(content="No video was picked", view=None)
+        return picker.choice
+
     async def _skip_audio_helper(
         self, ctx: discord.ApplicationContext | discord.Interaction
     ) -> str:
@@ -468,6 +643,8 @@ class Player(commands.Cog):
         """
         # get the server
         server = ctx.guild
+        if server is None:
+            return "Error: the music player only works in a server"
         # get all voice channels on the server
         voice_channels = server.voice_channels
 
@@ -476,6 +653,8 @@ class Player(commands.Cog):
         with self._queueLock:
             # remove all songs from the queue
             self._songQueue[server.id].clear()
+            self._queueVersions[server.id] += 1
+        self._nowPlaying.queueChanged(server.id, 0)
 
         # the voice channel we found the bot in
         botVoiceChannel = await self._getVoiceChannel(voice_channels)
@@ -525,6 +704,8 @@ class Player(commands.Cog):
         """
         # get the server
         server = ctx.guild
+        if server is None:
+            return "Error: the music player only works in a server"
         # get all voice channels on the server
         voice_channels = server.voice_channels
 
@@ -539,9 +720,11 @@ class Player(commands.Cog):
             if voice_client and voice_client.is_playing():
                 # pause the audio
                 voice_client.pause()
+                self._nowPlaying.pausedChanged(server.id, True)
                 return "Paused audio. Use /resume to continue playing"
             elif voice_client and voice_client.is_paused():
                 voice_client.resume()
+                self._nowPlaying.pausedChanged(server.id, False)
                 return "Resumed playing audio"
             else:
                 return "Error: no audio is playing"
@@ -577,6 +760,7 @@ class Player(commands.Cog):
             if voice_client and voice_client.is_playing():
                 # pause the audio
                 voice_client.pause()
+                self._nowPlaying.pausedChanged(server.id, True)
                 await ctx.respond("Paused audio. Use /resume to continue playing")
             else:
                 await ctx.respond("Error: no audio is playing")
@@ -610,6 +794,7 @@ class Player(commands.Cog):
             if voice_client and not voice_client.is_playing():
                 # resume the audio
                 voice_client.resume()
+                self._nowPlaying.pausedChanged(server.id, False)
                 await ctx.respond("Resumed playing audio")
             else:
                 await ctx.respond("Error: audio is already playing")
@@ -619,14 +804,17 @@ class Player(commands.Cog):
     @commands.Cog.listener()
     async def on_ready(self) -> None:
         """Adds the button view to the bot for music controls."""
-        self._buttons = PlayerButtons(
+        buttons = PlayerButtons(
             self._toggle_play_pause_audio,
             self._skip_audio_helper,
             self._show_queue_helper,
             self._stop_audio_helper,
+            self._nowPlaying.pressed,
+            self.bot.metrics,
         )
+        self._nowPlaying.view = buttons
 
-        self.bot.add_view(self._buttons)
+        self.bot.add_view(buttons)
 
     @commands.Cog.listener()
     async def on_voice_state_update(
@@ -652,8 +840,12 @@ class Player(commands.Cog):
         if before.channel:
             server = member.guild
             channel = before.channel
-            # check to see if the bot is alone in a voice channel
-            if len(channel.members) == 1 and channel.members[0] == self.bot.user:
+            # check to see if the bot is alone in a voice channel. Voice states are
+            # used because other members may not be cached, depending on the member
+            # cache policy.
+            if list(channel.voice_states) == [
+                cast(discord.ClientUser, self.bot.user).id
+            ]:
                 voice_client = self._getVoiceClient(server)
                 # check if a song is playing
                 if voice_client and voice_client.is_playing():
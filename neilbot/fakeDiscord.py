@@ -0,0 +1,901 @@
+import asyncio
+import functools
+import itertools
+import random
+import shutil
+import tempfile
+import time
+import uuid
+import wave
+import weakref
+from collections import Counter
+from collections.abc import AsyncIterator, Callable
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, cast
+
+import discord
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+from neilbot.admission import AdmissionController
+from neilbot.cogs._track import Track
+from neilbot.cogs._youtubeDownloader import YouTubeDownloader
+from neilbot.httpClient import HttpClient
+from neilbot.metrics import Metrics
+
+# hands out unique snowflakes for every fake object
+_ids = itertools.count(1 << 40)
+# members choosing from select menus, kept so they are not garbage collected
+_picking: set[asyncio.Task[None]] = set()
+
+
+class FakeRest:
+    """Stands in for Discord's REST API, with latency and per-route rate limits.
+
+    Each call waits for a free slot in its route's rate limit bucket, the way
+    py-cord waits out rate limits, then waits for the simulated latency.
+
+    Attributes:
+        calls (Counter[str]): the number of calls made to each route
+        rateLimited (Counter[str]): the number of calls to each route that had to
+        wait for the rate limit
+        waited (float): the total seconds calls spent waiting for rate limits
+        latency (float): the average seconds a call takes once it is sent
+    """
+
+    # maps a route to how many calls its bucket allows and how many seconds the
+    # bucket lasts, roughly matching Discord's limits. Interaction responses are
+    # not rate limited
+    _LIMITS = {
+        "message": (5, 5.0),
+        "role": (10, 10.0),
+        "thread": (10, 10.0),
+    }
+    # every route except interaction responses also shares a global limit per second
+    _GLOBAL_LIMIT = 50
+
+    def __init__(self, latency: float = 0.05, rate_limits: bool = True):
+        """Inits the fake REST API.
+
+        Args:
+            latency (float, optional): the average seconds a call takes once it is
+            sent. Defaults to 0.05.
+            rate_limits (bool, optional): whether or not calls wait for rate limits.
+            Defaults to True.
+        """
+        self.latency = latency
+        self._rateLimits = rate_limits
+        # maps a route and the resource it is for to the time its bucket resets and
+        # the calls left in it
+        self._buckets: dict[tuple[str, int], tuple[float, int]] = {}
+        self.calls: Counter[str] = Counter()
+        self.rateLimited: Counter[str] = Counter()
+        self.waited = 0.0
+
+    def _reserve(self, key: tuple[str, int], limit: int, per: float) -> float:
+        """Take a slot in a rate limit bucket.
+
+        Args:
+            key (tuple[str, int]): the route and the resource the call is for
+            limit (int): how many calls the bucket allows
+            per (float): how many seconds the bucket lasts
+
+        Returns:
+            float: how many seconds to wait before the slot can be used
+        """
+        now = time.monotonic()
+        reset, remaining = self._buckets.get(key, (0.0, 0))
+        if reset <= now:
+            reset, remaining = now + per, limit
+        elif remaining == 0:
+            # the bucket is full, so the call waits for the next one
+            reset, remaining = reset + per, limit
+        self._buckets[key] = (reset, remaining - 1)
+        return max(0.0, reset - per - now)
+
+    async def request(self, route: str, resource: int) -> None:
+        """Make a fake REST call.
+
+        Args:
+            route (str): the kind of call, such as "message" or "role"
+            resource (int): the ID of the channel or server the call is for, which
+            picks its rate limit bucket
+        """
+        self.calls[route] += 1
+        wait = 0.0
+        if self._rateLimits and route != "interaction":
+            wait = self._reserve(("global", 0), self._GLOBAL_LIMIT, 1.0)
+            if route in self._LIMITS:
+                wait = max(wait, self._reserve((route, resource), *self._LIMITS[route]))
+        if wait:
+            self.rateLimited[route] += 1
+            self.waited += wait
+        if wait or self.latency:
+            await asyncio.sleep(wait + random.uniform(0.5, 1.5) * self.latency)
+
+
+class FakeUser:
+    """A Discord user or server member.
+
+    Attributes:
+        id (int): the user's ID
+        name (str): the user's name
+        mention (str): the text that mentions the user
+        roles (list[FakeRole]): the roles the member has
+        guild (FakeGuild | None): the server the member is in, or None for the bot
+        voice (FakeVoiceState | None): the voice channel the member is in
+    """
+
+    def __init__(self, name: str, guild: "FakeGuild | None", rest: FakeRest):
+        """Inits the user.
+
+        Args:
+            name (str): the user's name
+            guild (FakeGuild | None): the server the member is in, or None for the bot
+            rest (FakeRest): the REST API role edits are sent to
+        """
+        self.id = next(_ids)
+        self.name = name
+        self.mention = f"<@{self.id}>"
+        self.roles: list[FakeRole] = []
+        self.guild = guild
+        self.voice: FakeVoiceState | None = None
+        self._rest = rest
+
+    async def add_roles(self, role: "FakeRole") -> None:
+        """Give the member a role.
+
+        Args:
+            role (FakeRole): the role to give
+        """
+        await self._rest.request("role", role.guild.id)
+        self.roles.append(role)
+
+    async def remove_roles(self, role: "FakeRole") -> None:
+        """Take a role from the member.
+
+        Args:
+            role (FakeRole): the role to take
+        """
+        await self._rest.request("role", role.guild.id)
+        self.roles.remove(role)
+
+
+class FakeRole:
+    """A server role.
+
+    Attributes:
+        id (int): the role's ID
+        name (str): the role's name
+        mention (str): the text that mentions the role
+        guild (FakeGuild): the server the role is in
+    """
+
+    def __init__(self, name: str, guild: "FakeGuild"):
+        """Inits the role.
+
+        Args:
+            name (str): the role's name
+            guild (FakeGuild): the server the role is in
+        """
+        self.id = next(_ids)
+        self.name = name
+        self.mention = f"<@&{self.id}>"
+        self.guild = guild
+
+    @property
+    def members(self) -> list[FakeUser]:
+        """Find the members with the role by checking every member, like Discord.
+
+        Returns:
+            list[FakeUser]: the members with the role
+        """
+        return [m for m in self.guild.members if self in m.roles]
+
+
+class FakeVoiceState:
+    """A member's voice state.
+
+    Attributes:
+        channel (FakeVoiceChannel): the voice channel the member is in
+    """
+
+    def __init__(self, channel: "FakeVoiceChannel"):
+        """Inits the voice state.
+
+        Args:
+            channel (FakeVoiceChannel): the voice channel the member is in
+        """
+        self.channel = channel
+
+
+class FakeAudio(discord.AudioSource):
+    """An audio source that plays for as long as its fixture file lasts.
+
+    Attributes:
+        duration (float): how many seconds the audio lasts
+    """
+
+    def __init__(self, duration: float):
+        """Inits the audio source.
+
+        Args:
+            duration (float): how many seconds the audio lasts
+        """
+        self.duration = duration
+
+    def read(self) -> bytes:
+        """The fake voice client never reads any audio.
+
+        Returns:
+            bytes: nothing
+        """
+        return b""
+
+
+def openFakeAudio(file: str) -> discord.AudioSource:
+    """Start playing a fixture file, without running FFmpeg.
+
+    Args:
+        file (str): the path of a WAV fixture file
+
+    Returns:
+        discord.AudioSource: audio that lasts as long as the file
+    """
+    with wave.open(file) as fixture:
+        return FakeAudio(fixture.getnframes() / fixture.getframerate())
+
+
+class FakeVoiceClient:
+    """A voice connection that plays audio in real time without sending any.
+
+    Attributes:
+        guild (FakeGuild): the server the voice connection is in
+        channel (FakeVoiceChannel): the voice channel the bot is connected to
+        transitions (list[float]): how many seconds passed between a song ending and
+        the next song in the queue starting
+    """
+
+    def __init__(self, channel: "FakeVoiceChannel", queued: Callable[[], bool]):
+        """Inits the voice client.
+
+        Args:
+            channel (FakeVoiceChannel): the voice channel the bot is connected to
+            queued (Callable[[], bool]): whether or not there are songs waiting in
+            the server's queue, so that the gap to the next song can be measured
+        """
+        self.guild = channel.guild
+        self.channel = channel
+        self.transitions: list[float] = []
+        self._queued = queued
+        self._end: asyncio.TimerHandle | None = None
+        self._after: Callable[[Exception | None], Any] | None = None
+        self._paused = False
+        # when the last song ended with another song waiting, or None
+        self._endedAt: float | None = None
+
+    def play(
+        self, source: discord.AudioSource, after: Callable[[Exception | None], Any]
+    ) -> None:
+        """Start playing a song, calling after once it ends.
+
+        Args:
+            source (discord.AudioSource): the song to play
+            after (Callable[[Exception | None], Any]): called once the song ends
+
+        Raises:
+            discord.ClientException: a song is already playing
+        """
+        if self._after:
+            raise discord.ClientException("Already playing audio.")
+        if self._endedAt is not None:
+            self.transitions.append(time.monotonic() - self._endedAt)
+            self._endedAt = None
+        self._after = after
+        duration = getattr(source, "duration", 0.0)
+        self._end = asyncio.get_running_loop().call_later(duration, self._finish)
+
+    def _finish(self) -> None:
+        """End the current song and call its callback."""
+        after, self._after = self._after, None
+        if self._end:
+            self._end.cancel()
+            self._end = None
+        if self._queued():
+            self._endedAt = time.monotonic()
+        if after:
+            after(None)
+
+    def is_playing(self) -> bool:
+        """Check if a song is playing.
+
+        Returns:
+            bool: whether or not a song is playing and not paused
+        """
+        return self._after is not None and not self._paused
+
+    def is_paused(self) -> bool:
+        """Check if a song is paused.
+
+        Returns:
+            bool: whether or not a song is paused
+        """
+        return self._after is not None and self._paused
+
+    def pause(self) -> None:
+        """Pause the song. The fake song keeps its original end time."""
+        self._paused = True
+
+    def resume(self) -> None:
+        """Resume the song."""
+        self._paused = False
+
+    def stop(self) -> None:
+        """Stop the song, which calls its callback like a song ending."""
+        if self._after:
+            self._finish()
+
+    async def disconnect(self) -> None:
+        """Leave the voice channel."""
+        self.stop()
+        self.channel.disconnected()
+
+
+class FakeVoiceChannel:
+    """A voice channel.
+
+    Attributes:
+        id (int): the channel's ID
+        name (str): the channel's name
+        guild (FakeGuild): the server the channel is in
+        members (list[FakeUser]): the members connected to the channel
+    """
+
+    def __init__(self, guild: "FakeGuild"):
+        """Inits the voice channel.
+
+        Args:
+            guild (FakeGuild): the server the channel is in
+        """
+        self.id = next(_ids)
+        self.name = "Music"
+        self.guild = guild
+        self.members: list[FakeUser] = []
+
+    async def connect(self) -> "FakeVoiceClient":
+        """Connect the bot to the channel.
+
+        Raises:
+            discord.ClientException: the bot is already connected
+
+        Returns:
+            FakeVoiceClient: the voice connection
+        """
+        bot = self.guild.bot
+        if self.guild.voice_client:
+            raise discord.ClientException("Already connected to a voice channel.")
+        # connecting goes through the gateway and a voice server, not REST
+        await asyncio.sleep(2 * self.guild.rest.latency)
+        voiceClient = FakeVoiceClient(self, self.guild.queued)
+        self.members.append(bot.user)
+        bot.voiceClients[self.guild.id] = voiceClient
+        return voiceClient
+
+    def disconnected(self) -> None:
+        """Remove the bot from the channel once it has disconnected."""
+        bot = self.guild.bot
+        self.members.remove(bot.user)
+        bot.voiceClients.pop(self.guild.id, None)
+
+
+class FakeThread:
+    """A Leetcode problem thread.
+
+    Attributes:
+        id (int): the thread's ID
+        name (str): the thread's name
+        guild (FakeGuild): the server the thread is in
+        parent_id (int): the ID of the channel the thread is in
+        archived (bool): whether or not the thread is archived
+        message_count (int): how many messages the thread has
+        jump_url (str): the link to the thread
+    """
+
+    def __init__(self, name: str, channel: "FakeTextChannel", archived: bool):
+        """Inits the thread.
+
+        Args:
+            name (str): the thread's name
+            channel (FakeTextChannel): the channel the thread is in
+            archived (bool): whether or not the thread is archived
+        """
+        self.id = next(_ids)
+        self.name = name
+        self.guild = channel.guild
+        self.parent_id = channel.id
+        self.archived = archived
+        self.message_count = random.randrange(100)
+        self.jump_url = f"https://discord.com/channels/{self.guild.id}/{self.id}"
+        self._channel = channel
+
+    async def unarchive(self) -> None:
+        """Unarchive the thread."""
+        await self.guild.rest.request("thread", self.parent_id)
+        self.archived = False
+        self._channel.threads.append(self)
+
+
+class FakeMessage:
+    """A message the bot sent, which it can edit or delete."""
+
+    def __init__(self, channel: "FakeTextChannel"):
+        """Inits the message.
+
+        Args:
+            channel (FakeTextChannel): the channel the message was sent to
+        """
+        self.id = next(_ids)
+        self._channel = channel
+
+    async def edit(self, **kwargs: Any) -> None:
+        """Edit the message.
+
+        Args:
+            **kwargs (Any): the new message
+        """
+        del kwargs
+        await self._channel.guild.rest.request("message", self._channel.id)
+
+    async def delete(self) -> None:
+        """Delete the message."""
+        await self._channel.guild.rest.request("message", self._channel.id)
+
+
+class FakeTextChannel:
+    """A text channel with Leetcode problem threads.
+
+    Attributes:
+        id (int): the channel's ID
+        guild (FakeGuild): the server the channel is in
+        threads (list[FakeThread]): the active threads in the channel
+    """
+
+    def __init__(self, guild: "FakeGuild", problems: list[str]):
+        """Inits the channel, archiving most of its threads.
+
+        Args:
+            guild (FakeGuild): the server the channel is in
+            problems (list[str]): the names of the channel's threads
+        """
+        self.id = next(_ids)
+        self.guild = guild
+        allThreads = [FakeThread(p, self, random.random() < 0.8) for p in problems]
+        self.threads: list[FakeThread] = [th for th in allThreads if not th.archived]
+        self._archived: list[FakeThread] = [th for th in allThreads if th.archived]
+
+    async def archived_threads(self, limit: int | None) -> AsyncIterator[FakeThread]:
+        """List the archived threads a page at a time.
+
+        Args:
+            limit (int | None): the most threads to list, or None to list them all
+
+        Yields:
+            FakeThread: each archived thread
+        """
+        archived = self._archived[:limit]
+        for i in range(0, max(1, len(archived)), 50):
+            await self.guild.rest.request("thread", self.id)
+            for th in archived[i : i + 50]:
+                yield th
+
+    async def send(self, content: str | None = None, **kwargs: Any) -> FakeMessage:
+        """Send a message to the channel.
+
+        Args:
+            content (str | None, optional): the message. Defaults to None.
+            **kwargs (Any): anything else sent with the message
+
+        Returns:
+            FakeMessage: the sent message
+        """
+        del content, kwargs
+        await self.guild.rest.request("message", self.id)
+        return FakeMessage(self)
+
+
+class FakeBot:
+    """Stands in for NeilBot with the few things the cogs use from it.
+
+    Nothing is started and nothing is written to disk, so cogs can be created
+    against it directly without logging in.
+
+    Attributes:
+        user (FakeUser): the bot's own user, which joins voice channels
+        scheduler (AsyncIOScheduler): the scheduler background jobs are added to,
+        which is never started
+        httpClient (HttpClient): the HTTP client, which is never started
+        metrics (Metrics): the metrics commands record into
+        admission (AdmissionController): the admission control for expensive commands
+        voiceClients (dict[int, FakeVoiceClient]): maps a server ID to the bot's voice
+        connection in it
+    """
+
+    def __init__(self, rest: FakeRest):
+        """Inits the bot.
+
+        Args:
+            rest (FakeRest): the REST API the bot's user makes calls to
+        """
+        self.user = FakeUser("NeilBot", None, rest)
+        self.scheduler = AsyncIOScheduler()
+        self.httpClient = HttpClient()
+        self.metrics = Metrics()
+        self.admission = AdmissionController(self.metrics)
+        self.voiceClients: dict[int, FakeVoiceClient] = {}
+
+    @property
+    def voice_clients(self) -> list[FakeVoiceClient]:
+        """Get every voice connection of the bot.
+
+        Returns:
+            list[FakeVoiceClient]: the voice connections
+        """
+        return list(self.voiceClients.values())
+
+    async def ensureChunked(self, server: "FakeGuild") -> bool:
+        """Check that every member of a server is cached.
+
+        Args:
+            server (FakeGuild): the server
+
+        Returns:
+            bool: whether or not every member is cached
+        """
+        return server.chunked
+
+
+class FakeGuild:
+    """A Discord server with members, an anyone role, a voice channel and threads.
+
+    Attributes:
+        id (int): the server's ID
+        bot (FakeBot): the bot in the server
+        rest (FakeRest): the REST API the server's calls are made to
+        members (list[FakeUser]): every member, all of which are cached
+        member_count (int): the number of members
+        roles (list[FakeRole]): the server's roles
+        voice_channels (list[FakeVoiceChannel]): the server's voice channels
+        text_channel (FakeTextChannel): the channel with Leetcode threads
+        chunked (bool): always True, since every member is cached
+        queued (Callable[[], bool]): whether or not songs are waiting in the music
+        queue, so the voice client can measure the gaps between songs
+    """
+
+    def __init__(self, bot: FakeBot, rest: FakeRest, members: int, problems: list[str]):
+        """Inits the server.
+
+        Args:
+            bot (FakeBot): the bot in the server
+            rest (FakeRest): the REST API the server's calls are made to
+            members (int): how many members the server has, not including the bot
+            problems (list[str]): the names of the server's Leetcode threads
+        """
+        self.id = next(_ids)
+        self.bot = bot
+        self.rest = rest
+        self.members = [FakeUser(f"user{i}", self, rest) for i in range(members)]
+        self.member_count = members
+        self.roles = [FakeRole("anyone", self)]
+        self.voice_channels = [FakeVoiceChannel(self)]
+        # every member who runs a command is in the voice channel
+        for member in self.members:
+            member.voice = FakeVoiceState(self.voice_channels[0])
+        self.text_channel = FakeTextChannel(self, problems)
+        self.chunked = True
+        # whether the server has songs waiting to play, set by whatever runs the
+        # music player
+        self.queued: Callable[[], bool] = lambda: False
+
+    @property
+    def voice_client(self) -> FakeVoiceClient | None:
+        """Get the bot's voice connection in the server.
+
+        Returns:
+            FakeVoiceClient | None: the voice connection, or None if not connected
+        """
+        return self.bot.voiceClients.get(self.id)
+
+    def get_thread(self, thread_id: int) -> FakeThread | None:
+        """Find an active thread.
+
+        Args:
+            thread_id (int): the ID of the thread
+
+        Returns:
+            FakeThread | None: the thread, or None if it is not active
+        """
+        return next(
+            (th for th in self.text_channel.threads if th.id == thread_id), None
+        )
+
+
+class FakeInteraction:
+    """The interaction behind a slash command or a choice from a select menu.
+
+    Attributes:
+        user (FakeUser | None): the member who chose from a select menu, or None for
+        a slash command
+        data (dict[str, Any]): the values chosen from a select menu
+        response (FakeInteraction): responds to the interaction, which is done by
+        the interaction itself
+    """
+
+    def __init__(
+        self,
+        guild: FakeGuild,
+        user: FakeUser | None = None,
+        values: list[str] | None = None,
+    ):
+        """Inits the interaction.
+
+        Args:
+            guild (FakeGuild): the server the interaction is in
+            user (FakeUser | None, optional): the member who chose from a select
+            menu. Defaults to None.
+            values (list[str] | None, optional): the values chosen from a select
+            menu. Defaults to None.
+        """
+        self._guild = guild
+        self.user = user
+        self.data: dict[str, Any] = {"values": values or []}
+        self.response = self
+
+    async def edit_message(self, **kwargs: Any) -> None:
+        """Edit the message the select menu is in.
+
+        Args:
+            **kwargs (Any): the new message
+        """
+        del kwargs
+        await self._guild.rest.request("interaction", self._guild.id)
+
+    async def edit_original_response(self, **kwargs: Any) -> None:
+        """Edit the response to the slash command.
+
+        Args:
+            **kwargs (Any): the new message
+        """
+        del kwargs
+        await self._guild.rest.request("interaction", self._guild.id)
+
+    async def delete_original_response(self) -> None:
+        """Delete the response to the slash command."""
+        await self._guild.rest.request("interaction", self._guild.id)
+
+
+class FakeContext:
+    """The context of a slash command run by a member of a fake server.
+
+    Attributes:
+        guild (FakeGuild): the server the command was run in
+        author (FakeUser): the member who ran the command
+        channel (FakeTextChannel): the channel the command was run in
+        command (discord.ApplicationCommand): the command that was run
+        interaction (FakeInteraction): the interaction behind the command
+        deferredAfter (float | None): how many seconds it took to defer, or None if
+        the command has not deferred or responded yet
+    """
+
+    def __init__(
+        self,
+        guild: FakeGuild,
+        author: FakeUser,
+        command: discord.ApplicationCommand,
+        pick_seconds: float = 2.0,
+    ):
+        """Inits the context.
+
+        Args:
+            guild (FakeGuild): the server the command was run in
+            author (FakeUser): the member who ran the command
+            command (discord.ApplicationCommand): the command that was run
+            pick_seconds (float, optional): how long the member takes to choose
+            from a select menu in a response. Defaults to 2.0.
+        """
+        self.guild = guild
+        self.author = author
+        self.channel = guild.text_channel
+        self.command = command
+        self.interaction = FakeInteraction(guild)
+        self.deferredAfter: float | None = None
+        self._start = time.monotonic()
+        self._pickSeconds = pick_seconds
+
+    async def defer(self, **kwargs: Any) -> None:
+        """Acknowledge the command so it can respond later.
+
+        Args:
+            **kwargs (Any): whether the response is ephemeral
+        """
+        del kwargs
+        if self.deferredAfter is None:
+            self.deferredAfter = time.monotonic() - self._start
+        await self.guild.rest.request("interaction", self.guild.id)
+
+    async def respond(
+        self,
+        content: str | None = None,
+        view: discord.ui.View | None = None,
+        **kwargs: Any,
+    ) -> FakeMessage:
+        """Respond to the command, choosing from any select menus in the response.
+
+        Args:
+            content (str | None, optional): the response. Defaults to None.
+            view (discord.ui.View | None, optional): the components sent with the
+            response. Defaults to None.
+            **kwargs (Any): anything else sent with the response
+
+        Returns:
+            FakeMessage: the response
+        """
+        del content, kwargs
+        if self.deferredAfter is None:
+            self.deferredAfter = time.monotonic() - self._start
+        await self.guild.rest.request("interaction", self.guild.id)
+        if view:
+            task = asyncio.create_task(self._pick(view))
+            _picking.add(task)
+            task.add_done_callback(_picking.discard)
+        return FakeMessage(self.channel)
+
+    async def _pick(self, view: discord.ui.View) -> None:
+        """Choose a random option from each select menu, like the member would.
+
+        Args:
+            view (discord.ui.View): the components sent with a response
+        """
+        await asyncio.sleep(self._pickSeconds)
+        for item in view.children:
+            if not isinstance(item, discord.ui.Select):
+                continue
+            choice = str(random.randrange(len(item.options)))
+            interaction = cast(
+                discord.Interaction,
+                FakeInteraction(self.guild, self.author, [choice]),
+            )
+            # py-cord checks the member and refreshes the menu's values before
+            # calling it back
+            if await view.interaction_check(interaction):
+                item.refresh_state(interaction)
+                await item.callback(interaction)
+
+
+def writeFixtures(directory: Path, durations: list[float]) -> list[str]:
+    """Write silent WAV files for the stub extractor to serve.
+
+    Args:
+        directory (Path): the directory to write the files to
+        durations (list[float]): how many seconds each file lasts
+
+    Returns:
+        list[str]: the paths of the files
+    """
+    paths = []
+    for seconds in durations:
+        path = directory / f"fixture-{seconds:g}s.wav"
+        with wave.open(str(path), "wb") as fixture:
+            # the lowest quality WAV keeps the files tiny
+            fixture.setnchannels(1)
+            fixture.setsampwidth(1)
+            fixture.setframerate(8000)
+            fixture.writeframes(b"\x80" * int(seconds * 8000))
+        paths.append(str(path))
+    return paths
+
+
+class StubDownloader:
+    """Uses the Downloader protocol and serves fixture files instead of YouTube.
+
+    Extraction and downloads block a small pool of threads for a while, like yt-dlp,
+    so that contention for the pool shows up in the results.
+    """
+
+    def __init__(
+        self,
+        fixtures: list[str],
+        search_seconds: float = 0.3,
+        download_seconds: float = 1.0,
+        workers: int = 2,
+    ):
+        """Inits the stub extractor.
+
+        Args:
+            fixtures (list[str]): the paths of the audio files to serve
+            search_seconds (float, optional): how long resolving a URL blocks a
+            worker thread for. Defaults to 0.3.
+            download_seconds (float, optional): how long a download blocks a worker
+            thread for. Defaults to 1.0.
+            workers (int, optional): how many worker threads there are, like the
+            YouTube downloader. Defaults to 2.
+        """
+        self._fixtures = fixtures
+        self._searchSeconds = search_seconds
+        self._downloadSeconds = download_seconds
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="stub-yt-dlp")
+        self._directory = Path(tempfile.mkdtemp(prefix="neilbot-stub-songs-"))
+        weakref.finalize(self, shutil.rmtree, self._directory, True)
+
+    @staticmethod
+    def getSource() -> str:
+        """Get the source of this song download, i.e. the platform.
+
+        Returns:
+            str: the same source as the YouTube downloader, which it replaces
+        """
+        return YouTubeDownloader.getSource()
+
+    async def _block(self, seconds: float) -> None:
+        """Block a worker thread, like a yt-dlp call.
+
+        Args:
+            seconds (float): how long to block for
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            self._executor, functools.partial(time.sleep, seconds)
+        )
+
+    async def search(self, url_or_search: str, limit: int = 1) -> list[Track]:
+        """Resolve a URL or search query to fixture files.
+
+        Args:
+            url_or_search (str): either the URL of a song or a search query
+            limit (int, optional): the most search results to return. A URL always
+            leads to one song. Defaults to 1.
+
+        Returns:
+            list[Track]: the song, or a result for each fixture up to the limit
+        """
+        await self._block(self._searchSeconds)
+        if YouTubeDownloader._isYouTubeURL(url_or_search):
+            return [
+                Track(url_or_search, random.choice(self._fixtures), self.getSource())
+            ]
+        results = random.sample(self._fixtures * limit, limit)
+        return [
+            Track(f"{url_or_search} ({n})", fixture, self.getSource())
+            for n, fixture in enumerate(results, 1)
+        ]
+
+    def discard(self, tracks: list[Track]) -> None:
+        """Forget search results, which the stub never keeps.
+
+        Args:
+            tracks (list[Track]): the search results
+        """
+        del tracks
+
+    def memoryUsage(self) -> tuple[int, int]:
+        """Measure what is kept about the songs found, which is nothing.
+
+        Returns:
+            tuple[int, int]: no songs and no bytes
+        """
+        return 0, 0
+
+    async def download(self, track: Track) -> str:
+        """Pretend to download a song.
+
+        Args:
+            track (Track): the song to download
+
+        Returns:
+            str: the path of a copy of the song's fixture file
+        """
+        await self._block(self._downloadSeconds)
+        # the player removes each song once it has played, so every download is a
+        # copy of the fixture, like the YouTube downloader's own files
+        file = self._directory / f"{uuid.uuid4().hex}.wav"
+        await asyncio.to_thread(shutil.copyfile, track.url, file)
+        return str(file)
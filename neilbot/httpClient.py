@@ -0,0 +1,224 @@
+import asyncio
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any
+from urllib.parse import urlparse
+
+import aiohttp
+
+
+class HostStats:
+    """Request statistics for a single host.
+
+    Attributes:
+        requests (int): the number of requests that got a response
+        errors (int): the number of requests that failed without a response
+        totalLatency (float): the total number of seconds spent waiting for responses
+    """
+
+    def __init__(self) -> None:
+        """Inits the host statistics."""
+        self.requests = 0
+        self.errors = 0
+        self.totalLatency = 0.0
+
+    def recordResponse(self, latency: float) -> None:
+        """Record a request that got a response.
+
+        Args:
+            latency (float): how many seconds it took to get the response
+        """
+        self.requests += 1
+        self.totalLatency += latency
+
+    def recordError(self) -> None:
+        """Record a request that failed without a response."""
+        self.errors += 1
+
+    def averageLatency(self) -> float | None:
+        """Get the average time it takes the host to respond.
+
+        Returns:
+            float | None: the average number of seconds a response took, or None if
+            the host has not responded yet
+        """
+        return self.totalLatency / self.requests if self.requests else None
+
+
+class HttpClient:
+    """HTTP client shared by every part of the bot.
+
+    Connections are pooled and kept alive between requests, DNS lookups are cached,
+    every request has a timeout, and requests that fail because of the network or a
+    temporary server error are retried with exponential backoff. A server that says
+    how long to wait with Retry-After is asked again after that long instead, and
+    no retry waits longer than a limit.
+
+    Attributes:
+        hostStats (dict[str, HostStats]): request statistics for each host
+    """
+
+    # responses that mean the server might succeed if asked again
+    _RETRY_STATUSES = {429, 502, 503, 504}
+
+    def __init__(
+        self,
+        timeout: aiohttp.ClientTimeout = aiohttp.ClientTimeout(
+            total=30, connect=10, sock_read=20
+        ),
+        retries: int = 2,
+        backoff: float = 0.5,
+        max_backoff: float = 10.0,
+    ):
+        """Inits the HTTP client. The client must be started before it is used.
+
+        Args:
+            timeout (aiohttp.ClientTimeout, optional): the default timeouts for every
+            request. Defaults to 30 seconds in total and 10 seconds to connect.
+            retries (int, optional): how many times a failed request is retried.
+            Defaults to 2.
+            backoff (float, optional): how many seconds to wait before the first
+            retry, which doubles for every retry after. Defaults to 0.5.
+            max_backoff (float, optional): the most seconds to wait before a retry. A
+            response that asks to wait longer is not retried. Defaults to 10.0.
+        """
+        self._timeout = timeout
+        self._retries = retries
+        self._backoff = backoff
+        self._maxBackoff = max_backoff
+        self._session: aiohttp.ClientSession | None = None
+
+        self.hostStats: dict[str, HostStats] = {}
+
+    async def start(self) -> None:
+        """Create the connection pool, if it has not already been created."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=100,
+                # don't let one slow host use up the whole pool
+                limit_per_host=10,
+                ttl_dns_cache=300,
+                keepalive_timeout=30,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=self._timeout
+            )
+
+    async def close(self) -> None:
+        """Close every connection in the pool."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @asynccontextmanager
+    async def get(
+        self, url: str, **kwargs: Any
+    ) -> AsyncIterator[aiohttp.ClientResponse]:
+        """Send a GET request, retrying it if it fails.
+
+        Args:
+            url (str): the URL to send the request to
+            **kwargs (Any): any other arguments to aiohttp.ClientSession.get
+
+        Raises:
+            RuntimeError: the client has not been started
+
+        Yields:
+            aiohttp.ClientResponse: the response, which is released afterwards
+        """
+        if self._session is None:
+            raise RuntimeError("HTTP client has not been started")
+
+        stats = self.hostStats.setdefault(urlparse(url).netloc, HostStats())
+        attempt = 0
+        while True:
+            resp, delay = await self._attempt(
+                self._session, url, stats, attempt, **kwargs
+            )
+            if resp is not None:
+                break
+            await asyncio.sleep(delay)
+            attempt += 1
+
+        try:
+            yield resp
+        finally:
+            resp.release()
+
+    async def _attempt(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        stats: HostStats,
+        attempt: int,
+        **kwargs: Any,
+    ) -> tuple[aiohttp.ClientResponse | None, float]:
+        """Send a single attempt of a GET request.
+
+        Args:
+            session (aiohttp.ClientSession): the session to send the request with
+            url (str): the URL to send the request to
+            stats (HostStats): the statistics of the host the request is sent to
+            attempt (int): the number of attempts that have already failed
+            **kwargs (Any): any other arguments to aiohttp.ClientSession.get
+
+        Raises:
+            aiohttp.ClientConnectionError: the last attempt failed to connect
+            asyncio.TimeoutError: the last attempt timed out
+
+        Returns:
+            tuple[aiohttp.ClientResponse | None, float]: the response, or None if the
+            request should be retried, and how many seconds to wait before retrying
+        """
+        lastAttempt = attempt >= self._retries
+        delay = min(self._backoff * 2**attempt, self._maxBackoff)
+        start = time.perf_counter()
+        try:
+            resp = await session.get(url, **kwargs)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            stats.recordError()
+            if lastAttempt:
+                raise
+            return None, delay
+
+        stats.recordResponse(time.perf_counter() - start)
+        if resp.status not in self._RETRY_STATUSES or lastAttempt:
+            return resp, 0.0
+        retryAfter = self._retryAfter(resp)
+        if retryAfter is not None:
+            # retrying sooner than the server asked would only be turned away again
+            if retryAfter > self._maxBackoff:
+                return resp, 0.0
+            delay = retryAfter
+        resp.release()
+        return None, delay
+
+    @staticmethod
+    def _retryAfter(resp: aiohttp.ClientResponse) -> float | None:
+        """Read how long a server asked to wait before sending the request again.
+
+        Args:
+            resp (aiohttp.ClientResponse): the response that asked to wait
+
+        Returns:
+            float | None: how many seconds to wait, or None if the response does not
+            have a valid Retry-After header
+        """
+        value = resp.headers.get("Retry-After")
+        if value is None:
+            return None
+        # the header is either a number of seconds or the date to wait until
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            until = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if until.tzinfo is None:
+            until = until.replace(tzinfo=timezone.utc)
+        return max(0.0, (until - datetime.now(timezone.utc)).total_seconds())
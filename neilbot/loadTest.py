@@ -0,0 +1,458 @@
+import argparse
+import asyncio
+import random
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from collections import Counter, defaultdict
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any, cast
+
+import discord
+
+from neilbot.cogs.anyone import Anyone
+from neilbot.cogs.leetcode import Leetcode
+from neilbot.cogs.player import Player
+from neilbot.fakeDiscord import (
+    FakeBot,
+    FakeContext,
+    FakeGuild,
+    FakeRest,
+    StubDownloader,
+    openFakeAudio,
+    writeFixtures,
+)
+from neilbot.neilbot import NeilBot
+
+# Discord fails an interaction that is not responded to within this many seconds
+_RESPONSE_DEADLINE = 3
+
+
+def _percentile(values: list[float], percent: float) -> float:
+    """Find a percentile of some measurements.
+
+    Args:
+        values (list[float]): the measurements
+        percent (float): the percentile to find, from 0 to 100
+
+    Returns:
+        float: the measurement at the percentile, or 0 if there are none
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(percent / 100 * len(ordered)))]
+
+
+def _parseMix(mix: str) -> dict[str, float]:
+    """Parse a command mix such as "play_youtube=4,queue=1".
+
+    Args:
+        mix (str): comma separated commands and their relative weights
+
+    Raises:
+        argparse.ArgumentTypeError: the mix is not valid
+
+    Returns:
+        dict[str, float]: maps a command name to its weight
+    """
+    try:
+        weights = {
+            name.strip(): float(weight)
+            for name, weight in (part.split("=") for part in mix.split(","))
+        }
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid command mix: {mix}")
+    unknown = weights.keys() - LoadTest.COMMANDS
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Unknown commands: {', '.join(unknown)}")
+    return weights
+
+
+def _song() -> list[str]:
+    """Pick what a member asks to play, which is a search query half of the time.
+
+    Returns:
+        list[str]: the URL or search query
+    """
+    if random.random() < 0.5:
+        return [f"never gonna give you up {random.randrange(10**9)}"]
+    return [f"https://www.youtube.com/watch?v={random.randrange(10**9)}"]
+
+
+class LoadTest:
+    """Drives the bot's cogs with simulated traffic from many servers.
+
+    The cogs run unchanged against a fake bot that never logs in. Discord is
+    replaced with fake servers and a fake REST API with rate limits. yt-dlp is
+    replaced with a stub extractor that serves local audio fixtures, and the voice
+    clients play them in real time without sending any audio. Members pick one of
+    the results of their searches. Commands arrive at random at a steady rate, so
+    the results show how latency grows with load.
+
+    The defaults fit within the admission budgets. The stub extractor, like
+    yt-dlp, only has two workers, which can resolve and download about one and a
+    half songs a second, so higher rates of play_youtube are turned away as
+    Overloaded once the extraction line is full.
+    """
+
+    # the commands that can be part of a mix
+    COMMANDS = {"play_youtube", "skip", "queue", "lc_thread", "anyone_rand"}
+
+    def __init__(self, args: argparse.Namespace):
+        """Inits the load test, creating the bot and fake servers.
+
+        Args:
+            args (argparse.Namespace): the parsed command line arguments
+        """
+        self._args = args
+        self._rest = FakeRest(args.rest_latency)
+
+        self.bot = FakeBot(self._rest)
+        bot = cast(NeilBot, self.bot)
+
+        self._fixtureDirectory = tempfile.TemporaryDirectory(prefix="neilbot-load-")
+        fixtures = writeFixtures(Path(self._fixtureDirectory.name), args.track_seconds)
+        player = Player(bot)
+        downloader = StubDownloader(
+            fixtures, args.search_seconds, args.download_seconds
+        )
+        setattr(player, "_downloaders", {downloader.getSource(): downloader})
+        setattr(player, "_openAudio", openFakeAudio)
+        songQueue = getattr(player, "_songQueue")
+
+        problems = [f"{n}. Problem {n}" for n in range(1, args.threads + 1)]
+        self._guilds = []
+        for _ in range(args.guilds):
+            guild = FakeGuild(self.bot, self._rest, args.members, problems)
+
+            def queued(guildID: int = guild.id) -> bool:
+                return bool(songQueue[guildID])
+
+            guild.queued = queued
+            self._guilds.append(guild)
+
+        leetcode = Leetcode(bot)
+        anyone = Anyone(bot)
+        # maps a command name to its cog, the command and a function that picks its
+        # options
+        self._commands: dict[str, tuple[discord.Cog, Any, Callable[[], list[str]]]] = {
+            "play_youtube": (player, getattr(player, "play_youtube_audio"), _song),
+            "skip": (player, getattr(player, "skip_audio"), lambda: []),
+            "queue": (player, getattr(player, "show_queue"), lambda: []),
+            "lc_thread": (
+                leetcode,
+                getattr(leetcode, "find_lc_thread"),
+                lambda: [str(random.randint(1, args.threads))],
+            ),
+            "anyone_rand": (anyone, getattr(anyone, "set_anyone_rand"), lambda: []),
+        }
+
+        # maps a command name to how long each run took
+        self._latencies: defaultdict[str, list[float]] = defaultdict(list)
+        # maps a command name to how long each run took to defer or respond
+        self._responseTimes: defaultdict[str, list[float]] = defaultdict(list)
+        # maps a command name and error to how many times the command raised it
+        self._errors: Counter[tuple[str, str]] = Counter()
+        self._loopLag: list[float] = []
+
+    async def _invoke(self, name: str) -> None:
+        """Run a command as a random member of a random server, timing it.
+
+        Args:
+            name (str): the name of the command to run
+        """
+        cog, command, options = self._commands[name]
+        guild = random.choice(self._guilds)
+        ctx = FakeContext(
+            guild, random.choice(guild.members), command, self._args.pick_seconds
+        )
+        start = time.monotonic()
+        try:
+            # the cogs are not added to a bot, so their commands are not bound to them
+            await command.callback(cog, ctx, *options())
+        except asyncio.CancelledError:
+            # the command was still running when the test ended
+            self._errors[name, "unfinished"] += 1
+        except Exception as e:
+            self._errors[name, type(e).__name__] += 1
+            if self._args.verbose:
+                traceback.print_exception(e)
+        finally:
+            self._latencies[name].append(time.monotonic() - start)
+            if ctx.deferredAfter is not None:
+                self._responseTimes[name].append(ctx.deferredAfter)
+
+    async def _sampleLoopLag(self, interval: float = 0.05) -> None:
+        """Record how late the event loop wakes up, for as long as the test runs.
+
+        Args:
+            interval (float, optional): how many seconds apart to sample. Defaults
+            to 0.05.
+        """
+        while True:
+            expected = time.monotonic() + interval
+            await asyncio.sleep(interval)
+            self._loopLag.append(max(0.0, time.monotonic() - expected))
+
+    async def run(self) -> float:
+        """Send commands at random for the length of the test, then wait for them.
+
+        Returns:
+            float: how many seconds the test took, including waiting for commands
+        """
+        weights = self._args.mix
+        names = list(weights)
+        sampler = asyncio.create_task(self._sampleLoopLag())
+        tasks = set()
+        start = time.monotonic()
+        end = start + self._args.duration
+        while time.monotonic() < end:
+            # exponential gaps between commands make them arrive like real users
+            await asyncio.sleep(random.expovariate(self._args.rate))
+            name = random.choices(names, [weights[n] for n in names])[0]
+            task = asyncio.create_task(self._invoke(name))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=self._args.drain)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending)
+        sampler.cancel()
+        return time.monotonic() - start
+
+    def report(self, elapsed: float) -> str:
+        """Summarize the throughput, latency and load of the test.
+
+        Args:
+            elapsed (float): how many seconds the test took
+
+        Returns:
+            str: the results as a table
+        """
+        runs = sum(map(len, self._latencies.values()))
+        lines = [
+            f"Ran {runs} commands in {elapsed:.1f}s across {len(self._guilds)} "
+            f"servers ({runs / elapsed:.1f}/s)",
+            "",
+            f"{'command':<14}{'runs':>7}{'errors':>8}{'p50':>9}{'p95':>9}"
+            f"{'p99':>9}{'max':>9}{'late':>7}",
+        ]
+        for name, latencies in sorted(self._latencies.items()):
+            errors = sum(n for (c, _), n in self._errors.items() if c == name)
+            # responses after the deadline would have failed on Discord
+            late = sum(t > _RESPONSE_DEADLINE for t in self._responseTimes[name])
+            late += len(latencies) - len(self._responseTimes[name])
+            lines.append(
+                f"{name:<14}{len(latencies):>7}{errors:>8}"
+                + "".join(
+                    f"{_percentile(latencies, p):>8.3f}s" for p in (50, 95, 99, 100)
+                )
+                + f"{late:>7}"
+            )
+        lines.append("")
+        for (name, error), count in self._errors.most_common():
+            lines.append(f"{name} raised {error} {count} time(s)")
+
+        transitions = [
+            gap for vc in self.bot.voiceClients.values() for gap in vc.transitions
+        ]
+        lines.append(
+            f"Song transitions: {len(transitions)}, "
+            f"p50 {_percentile(transitions, 50):.3f}s, "
+            f"p95 {_percentile(transitions, 95):.3f}s, "
+            f"max {_percentile(transitions, 100):.3f}s"
+        )
+        lines.append(
+            f"Event loop lag: p50 {_percentile(self._loopLag, 50) * 1000:.1f}ms, "
+            f"p99 {_percentile(self._loopLag, 99) * 1000:.1f}ms, "
+            f"max {_percentile(self._loopLag, 100) * 1000:.1f}ms"
+        )
+        lines.append(
+            "REST calls: "
+            + ", ".join(
+                f"{route} {calls} ({self._rest.rateLimited[route]} rate limited)"
+                for route, calls in self._rest.calls.most_common()
+            )
+            + f", {self._rest.waited:.1f}s spent waiting for rate limits"
+        )
+        return "\n".join(lines)
+
+    def close(self) -> None:
+        """Remove the audio fixtures."""
+        self._fixtureDirectory.cleanup()
+
+
+async def _loadTest(args: argparse.Namespace) -> None:
+    """Run a load test and print the results.
+
+    Args:
+        args (argparse.Namespace): the parsed command line arguments
+    """
+    loadTest = LoadTest(args)
+    try:
+        elapsed = await loadTest.run()
+        print(loadTest.report(elapsed))
+    finally:
+        loadTest.close()
+
+
+def _playInRealTime(source: discord.AudioSource, packets: list[int]) -> None:
+    """Read a song a packet every 20ms, like a voice client's audio thread.
+
+    Args:
+        source (discord.AudioSource): the song to read
+        packets (list[int]): the number of packets read is added to this list
+    """
+    start = time.perf_counter()
+    count = 0
+    while source.read():
+        count += 1
+        delay = start + count * 0.02 - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    source.cleanup()
+    packets.append(count)
+
+
+async def _measureAudio(args: argparse.Namespace) -> bool:
+    """Play songs at the same time through FFmpeg and print how the bot coped.
+
+    Each song is opened the way the player opens it, and read on its own thread in
+    real time, the way voice clients read them, without sending anything. FFmpeg has
+    to be installed.
+
+    Args:
+        args (argparse.Namespace): the parsed command line arguments
+
+    Returns:
+        bool: whether or not every song played
+    """
+    lags: list[float] = []
+
+    async def sample(interval: float = 0.01) -> None:
+        while True:
+            expected = time.monotonic() + interval
+            await asyncio.sleep(interval)
+            lags.append(max(0.0, time.monotonic() - expected))
+
+    with tempfile.TemporaryDirectory(prefix="neilbot-audio-") as directory:
+        seconds = min(args.track_seconds)
+        fixture = writeFixtures(Path(directory), [seconds])[0]
+        sampler = asyncio.create_task(sample())
+        start = time.monotonic()
+        # the CPU time of this process only, since FFmpeg runs in its own processes
+        cpuStart = time.process_time()
+        packets: list[int] = []
+        try:
+            threads = [
+                threading.Thread(
+                    target=_playInRealTime, args=(Player._openAudio(fixture), packets)
+                )
+                for _ in range(args.audio_streams)
+            ]
+        except discord.ClientException as e:
+            print(f"Unable to start FFmpeg: {e}")
+            return False
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            await asyncio.sleep(0.1)
+        sampler.cancel()
+
+    elapsed = time.monotonic() - start
+    # each Opus packet is 20ms of audio
+    expected = seconds / 0.02
+    print(
+        f"Played {len(packets)} songs of {seconds:g}s at once in {elapsed:.1f}s, "
+        f"{sum(packets)} packets (expected {expected * len(packets):.0f})"
+    )
+    print(f"Bot CPU time: {time.process_time() - cpuStart:.2f}s")
+    print(
+        f"Event loop lag: p50 {_percentile(lags, 50) * 1000:.1f}ms, "
+        f"p99 {_percentile(lags, 99) * 1000:.1f}ms, "
+        f"max {_percentile(lags, 100) * 1000:.1f}ms"
+    )
+    return all(abs(count - expected) <= expected * 0.1 for count in packets)
+
+
+def main() -> None:
+    """Runs a load test of the bot against a fake Discord."""
+    parser = argparse.ArgumentParser(
+        description="Measure how much traffic the bot can serve, without Discord."
+    )
+    parser.add_argument("--guilds", type=int, default=50, help="servers to simulate")
+    parser.add_argument("--members", type=int, default=50, help="members per server")
+    parser.add_argument(
+        "--threads", type=int, default=200, help="Leetcode threads per server"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=10, help="commands per second, on average"
+    )
+    parser.add_argument(
+        "--duration", type=float, default=60, help="seconds to send commands for"
+    )
+    parser.add_argument(
+        "--drain",
+        type=float,
+        default=30,
+        help="seconds to wait for running commands after the test",
+    )
+    parser.add_argument(
+        "--mix",
+        type=_parseMix,
+        default="play_youtube=1,skip=1,queue=3,lc_thread=3,anyone_rand=2",
+        help="relative weights of the commands to run",
+    )
+    parser.add_argument(
+        "--track-seconds",
+        type=float,
+        nargs="+",
+        default=[10, 20, 30],
+        help="lengths of the audio fixtures",
+    )
+    parser.add_argument(
+        "--search-seconds",
+        type=float,
+        default=0.3,
+        help="seconds the stub extractor takes to resolve a URL",
+    )
+    parser.add_argument(
+        "--download-seconds",
+        type=float,
+        default=1.0,
+        help="seconds the stub extractor takes to download a song",
+    )
+    parser.add_argument(
+        "--pick-seconds",
+        type=float,
+        default=2.0,
+        help="seconds members take to pick one of the search results",
+    )
+    parser.add_argument(
+        "--rest-latency",
+        type=float,
+        default=0.05,
+        help="average seconds a REST call takes",
+    )
+    parser.add_argument("--seed", type=int, help="seed for repeatable runs")
+    parser.add_argument(
+        "--verbose", action="store_true", help="print the traceback of every error"
+    )
+    parser.add_argument(
+        "--audio-streams",
+        type=int,
+        help="instead of a load test, play this many of the shortest fixture at once "
+        "through FFmpeg and report the bot's CPU time and event loop lag",
+    )
+    args = parser.parse_args()
+
+    if args.audio_streams:
+        sys.exit(0 if asyncio.run(_measureAudio(args)) else 1)
+    random.seed(args.seed)
+    asyncio.run(_loadTest(args))
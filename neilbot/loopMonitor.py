@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from neilbot.metrics import Metrics
+
+
+class LoopMonitor:
+    """Measures event loop lag and logs whatever is blocking the loop when it stalls.
+
+    A heartbeat task on the event loop records how late each of its wake ups is. A
+    watchdog thread checks that the heartbeat keeps beating, and if it stops for
+    longer than the threshold, then the loop is being blocked by synchronous code.
+    The watchdog logs the stack of the event loop thread at that moment, along with
+    the command that was running, so the blocking call can be found.
+    """
+
+    def __init__(self, metrics: Metrics, interval: float = 0.1, threshold: float = 0.5):
+        """Inits the loop monitor. The monitor must be started on the event loop.
+
+        Args:
+            metrics (Metrics): the metrics to record loop lag and stalls in
+            interval (float, optional): how many seconds apart the heartbeat beats.
+            Defaults to 0.1.
+            threshold (float, optional): how many seconds the loop can be blocked for
+            before its stack is logged. Defaults to 0.5.
+        """
+        self._metrics = metrics
+        self._interval = interval
+        self._threshold = threshold
+
+        # maps a running task to the name of the command it is running, so that
+        # stalls can be blamed on a command
+        self.commands: dict[asyncio.Task, str] = {}
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loopThreadID = 0
+        self._heartbeat: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stopped = threading.Event()
+        # the last time the heartbeat beat, written on the loop and read by the
+        # watchdog, which is safe since it is a single float
+        self._lastBeat = time.monotonic()
+
+    def start(self) -> None:
+        """Start the heartbeat and watchdog, if they are not already running.
+
+        Must be called from the event loop that is monitored.
+        """
+        if self._heartbeat is None:
+            self._loop = asyncio.get_running_loop()
+            self._loopThreadID = threading.get_ident()
+            self._lastBeat = time.monotonic()
+            self._stopped.clear()
+            self._heartbeat = asyncio.create_task(self._beat())
+            self._watchdog = threading.Thread(
+                target=self._watch, name="loop-watchdog", daemon=True
+            )
+            self._watchdog.start()
+
+    async def stop(self) -> None:
+        """Stop the heartbeat and watchdog."""
+        self._stopped.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+    async def _beat(self) -> None:
+        """Wake up regularly and record how late each wake up was."""
+        while True:
+            expected = time.monotonic() + self._interval
+            await asyncio.sleep(self._interval)
+            now = time.monotonic()
+            self._lastBeat = now
+            self._metrics.observe("neilbot_loop_lag_seconds", max(now - expected, 0))
+
+    def _watch(self) -> None:
+        """Check the heartbeat from another thread and report stalls as they happen.
+
+        Each stall is only reported once, while it is still happening, so the stack
+        shows the code that is blocking the loop.
+        """
+        reportedBeat = None
+        while not self._stopped.wait(self._interval):
+            lastBeat = self._lastBeat
+            stalled = time.monotonic() - lastBeat
+            if stalled > self._threshold and lastBeat != reportedBeat:
+                reportedBeat = lastBeat
+                self._reportStall(stalled)
+
+    def _reportStall(self, stalled: float) -> None:
+        """Log the stack of the event loop thread and the command it is running.
+
+        Args:
+            stalled (float): how many seconds the loop has been blocked for so far
+        """
+        self._metrics.increment("neilbot_loop_stalls_total")
+        frame = sys._current_frames().get(self._loopThreadID)
+        stack = "".join(traceback.format_stack(frame)) if frame else "unavailable\n"
+        # the task the loop is running is the one blocking it. Reading it from
+        # another thread is only a dictionary lookup, so it is safe here
+        task = asyncio.current_task(self._loop) if self._loop else None
+        command = self.commands.get(task, "none") if task else "none"
+        logging.warning(
+            f"Event loop blocked for {stalled:.2f}s while running command "
+            f"'{command}', in:\n{stack}"
+        )
@@ -0,0 +1,253 @@
+import bisect
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from aiohttp import web
+
+# a set of label names and values that identifies one series of a metric
+_Labels = tuple[tuple[str, str], ...]
+
+
+class Histogram:
+    """Counts observed durations in cumulative buckets, like a Prometheus histogram.
+
+    Attributes:
+        counts (list[int]): the number of observations in each bucket, not including
+        the observations in smaller buckets
+        total (float): the sum of every observation
+        count (int): the number of observations
+    """
+
+    # upper bounds of the buckets in seconds, from a few milliseconds of event loop
+    # lag to the 15 minute limit Discord gives deferred interactions
+    BUCKETS = (
+        0.005,
+        0.01,
+        0.025,
+        0.05,
+        0.1,
+        0.25,
+        0.5,
+        1,
+        2.5,
+        5,
+        10,
+        30,
+        60,
+        300,
+        900,
+    )
+
+    def __init__(self) -> None:
+        """Inits an empty histogram."""
+        # the extra bucket is for observations larger than every bound
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """Record an observation.
+
+        Args:
+            value (float): the observed duration in seconds
+        """
+        self.counts[bisect.bisect_left(self.BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Metrics:
+    """Collects latency histograms and counters, and serves them to Prometheus.
+
+    Every metric is declared in _METRICS so it has a type and help text, and each
+    series of a metric is identified by its labels.
+    """
+
+    # maps a metric name to its type and help text
+    _METRICS = {
+        "neilbot_command_seconds": (
+            "histogram",
+            "Time taken to run a slash command, by command and outcome.",
+        ),
+        "neilbot_button_seconds": (
+            "histogram",
+            "Time taken to handle a button press, by button and outcome.",
+        ),
+        "neilbot_phase_seconds": (
+            "histogram",
+            "Time taken by one phase of a command, such as deferring or downloading.",
+        ),
+        "neilbot_command_errors_total": (
+            "counter",
+            "Number of slash commands that raised an error, by command and error.",
+        ),
+        "neilbot_rest_calls_total": (
+            "counter",
+            "Number of Discord REST calls made while running a command or a "
+            "background job.",
+        ),
+        "neilbot_ytdlp_seconds": (
+            "histogram",
+            "Time taken by yt-dlp, by operation, including creating YoutubeDL.",
+        ),
+        "neilbot_loop_lag_seconds": (
+            "histogram",
+            "How late the event loop was to run a callback that was due.",
+        ),
+        "neilbot_loop_stalls_total": (
+            "counter",
+            "Number of times synchronous code blocked the event loop for too long.",
+        ),
+        "neilbot_player_updates_total": (
+            "counter",
+            "Number of music player message updates, by whether they were sent, "
+            "edited, pressed, coalesced into another update or failed.",
+        ),
+        "neilbot_admission_wait_seconds": (
+            "histogram",
+            "Time an expensive command waited for a turn, by command class.",
+        ),
+        "neilbot_admission_rejected_total": (
+            "counter",
+            "Number of expensive commands turned away, by command class and reason.",
+        ),
+    }
+
+    def __init__(self) -> None:
+        """Inits the metrics with no observations."""
+        self._histograms: dict[str, dict[_Labels, Histogram]] = {}
+        self._counters: dict[str, dict[_Labels, float]] = {}
+        self._runner: web.AppRunner | None = None
+
+    @staticmethod
+    def _labels(labels: dict[str, str]) -> _Labels:
+        """Turn keyword labels into a key that identifies their series.
+
+        Args:
+            labels (dict[str, str]): maps a label name to its value
+
+        Returns:
+            _Labels: the sorted label names and values
+        """
+        return tuple(sorted(labels.items()))
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        """Record a duration in a histogram.
+
+        Args:
+            name (str): the name of the histogram
+            seconds (float): the duration to record
+            **labels (str): the labels of the series to record it in
+        """
+        series = self._histograms.setdefault(name, {})
+        key = self._labels(labels)
+        if key not in series:
+            series[key] = Histogram()
+        series[key].observe(seconds)
+
+    def increment(self, name: str, amount: float = 1, **labels: str) -> None:
+        """Add to a counter.
+
+        Args:
+            name (str): the name of the counter
+            amount (float, optional): how much to add. Defaults to 1.
+            **labels (str): the labels of the series to add to
+        """
+        series = self._counters.setdefault(name, {})
+        key = self._labels(labels)
+        series[key] = series.get(key, 0) + amount
+
+    @contextmanager
+    def phase(self, command: str, phase: str) -> Iterator[None]:
+        """Time one phase of a command, even if it raises an error.
+
+        Args:
+            command (str): the name of the command
+            phase (str): the name of the phase, such as "defer" or "download"
+
+        Yields:
+            None: the phase runs inside the with statement
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(
+                "neilbot_phase_seconds",
+                time.perf_counter() - start,
+                command=command,
+                phase=phase,
+            )
+
+    def render(self) -> str:
+        """Format every metric in the Prometheus text format.
+
+        Returns:
+            str: the metrics, ready to be scraped
+        """
+        lines = []
+        for name, (kind, description) in self._METRICS.items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, histogram in self._histograms.get(name, {}).items():
+                cumulative = 0
+                for bound, count in zip((*Histogram.BUCKETS, "+Inf"), histogram.counts):
+                    cumulative += count
+                    bucketKey = (*key, ("le", str(bound)))
+                    lines.append(f"{name}_bucket{self._format(bucketKey)} {cumulative}")
+                lines.append(f"{name}_sum{self._format(key)} {histogram.total}")
+                lines.append(f"{name}_count{self._format(key)} {histogram.count}")
+            for key, value in self._counters.get(name, {}).items():
+                lines.append(f"{name}{self._format(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _format(labels: _Labels) -> str:
+        """Format labels the way Prometheus expects them.
+
+        Args:
+            labels (_Labels): the label names and values
+
+        Returns:
+            str: the labels in braces, or an empty string if there are no labels
+        """
+        if not labels:
+            return ""
+        escaped = (
+            (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+            for name, value in labels
+        )
+        return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+    async def _handleScrape(self, request: web.Request) -> web.Response:
+        """Respond to a scrape from Prometheus.
+
+        Args:
+            request (web.Request): the scrape request
+
+        Returns:
+            web.Response: every metric in the Prometheus text format
+        """
+        del request
+        return web.Response(text=self.render(), content_type="text/plain")
+
+    async def serve(self, host: str, port: int) -> None:
+        """Start serving the metrics at /metrics, if they are not already served.
+
+        Args:
+            host (str): the address to listen on
+            port (int): the port to listen on
+        """
+        if self._runner is None:
+            app = web.Application()
+            app.router.add_get("/metrics", self._handleScrape)
+            self._runner = web.AppRunner(app, access_log=None)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, host, port).start()
+
+    async def close(self) -> None:
+        """Stop serving the metrics."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -1,36 +1,193 @@
+import asyncio
 import os
+import time
+from collections import defaultdict
+from pathlib import Path
 
-import aiohttp
 import discord
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
+from neilbot.admission import AdmissionController
+from neilbot.httpClient import HttpClient
+from neilbot.loopMonitor import LoopMonitor
+from neilbot.metrics import Metrics
 
-class NeilBot(discord.Bot):
+
+class NeilBot(discord.AutoShardedBot):
     """Custom Discord bot with useful features.
 
-    Contains clients for easily interacting with other services.
+    Contains clients for easily interacting with other services. The bot is sharded
+    automatically, and can also run a subset of the shards so that the rest can run
+    in other processes.
     """
 
+    # maps a member cache policy to the members cached by that policy
+    _MEMBER_CACHE_POLICIES = {
+        "all": discord.MemberCacheFlags.all(),
+        "joined": discord.MemberCacheFlags(joined=True),
+        "voice": discord.MemberCacheFlags(voice=True),
+        "none": discord.MemberCacheFlags.none(),
+    }
+
     def __init__(self) -> None:
         """Inits a new new instance of the NeilBot Discord bot.
 
-        Loads additional cog components from the cogs/ directory.
+        Loads additional cog components from the cogs/ directory, recording how long
+        each one takes to load.
+
+        The member cache can be configured with the MEMBER_CACHE environment
+        variable, which is one of "all" (the default), "joined", "voice" or "none".
+        When joining members are cached, servers are chunked at startup unless
+        CHUNK_GUILDS is set to "lazy", in which case each server is only chunked the
+        first time a command needs its members.
+
+        Metrics are served for Prometheus on the port set by METRICS_PORT (9091 by
+        default) and the address set by METRICS_HOST (every address by default), or
+        not served at all if METRICS_PORT is empty.
+
+        Discord decides how many shards to use unless SHARD_COUNT is set, and every
+        shard is run unless SHARD_IDS is set to a comma separated list of the shards
+        to run, which requires SHARD_COUNT.
+
+        Raises:
+            ValueError: the member cache policy, chunking strategy or shards are not
+            valid
         """
+        # store the time the bot started so we can measure how long startup takes
+        self.startTime = time.perf_counter()
+
+        memberCache = os.getenv("MEMBER_CACHE", "all").lower()
+        if memberCache not in self._MEMBER_CACHE_POLICIES:
+            raise ValueError(f"Unknown member cache policy: {memberCache}")
+        chunkGuilds = os.getenv("CHUNK_GUILDS", "startup").lower()
+        if chunkGuilds not in ("startup", "lazy"):
+            raise ValueError(f"Unknown chunking strategy: {chunkGuilds}")
+        self.memberCacheFlags = self._MEMBER_CACHE_POLICIES[memberCache]
+
+        shardCount = os.getenv("SHARD_COUNT")
+        shardIDs = os.getenv("SHARD_IDS")
+        if shardIDs and not shardCount:
+            raise ValueError("SHARD_IDS requires SHARD_COUNT to be set")
+
         activity = discord.Game(name="Leetcode")
         allowed_mentions = discord.AllowedMentions.all()
+        # the members intent is needed to list members on demand when they are not
+        # cached, and the member cache policy decides which members are kept
         intents = discord.Intents(guilds=True, members=True, voice_states=True)
         super().__init__(
-            activity=activity, allowed_mentions=allowed_mentions, intents=intents
+            activity=activity,
+            allowed_mentions=allowed_mentions,
+            intents=intents,
+            member_cache_flags=self.memberCacheFlags,
+            chunk_guilds_at_startup=(
+                self.memberCacheFlags.joined and chunkGuilds == "startup"
+            ),
+            shard_count=int(shardCount) if shardCount else None,
+            shard_ids=[int(i) for i in shardIDs.split(",")] if shardIDs else None,
         )
 
-        # load all cogs into the bot
-        for filename in os.listdir("./neilbot/cogs"):
+        # scheduler shared by all cogs for running background jobs, started once the
+        # event loop is running
+        self.scheduler = AsyncIOScheduler()
+
+        # client for making HTTP requests, shared by all cogs so they reuse the same
+        # connections. It is started before logging in and closed when the bot closes
+        self.httpClient = HttpClient()
+
+        # latency and error metrics for commands, buttons and the phases within them
+        self.metrics = Metrics()
+        metricsPort = os.getenv("METRICS_PORT", "9091")
+        self._metricsPort = int(metricsPort) if metricsPort else None
+        self._metricsHost = os.getenv("METRICS_HOST", "0.0.0.0")
+        # watches for synchronous code blocking the event loop
+        self.loopMonitor = LoopMonitor(self.metrics)
+        # limits how many expensive commands run at once, across every server
+        self.admission = AdmissionController(self.metrics)
+
+        # mutex locks so that each server is only chunked once at a time
+        self._chunkLocks: defaultdict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+        # maps a cog name to how many seconds it took to import and load
+        self.cogLoadTimes: dict[str, float] = {}
+
+        # load all cogs into the bot, finding them next to this file so the bot can
+        # be started from any directory
+        for path in sorted((Path(__file__).parent / "cogs").glob("*.py")):
             # if a filename starts with an underscore then it is a private helper
             # and not a cog
-            if not filename.startswith("_") and filename.endswith(".py"):
-                # remove the extension from the name
-                self.load_extension(f"neilbot.cogs.{filename[:-3]}")
+            if not path.name.startswith("_"):
+                start = time.perf_counter()
+                self.load_extension(f"neilbot.cogs.{path.stem}")
+                self.cogLoadTimes[path.stem] = time.perf_counter() - start
+
+    async def ensureChunked(self, server: discord.Guild) -> bool:
+        """Makes sure every member of a server is cached, if the cache policy allows.
+
+        Servers that were not chunked at startup are chunked the first time this is
+        called for them.
+
+        Args:
+            server (discord.Guild): the server to cache the members of
+
+        Returns:
+            bool: whether or not every member of the server is cached
+        """
+        # chunking is only useful if the members it receives are kept in the cache
+        if self.memberCacheFlags.joined:
+            async with self._chunkLocks[server.id]:
+                if not server.chunked:
+                    await server.chunk()
+        return server.chunked
+
+    async def invoke_application_command(self, ctx: discord.ApplicationContext) -> None:
+        """Run a slash command and record how long it took and whether it failed.
+
+        Args:
+            ctx (discord.ApplicationContext): the context of the command to run
+        """
+        start = time.perf_counter()
+        # let the loop monitor blame the command if it blocks the event loop
+        task = asyncio.current_task()
+        if task:
+            self.loopMonitor.commands[task] = ctx.command.qualified_name
+        try:
+            await super().invoke_application_command(ctx)
+        finally:
+            if task:
+                self.loopMonitor.commands.pop(task, None)
+            # errors are handled by the error listeners, and the command is only
+            # marked as failed when there was one
+            failed = getattr(ctx, "command_failed", False)
+            self.metrics.observe(
+                "neilbot_command_seconds",
+                time.perf_counter() - start,
+                command=ctx.command.qualified_name,
+                outcome="error" if failed else "ok",
+            )
+
+    async def login(self, token: str) -> None:
+        """Start the HTTP client, metrics server and loop monitor, then log in.
+
+        Args:
+            token (str): the Discord bot token
+        """
+        await self.httpClient.start()
+        self.loopMonitor.start()
+        if self._metricsPort is not None:
+            await self.metrics.serve(self._metricsHost, self._metricsPort)
+        await super().login(token)
+
+    async def close(self) -> None:
+        """Disconnect from Discord, then stop everything started alongside the bot."""
+        await super().close()
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+        await self.httpClient.close()
+        await self.metrics.close()
+        await self.loopMonitor.stop()
 
     async def on_ready(self) -> None:
         """Setup class members potentially needed for more than one component."""
-        # create client for making HTTP requests
-        self.httpClient = aiohttp.ClientSession()
+        # on_ready can fire again after a reconnect, so only start the scheduler once
+        if not self.scheduler.running:
+            self.scheduler.start()